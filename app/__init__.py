@@ -23,11 +23,38 @@ def create_app() -> Flask:
         SECRET_KEY=os.getenv("SECRET_KEY", "dev-secret-key"),
         SQLALCHEMY_DATABASE_URI=database_url,
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        # dashboard cache: memory (ต่อ process) / redis (ใช้ร่วมกันหลาย worker)
+        # TTL ใช้กับทั้ง 2 backend: memory หลาย worker = ข้อมูลค้างได้นานสุดเท่านี้ (วินาที)
+        DASHBOARD_CACHE_BACKEND=os.getenv("DASHBOARD_CACHE_BACKEND", "memory"),
+        DASHBOARD_CACHE_URL=os.getenv("DASHBOARD_CACHE_URL"),
+        DASHBOARD_CACHE_MAX_ENTRIES=int(os.getenv("DASHBOARD_CACHE_MAX_ENTRIES", "128")),
+        DASHBOARD_CACHE_TTL=int(os.getenv("DASHBOARD_CACHE_TTL", "3600")),
+        # background jobs: thread (ใน web process) / worker (รัน `flask jobs worker` แยก)
+        JOBS_EXECUTOR=os.getenv("JOBS_EXECUTOR", "thread"),
+        JOBS_THREADS=int(os.getenv("JOBS_THREADS", "2")),
+        JOBS_RESULT_DIR=os.getenv("JOBS_RESULT_DIR"),
+        JOBS_RESULT_TTL=int(os.getenv("JOBS_RESULT_TTL", "86400")),
+        # job ที่ RUNNING นานเกินนี้ (วินาที) ถือว่า process ตายไปแล้ว -> FAILED
+        JOBS_RUNNING_TIMEOUT=int(os.getenv("JOBS_RUNNING_TIMEOUT", "3600")),
+        # จำนวน process ที่ใช้ render PDF หัก ณ ที่จ่ายแบบหลายใบ (ไม่ใส่ = จำนวน CPU)
+        WITHHOLDING_PDF_WORKERS=int(os.getenv("WITHHOLDING_PDF_WORKERS") or 0) or None,
+        # เช่นเดียวกัน สำหรับ PDF ใบสำคัญจ่ายแบบหลายโครงการ
+        VOUCHER_PDF_WORKERS=int(os.getenv("VOUCHER_PDF_WORKERS") or 0) or None,
+        # cache PDF ที่ render แล้ว (LRU ตามขนาดรวม)
+        PDF_CACHE_DIR=os.getenv("PDF_CACHE_DIR"),
+        PDF_CACHE_MAX_MB=int(os.getenv("PDF_CACHE_MAX_MB", "256")),
+        # /api/sync: เก็บ change_log กี่วัน (token เก่ากว่านี้ = client ต้องโหลดใหม่ทั้งหมด)
+        SYNC_LOG_RETENTION_DAYS=int(os.getenv("SYNC_LOG_RETENTION_DAYS", "30")),
     )
 
     db.init_app(app)
     migrate.init_app(app, db)
 
+    from .utils import dashboard_cache, jobs, pdf_cache
+    dashboard_cache.init_app(app)
+    jobs.init_app(app)
+    pdf_cache.init_app(app)
+
     # -------------------------------------------------
     # Register blueprints
     # -------------------------------------------------
@@ -38,6 +65,7 @@ def create_app() -> Flask:
     from .blueprints.customers import bp_customers
     from .blueprints.withholding import bp_withholding
     from .blueprints.withholding_docs import bp_withholding_docs
+    from .blueprints.jobs import bp_jobs
 
     app.register_blueprint(bp_docs)
     app.register_blueprint(bp_customers)
@@ -48,6 +76,7 @@ def create_app() -> Flask:
     # ✅ ห้ามซ้ำ
     app.register_blueprint(bp_withholding)
     app.register_blueprint(bp_withholding_docs)
+    app.register_blueprint(bp_jobs)
 
     # -------------------------------------------------
     # Jinja helpers
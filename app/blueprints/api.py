@@ -1,18 +1,39 @@
 from __future__ import annotations
 
-from datetime import datetime
-
-from flask import Blueprint, jsonify, request
+import base64
+import hashlib
+import threading
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from flask import Blueprint, Response, abort, current_app, jsonify, request
+from sqlalchemy import and_, func, or_, select
 from sqlalchemy.exc import IntegrityError
+from werkzeug.http import is_resource_modified
 
 from .. import db
+from ..utils import dashboard_cache, jobs
 from ..models import (
     AdvanceExpense,
     Customer,
+    MONTHLY_ROLLUP_METRICS,
     MaterialItem,
     OtherExpense,
     Project,
+    ProjectCostRollup,
+    RANKED_PROJECT_ORDERS,
     SubcontractorPayment,
+    TIMESERIES_METRICS,
+    bulk_insert_project_children,
+    current_change_token,
+    monthly_timeseries,
+    project_version,
+    prune_change_log,
+    ranked_projects,
+    refresh_monthly_rollups,
+    refresh_project_cost_rollups,
+    sync_changes,
 )
 
 bp_api = Blueprint("api", __name__)
@@ -27,6 +48,15 @@ def _parse_date(value: str | None):
         return None
 
 
+def _parse_month(value: str | None):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m").date()
+    except ValueError:
+        return None
+
+
 def _to_float(x):
     if x is None:
         return 0.0
@@ -42,50 +72,235 @@ def _to_float(x):
         return 0.0
 
 
+def _etag(*parts) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(str(part).encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()[:32]
+
+
+def _conditional_json(etag: str, last_modified, build):
+    """
+    JSON พร้อม ETag (strong) / Last-Modified
+    - If-None-Match / If-Modified-Since ยังตรง -> 304 ทันที (ไม่โหลด/serialize ข้อมูล)
+    - ไม่งั้น build(): () -> dict
+    """
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        resp = jsonify(build())
+    else:
+        resp = Response(status=304)
+    resp.set_etag(etag)
+    if last_modified:
+        resp.last_modified = last_modified
+
+    # ให้ PWA / browser ถามใหม่ทุกครั้ง (ได้ 304 ถ้าไม่เปลี่ยน)
+    resp.cache_control.private = True
+    resp.cache_control.no_cache = True
+    return resp
+
+
+# -------------------------
+# Projects list (keyset pagination)
+# -------------------------
+PROJECT_LIST_DEFAULT_LIMIT = 50
+PROJECT_LIST_MAX_LIMIT = 200
+PROJECT_LIST_DEFAULT_FIELDS = ("code", "name", "status", "totals")
+PROJECT_LIST_FIELDS = (
+    "code",
+    "name",
+    "description",
+    "customer_name",
+    "location",
+    "start_date",
+    "end_date",
+    "work_days",
+    "status",
+    "created_at",
+    "updated_at",
+    "totals",
+)
+
+
+def _project_totals_columns() -> list:
+    # ยอดจาก project_cost_rollups (คำนวณไว้แล้ว) -> ไม่โหลดรายการย่อย
+    r = ProjectCostRollup
+    return [
+        func.coalesce(r.materials_total, 0).label("t_materials"),
+        func.coalesce(r.subs_payable_total, 0).label("t_subcontractors"),
+        func.coalesce(r.other_total, 0).label("t_other"),
+        func.coalesce(r.advances_total, 0).label("t_advances"),
+        func.coalesce(r.grand_total, 0).label("t_grand"),
+    ]
+
+
+def _json_value(v):
+    if isinstance(v, (date, datetime)):
+        return v.isoformat()
+    if isinstance(v, Decimal):
+        return float(v)
+    return v
+
+
+def _encode_cursor(updated_at: datetime, pid: int) -> str:
+    raw = f"{updated_at.isoformat()}|{pid}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        ts, pid = raw.rsplit("|", 1)
+        return datetime.fromisoformat(ts), int(pid)
+    except Exception:
+        raise ValueError("cursor ไม่ถูกต้อง")
+
+
+@bp_api.get("/projects")
+def list_projects():
+    """
+    รายการโครงการแบบ keyset pagination (ใหม่ -> เก่า ตาม updated_at, id)
+    ?limit=50&cursor=<next_cursor>&fields=code,name,status,totals&status=DONE,DEFECT&q=
+    - fields: เลือก column ที่ต้องการ (id มาเสมอ), totals = ยอดต้นทุนจาก rollups
+    - next_cursor = null -> หน้าสุดท้าย
+    """
+    raw_fields = (request.args.get("fields") or "").strip()
+    fields = [f.strip() for f in raw_fields.split(",") if f.strip()] if raw_fields else list(PROJECT_LIST_DEFAULT_FIELDS)
+    unknown = [f for f in fields if f not in PROJECT_LIST_FIELDS]
+    if unknown:
+        return jsonify({"ok": False, "error": f"fields ไม่รู้จัก: {', '.join(unknown)}"}), 400
+
+    limit = min(max(request.args.get("limit", type=int) or PROJECT_LIST_DEFAULT_LIMIT, 1), PROJECT_LIST_MAX_LIMIT)
+
+    after = None
+    cursor = (request.args.get("cursor") or "").strip()
+    if cursor:
+        try:
+            after = _decode_cursor(cursor)
+        except ValueError as e:
+            return jsonify({"ok": False, "error": str(e)}), 400
+
+    scalar_fields = [f for f in fields if f != "totals"]
+    cols = [Project.id, Project.updated_at.label("_updated_at")]
+    cols += [getattr(Project, f) for f in scalar_fields]
+
+    stmt = select(*cols).select_from(Project)
+    if "totals" in fields:
+        stmt = stmt.add_columns(*_project_totals_columns()).outerjoin(
+            ProjectCostRollup, ProjectCostRollup.project_id == Project.id
+        )
+
+    statuses = [s.strip().upper() for s in (request.args.get("status") or "").split(",") if s.strip()]
+    if statuses:
+        stmt = stmt.where(Project.status.in_(statuses))
+
+    q = (request.args.get("q") or "").strip()
+    if q:
+        like = f"%{q}%"
+        stmt = stmt.where(or_(Project.code.ilike(like), Project.name.ilike(like)))
+
+    if after is not None:
+        ts, pid = after
+        stmt = stmt.where(
+            or_(Project.updated_at < ts, and_(Project.updated_at == ts, Project.id < pid))
+        )
+
+    # ✅ ขอเกิน 1 แถว -> รู้ว่ามีหน้าถัดไปไหม โดยไม่ต้อง COUNT
+    stmt = stmt.order_by(Project.updated_at.desc(), Project.id.desc()).limit(limit + 1)
+    rows = db.session.execute(stmt).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    items = []
+    for row in rows:
+        m = row._mapping
+        item = {"id": row.id}
+        for f in fields:
+            if f == "totals":
+                item["totals"] = {
+                    key: float(m[f"t_{key}"] or 0)
+                    for key in ("materials", "subcontractors", "other", "advances", "grand")
+                }
+            else:
+                item[f] = _json_value(m[f])
+        items.append(item)
+
+    last = rows[-1] if rows else None
+    return jsonify(
+        {
+            "items": items,
+            "fields": fields,
+            "limit": limit,
+            "next_cursor": _encode_cursor(last._updated_at, last.id) if has_more else None,
+        }
+    )
+
+
 @bp_api.get("/projects/<int:pid>")
 def get_project(pid: int):
-    p = Project.query.get_or_404(pid)
-    return jsonify(_serialize_project(p))
+    # ✅ เช็ค version จาก SQL ก่อน (โครงการ + รายการย่อย) -> ไม่เปลี่ยน = 304 ไม่ต้องโหลดรายการย่อย
+    version = project_version(pid)
+    if version is None:
+        abort(404)
+    last_modified, stamp = version
+    return _conditional_json(
+        _etag("project", pid, stamp),
+        last_modified,
+        lambda: _serialize_project(Project.query.get_or_404(pid)),
+    )
 
 
 @bp_api.post("/projects")
 def create_project():
     payload = request.get_json(silent=True) or {}
-    p = Project()
-    try:
-        _apply_project_payload(p, payload)
-    except ValueError as e:
-        return jsonify({"ok": False, "error": str(e)}), 400
-
-    db.session.add(p)
-    try:
-        db.session.commit()
-    except IntegrityError:
-        db.session.rollback()
-        return jsonify({"ok": False, "error": "รหัสโครงการซ้ำ (code ต้องไม่ซ้ำ)"}), 400
-
-    return jsonify({"ok": True, "id": p.id})
+    return _save_project(Project(), payload)
 
 
 @bp_api.put("/projects/<int:pid>")
 def update_project(pid: int):
     p = Project.query.get_or_404(pid)
     payload = request.get_json(silent=True) or {}
+    return _save_project(p, payload)
 
+
+def _save_project(p: Project, payload: dict):
     try:
-        _apply_project_payload(p, payload)
+        bulk = _apply_project_payload(p, payload)
     except ValueError as e:
         return jsonify({"ok": False, "error": str(e)}), 400
 
+    if p.id is None:
+        db.session.add(p)
     try:
+        # flush ก่อน: ได้ project id + ลบ/แก้แถวเดิม แล้วค่อย bulk insert แถวใหม่ (transaction เดียวกัน)
+        db.session.flush()
+        if bulk:
+            bulk_insert_project_children(db.session.connection(), p.id, bulk)
+            # Core insert ไม่ผ่าน flush -> บอก dashboard cache เอง
+            dashboard_cache.mark_dirty(db.session, [model.__name__ for model in bulk])
         db.session.commit()
-    except IntegrityError:
+    except IntegrityError as e:
         db.session.rollback()
-        return jsonify({"ok": False, "error": "รหัสโครงการซ้ำ (code ต้องไม่ซ้ำ)"}), 400
+        if _is_duplicate_project_code(e):
+            return jsonify({"ok": False, "error": "รหัสโครงการซ้ำ (code ต้องไม่ซ้ำ)"}), 400
+        current_app.logger.warning("project save conflict: %s", e.orig)
+        return jsonify({"ok": False, "error": "บันทึกไม่สำเร็จ (ข้อมูลถูกแก้ไขพร้อมกัน) กรุณาลองใหม่"}), 409
 
     return jsonify({"ok": True, "id": p.id})
 
 
+# unique constraint ของ projects.code (ชื่อ default ของ Postgres สำหรับ unique=True)
+PROJECT_CODE_CONSTRAINTS = ("projects_code_key",)
+
+
+def _is_duplicate_project_code(e: IntegrityError) -> bool:
+    # psycopg บอกชื่อ constraint ตรง ๆ / SQLite มีแค่ข้อความ "UNIQUE constraint failed: projects.code"
+    name = getattr(getattr(e.orig, "diag", None), "constraint_name", None)
+    if name:
+        return name in PROJECT_CODE_CONSTRAINTS
+    return "projects.code" in str(e.orig)
+
+
 @bp_api.delete("/projects/<int:pid>")
 def delete_project(pid: int):
     p = Project.query.get_or_404(pid)
@@ -169,7 +384,8 @@ def _serialize_project(p: Project) -> dict:
     }
 
 
-def _apply_project_payload(p: Project, payload: dict) -> None:
+def _apply_project_payload(p: Project, payload: dict) -> dict:
+    """set ค่าจาก payload ลง p -> แถวใหม่ที่ต้อง bulk insert หลัง flush ({model: [values]})"""
     p.code = (payload.get("code") or "").strip()
     p.name = (payload.get("name") or "").strip()
     p.description = (payload.get("description") or "").strip() or None
@@ -183,92 +399,204 @@ def _apply_project_payload(p: Project, payload: dict) -> None:
     # ✅ NOTE: ย้ายใบกำกับภาษีวัสดุไปอยู่ใน MaterialItem แล้ว
     # (ไม่ใช้ p.materials_tax_invoice_no/date ใน Project)
 
-    # clear and recreate children (ง่ายต่อ UI หน้าเดียว)
-    p.materials.clear()
-    p.subcontractors.clear()
-    p.expenses.clear()
-    p.advances.clear()
-
-    for row in payload.get("materials") or []:
-        m = MaterialItem(
-            brand=(row.get("brand") or "").strip() or None,
-            item_code=(row.get("item_code") or "").strip() or None,
-            item_name=(row.get("item_name") or "").strip() or None,
-            unit=(row.get("unit") or "").strip() or None,
-
-            # ✅ NEW: ใบกำกับภาษี “ต่อแถว”
-            tax_invoice_no=(row.get("tax_invoice_no") or "").strip() or None,
-            tax_invoice_date=_parse_date(row.get("tax_invoice_date")),
-
-            unit_price=_to_float(row.get("unit_price")),
-            qty=_to_float(row.get("qty")),
-            note=(row.get("note") or "").strip() or None,
-        )
+    bulk = {}
+    for attr, model, to_values, nonneg, derived in CHILD_COLLECTIONS:
+        rows = _sync_children(p, attr, model, to_values, nonneg, derived, payload.get(attr) or [])
+        if rows:
+            bulk[model] = rows
 
-        # ✅ ข้ามแถวว่าง: ถ้าไม่มีข้อมูลสำคัญเลย และยอดเป็น 0
-        has_any_text = bool(m.brand or m.item_code or m.item_name or m.tax_invoice_no)
-        has_any_amount = (float(m.unit_price or 0) != 0) or (float(m.qty or 0) != 0)
-        if (not has_any_text) and (not has_any_amount) and (not m.tax_invoice_date):
-            continue
+    if not p.code:
+        raise ValueError("code is required")
+    if not p.name:
+        raise ValueError("name is required")
+    return bulk
 
-        p.materials.append(m)
 
-    for row in payload.get("subcontractors") or []:
-        vendor_name = (row.get("vendor_name") or "").strip()
-        if not vendor_name and _to_float(row.get("contract_amount")) == 0:
-            continue
+# -------------------------
+# Child rows (วัสดุ / ผู้รับเหมาช่วง / ค่าใช้จ่าย / เบิกล่วงหน้า)
+# - แต่ละฟังก์ชันแปลง 1 แถวจาก payload -> dict ค่าของ column (None = แถวว่าง ข้าม)
+# - key ใน dict = ชื่อ field ใน payload
+# -------------------------
+def _material_values(row: dict) -> dict | None:
+    values = {
+        "brand": (row.get("brand") or "").strip() or None,
+        "item_code": (row.get("item_code") or "").strip() or None,
+        "item_name": (row.get("item_name") or "").strip() or None,
+        "unit": (row.get("unit") or "").strip() or None,
+
+        # ✅ NEW: ใบกำกับภาษี “ต่อแถว”
+        "tax_invoice_no": (row.get("tax_invoice_no") or "").strip() or None,
+        "tax_invoice_date": _parse_date(row.get("tax_invoice_date")),
+
+        "unit_price": _to_float(row.get("unit_price")),
+        "qty": _to_float(row.get("qty")),
+        "note": (row.get("note") or "").strip() or None,
+    }
 
-        contract_amount = _to_float(row.get("contract_amount"))
-        wht_rate = _to_float(row.get("withholding_rate"))
-        wht_amount = _to_float(row.get("withholding_amount"))
-
-        # ถ้าไม่กรอก withholding_amount แต่กรอก rate ให้คำนวณอัตโนมัติ
-        if wht_amount == 0 and wht_rate > 0:
-            wht_amount = round(contract_amount * wht_rate / 100.0, 2)
-
-        s = SubcontractorPayment(
-            vendor_name=vendor_name or "(ไม่ระบุชื่อ)",
-            pay_date=_parse_date(row.get("pay_date")),
-            contract_amount=contract_amount,
-            withholding_rate=wht_rate,
-            withholding_amount=wht_amount,
-            note=(row.get("note") or "").strip() or None,
-        )
-        p.subcontractors.append(s)
+    # ✅ ข้ามแถวว่าง: ถ้าไม่มีข้อมูลสำคัญเลย และยอดเป็น 0
+    has_any_text = bool(values["brand"] or values["item_code"] or values["item_name"] or values["tax_invoice_no"])
+    has_any_amount = values["unit_price"] != 0 or values["qty"] != 0
+    if (not has_any_text) and (not has_any_amount) and (not values["tax_invoice_date"]):
+        return None
+    return values
 
-    for row in payload.get("expenses") or []:
-        title = (row.get("title") or "").strip()
-        amount = _to_float(row.get("amount"))
-        if not title and amount == 0:
-            continue
 
-        e = OtherExpense(
-            category=(row.get("category") or "อื่นๆ").strip() or "อื่นๆ",
-            title=title or "(ไม่ระบุ)",
-            expense_date=_parse_date(row.get("expense_date")),
-            amount=amount,
-            note=(row.get("note") or "").strip() or None,
-        )
-        p.expenses.append(e)
+def _subcontractor_values(row: dict) -> dict | None:
+    vendor_name = (row.get("vendor_name") or "").strip()
+    if not vendor_name and _to_float(row.get("contract_amount")) == 0:
+        return None
 
-    for row in payload.get("advances") or []:
-        title = (row.get("title") or "").strip()
-        amount = _to_float(row.get("amount"))
-        if not title and amount == 0:
+    contract_amount = _to_float(row.get("contract_amount"))
+    wht_rate = _to_float(row.get("withholding_rate"))
+    wht_amount = _to_float(row.get("withholding_amount"))
+
+    # ถ้าไม่กรอก withholding_amount แต่กรอก rate ให้คำนวณอัตโนมัติ
+    if wht_amount == 0 and wht_rate > 0:
+        wht_amount = round(contract_amount * wht_rate / 100.0, 2)
+
+    return {
+        "vendor_name": vendor_name or "(ไม่ระบุชื่อ)",
+        "pay_date": _parse_date(row.get("pay_date")),
+        "contract_amount": contract_amount,
+        "withholding_rate": wht_rate,
+        "withholding_amount": wht_amount,
+        "note": (row.get("note") or "").strip() or None,
+    }
+
+
+def _expense_values(row: dict) -> dict | None:
+    title = (row.get("title") or "").strip()
+    amount = _to_float(row.get("amount"))
+    if not title and amount == 0:
+        return None
+
+    return {
+        "category": (row.get("category") or "อื่นๆ").strip() or "อื่นๆ",
+        "title": title or "(ไม่ระบุ)",
+        "expense_date": _parse_date(row.get("expense_date")),
+        "amount": amount,
+        "note": (row.get("note") or "").strip() or None,
+    }
+
+
+def _advance_values(row: dict) -> dict | None:
+    title = (row.get("title") or "").strip()
+    amount = _to_float(row.get("amount"))
+    if not title and amount == 0:
+        return None
+
+    return {
+        "title": title or "(ไม่ระบุ)",
+        "advance_date": _parse_date(row.get("advance_date")),
+        "amount": amount,
+        "note": (row.get("note") or "").strip() or None,
+    }
+
+
+# (ชื่อ collection = key ใน payload, model, ตัวแปลงแถว, field ที่ห้ามติดลบ ตาม CHECK ใน DB,
+#  field ที่คำนวณจาก field อื่น {field: (field ต้นทาง, ...)})
+CHILD_COLLECTIONS = (
+    ("materials", MaterialItem, _material_values, ("unit_price", "qty"), {}),
+    (
+        "subcontractors",
+        SubcontractorPayment,
+        _subcontractor_values,
+        ("contract_amount", "withholding_rate", "withholding_amount"),
+        {"withholding_amount": ("contract_amount", "withholding_rate")},
+    ),
+    ("expenses", OtherExpense, _expense_values, ("amount",), {}),
+    ("advances", AdvanceExpense, _advance_values, ("amount",), {}),
+)
+
+# แถวใหม่ตั้งแต่จำนวนนี้ (ต่อ collection) -> INSERT ด้วย Core ทีเดียว แทนสร้าง ORM object ทีละแถว
+BULK_INSERT_MIN_ROWS = 200
+
+
+def _row_id(row: dict) -> int | None:
+    try:
+        return int(row.get("id") or 0) or None
+    except (TypeError, ValueError):
+        return None
+
+
+def _same_value(old, new) -> bool:
+    # Numeric(12, 2) อ่านกลับมาเป็น Decimal แต่ payload เป็น float -> เทียบที่ 2 ตำแหน่ง
+    if isinstance(new, float) and old is not None and not isinstance(old, (str, date)):
+        return round(float(old), 2) == round(new, 2)
+    return old == new
+
+
+def _merged_row(obj, row: dict, derived: dict) -> dict:
+    """
+    ค่าเดิมของ obj (ในรูปแบบ payload) ทับด้วย field ที่ส่งมา -> แปลง/ตรวจแถวว่างจากค่าครบทั้งแถว
+    - field คำนวณ (derived) ที่ไม่ได้ส่งมา แต่ field ต้นทางถูกส่งมา -> ไม่ใช้ค่าเดิม (ให้คำนวณใหม่)
+    """
+    merged = {}
+    for col in obj.__table__.columns:
+        value = getattr(obj, col.key)
+        if isinstance(value, date):
+            value = value.isoformat()
+        merged[col.key] = value
+    for field, sources in derived.items():
+        if field not in row and any(src in row for src in sources):
+            merged.pop(field, None)
+    merged.update(row)
+    return merged
+
+
+def _check_rows(attr: str, numbered: list, nonneg: tuple) -> None:
+    """ตรวจทั้ง batch ทีเดียวก่อนเขียน DB -> บอกเลขแถวที่ผิดทั้งหมด (ไม่ใช่ IntegrityError กลางทาง)"""
+    bad = [n for n, values in numbered if any(values[f] < 0 for f in nonneg)]
+    if bad:
+        shown = ", ".join(str(n) for n in bad[:10]) + (" ..." if len(bad) > 10 else "")
+        raise ValueError(f"{attr}: {', '.join(nonneg)} ต้องไม่ติดลบ (แถว {shown})")
+
+
+def _sync_children(p: Project, attr: str, model, to_values, nonneg: tuple, derived: dict, rows: list) -> list:
+    """
+    ✅ จับคู่แถวใน payload กับแถวเดิมตาม id (แทน clear + สร้างใหม่ทั้งหมด)
+    - id ตรงกับแถวเดิมของโครงการนี้ -> set เฉพาะ field ที่ค่าเปลี่ยน (ไม่เปลี่ยน = ไม่มี UPDATE)
+      field ที่ไม่ได้ส่งมา (เช่น note / unit ที่ฟอร์มไม่มีช่อง) = คงค่าเดิม
+      (แปลงจากค่าเดิมทับด้วยค่าที่ส่งมา -> แถวว่าง / ค่าคำนวณ ดูจากทั้งแถว ไม่ใช่จาก default)
+    - ไม่มี id / id ไม่รู้จัก / id ซ้ำ -> แถวใหม่
+      (ถึง BULK_INSERT_MIN_ROWS = คืนเป็น list ค่า ให้ bulk insert, น้อยกว่านั้น = ORM ตอน flush)
+    - แถวเดิมที่ไม่อยู่ใน payload หรือกลายเป็นแถวว่าง -> ลบ (delete-orphan)
+    => id เดิมคงอยู่ (token แบบ M:12 ในหน้า view ยังใช้ได้) และจำนวน write = เท่าที่เปลี่ยนจริง
+    """
+    current = getattr(p, attr)
+    existing = {obj.id: obj for obj in current if obj.id is not None}
+    kept = set()
+    numbered = []
+    new_values = []
+
+    for n, row in enumerate(rows, start=1):
+        obj = existing.get(_row_id(row))
+        if obj is not None and obj.id in kept:
+            obj = None
+        values = to_values(row if obj is None else _merged_row(obj, row, derived))
+        if values is None:
             continue
+        numbered.append((n, values))
 
-        a = AdvanceExpense(
-            title=title or "(ไม่ระบุ)",
-            advance_date=_parse_date(row.get("advance_date")),
-            amount=amount,
-            note=(row.get("note") or "").strip() or None,
-        )
-        p.advances.append(a)
+        if obj is None:
+            new_values.append(values)
+            continue
 
-    if not p.code:
-        raise ValueError("code is required")
-    if not p.name:
-        raise ValueError("name is required")
+        kept.add(obj.id)
+        for key, value in values.items():
+            if not _same_value(getattr(obj, key), value):
+                setattr(obj, key, value)
+
+    _check_rows(attr, numbered, nonneg)
+
+    # แถวใหม่เยอะ -> คืนให้ caller bulk insert หลัง flush (ไม่สร้าง ORM object)
+    bulk = len(new_values) >= BULK_INSERT_MIN_ROWS
+    added = [] if bulk else [model(**values) for values in new_values]
+
+    if added or len(kept) != len(current):
+        # แทนทั้ง list ครั้งเดียว: SQLAlchemy diff เป็น set (ไม่ remove ทีละตัว)
+        setattr(p, attr, [obj for obj in current if obj.id in kept] + added)
+    return new_values if bulk else []
 
 
 # -------------------------
@@ -305,8 +633,10 @@ def customers_search():
 @bp_api.get("/customers/<int:customer_id>")
 def customer_get(customer_id: int):
     c = Customer.query.get_or_404(customer_id)
-    return jsonify(
-        {
+    return _conditional_json(
+        _etag("customer", c.id, c.updated_at.isoformat() if c.updated_at else ""),
+        c.updated_at,
+        lambda: {
             "id": c.id,
             "name": c.name,
             "tax_id": c.tax_id,
@@ -316,5 +646,164 @@ def customer_get(customer_id: int):
             "contact_name": c.contact_name,
             "note": c.note,
             "is_active": c.is_active,
+        },
+    )
+
+
+# -------------------------
+# Sync API (PWA offline replica)
+# -------------------------
+SYNC_DEFAULT_LIMIT = 1000
+SYNC_MAX_LIMIT = 5000
+SYNC_PRUNE_INTERVAL = 3600  # วินาที
+
+_prune_lock = threading.Lock()
+_last_prune = 0.0
+
+
+def _maybe_prune_change_log() -> None:
+    """ลบ change_log ที่เกิน SYNC_LOG_RETENTION_DAYS ไม่เกิน 1 ครั้ง / SYNC_PRUNE_INTERVAL ต่อ process"""
+    global _last_prune
+    if time.monotonic() - _last_prune < SYNC_PRUNE_INTERVAL:
+        return
+    if not _prune_lock.acquire(blocking=False):
+        return
+    try:
+        _last_prune = time.monotonic()
+        days = int(current_app.config.get("SYNC_LOG_RETENTION_DAYS") or 30)
+        prune_change_log(db.session.connection(), datetime.utcnow() - timedelta(days=days))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception("change_log prune failed")
+    finally:
+        _prune_lock.release()
+
+
+@bp_api.get("/sync")
+def sync():
+    """
+    การเปลี่ยนแปลงตั้งแต่ token ก่อนหน้า (โครงการ / รายการย่อย / ลูกค้า / เอกสารขาย)
+    ?since=<token>&limit=1000
+    - ไม่ส่ง since -> ได้ token ปัจจุบันอย่างเดียว (โหลดข้อมูลเต็มก่อน แล้ว sync ต่อจาก token นี้)
+    - changes: {entity: {"upserted": [แถวปัจจุบัน], "deleted": [id]}}
+    - has_more = true -> เรียกต่อด้วย token ที่ได้ทันที
+    - 410 -> token เก่าเกินกว่า log ที่เก็บไว้ ต้องโหลดใหม่ทั้งหมด
+    """
+    _maybe_prune_change_log()
+
+    raw = (request.args.get("since") or "").strip()
+    if not raw:
+        return jsonify({"token": current_change_token(), "has_more": False, "changes": {}})
+    try:
+        since = int(raw)
+        if since < 0:
+            raise ValueError
+    except ValueError:
+        return jsonify({"ok": False, "error": "since ต้องเป็น token (ตัวเลข) ที่ได้จาก /api/sync"}), 400
+
+    limit = min(max(request.args.get("limit", type=int) or SYNC_DEFAULT_LIMIT, 1), SYNC_MAX_LIMIT)
+    data = sync_changes(since, limit)
+    if data is None:
+        return jsonify({"ok": False, "error": "token หมดอายุ กรุณาโหลดข้อมูลใหม่ทั้งหมด"}), 410
+
+    resp = jsonify(data)
+    resp.cache_control.no_store = True
+    return resp
+
+
+# -------------------------
+# Reports API
+# -------------------------
+TIMESERIES_MAX_MONTHS = 240
+
+
+@bp_api.get("/reports/timeseries")
+def reports_timeseries():
+    """
+    ยอดรายเดือนหลายปี จาก monthly_rollups
+    ?from=YYYY-MM&to=YYYY-MM&metric=income|expense|materials|subs|other|advances
+    - ไม่ระบุ to = เดือนปัจจุบัน, ไม่ระบุ from = 11 เดือนก่อน to
+    """
+    metric = (request.args.get("metric") or "income").strip().lower()
+    if metric not in TIMESERIES_METRICS:
+        return jsonify({"ok": False, "error": f"metric ต้องเป็น {'|'.join(TIMESERIES_METRICS)}"}), 400
+
+    raw_from = request.args.get("from")
+    raw_to = request.args.get("to")
+    end = _parse_month(raw_to) if raw_to else date.today().replace(day=1)
+    if end is None:
+        return jsonify({"ok": False, "error": "to ต้องเป็นรูปแบบ YYYY-MM"}), 400
+    if raw_from:
+        start = _parse_month(raw_from)
+        if start is None:
+            return jsonify({"ok": False, "error": "from ต้องเป็นรูปแบบ YYYY-MM"}), 400
+    else:
+        idx = end.year * 12 + end.month - 1 - 11
+        start = date(idx // 12, idx % 12 + 1, 1)
+
+    months = (end.year - start.year) * 12 + (end.month - start.month) + 1
+    if months < 1:
+        return jsonify({"ok": False, "error": "from ต้องไม่เกิน to"}), 400
+    if months > TIMESERIES_MAX_MONTHS:
+        return jsonify({"ok": False, "error": f"ช่วงเวลาต้องไม่เกิน {TIMESERIES_MAX_MONTHS} เดือน"}), 400
+
+    points = monthly_timeseries(metric, start, end)
+    return jsonify(
+        {
+            "metric": metric,
+            "from": start.strftime("%Y-%m"),
+            "to": end.strftime("%Y-%m"),
+            "points": points,
+            "total": round(sum(pt["total"] for pt in points), 2),
         }
     )
+
+
+TOP_PROJECTS_MAX_LIMIT = 100
+
+
+@bp_api.get("/reports/top-projects")
+def reports_top_projects():
+    """
+    โครงการ top-N (ORDER BY + LIMIT ใน SQL)
+    ?by=total|materials|subs|margin&year=&month=&limit=5&order=desc|asc
+    """
+    by = (request.args.get("by") or "total").strip().lower()
+    if by not in RANKED_PROJECT_ORDERS:
+        return jsonify({"ok": False, "error": f"by ต้องเป็น {'|'.join(RANKED_PROJECT_ORDERS)}"}), 400
+
+    order = (request.args.get("order") or "desc").strip().lower()
+    if order not in ("asc", "desc"):
+        return jsonify({"ok": False, "error": "order ต้องเป็น asc|desc"}), 400
+
+    year = request.args.get("year", type=int)
+    month = request.args.get("month", type=int)
+    if month is not None and not 1 <= month <= 12:
+        return jsonify({"ok": False, "error": "month ต้องอยู่ระหว่าง 1-12"}), 400
+    limit = min(max(request.args.get("limit", type=int) or 5, 1), TOP_PROJECTS_MAX_LIMIT)
+
+    rows = ranked_projects(by, year, month, limit=limit, ascending=(order == "asc"))
+    return jsonify({"by": by, "order": order, "year": year, "month": month, "items": rows})
+
+
+@bp_api.post("/reports/rollups/rebuild")
+def reports_rebuild_rollups():
+    """คำนวณ project_cost_rollups + monthly_rollups ใหม่ทั้งหมด (background job)"""
+    return jobs.accepted_response(jobs.enqueue("rebuild_rollups"))
+
+
+@jobs.job_handler("rebuild_rollups")
+def _job_rebuild_rollups(params: dict, ctx) -> None:
+    steps = 1 + len(MONTHLY_ROLLUP_METRICS)
+
+    refresh_project_cost_rollups(db.session.connection())
+    db.session.commit()
+    ctx.progress(1, steps, "project_cost_rollups")
+
+    for i, metric in enumerate(MONTHLY_ROLLUP_METRICS, start=2):
+        refresh_monthly_rollups(db.session.connection(), metric)
+        db.session.commit()
+        ctx.progress(i, steps, f"monthly_rollups:{metric}")
+
+    dashboard_cache.invalidate()
@@ -3,18 +3,22 @@ from __future__ import annotations
 import os
 from datetime import date, datetime
 from decimal import Decimal
+from io import BytesIO
 from uuid import uuid4
 
-from sqlalchemy.orm import joinedload
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload, selectinload
 
 from flask import (
     Blueprint,
     abort,
     current_app,
     flash,
+    jsonify,
     redirect,
     render_template,
     request,
+    send_file,
     send_from_directory,
     url_for,
 )
@@ -22,6 +26,7 @@ from werkzeug.utils import secure_filename
 
 from .. import db
 from ..models import CompanyProfile, Customer, Project, SalesDoc, SalesItem
+from ..utils import jobs, pdf_cache
 
 bp_docs = Blueprint("docs", __name__)
 
@@ -437,6 +442,142 @@ def doc_print(doc_id: int):
     )
 
 
+# -------------------------------------------------
+# ✅ PDF (render ฝั่ง server) — เร็ว/เหมือนกันทุกเครื่อง ไม่พึ่ง print engine ของ browser
+# -------------------------------------------------
+BATCH_DOC_TYPES = ("QT", "IV", "RC", "BL")
+PDF_BATCH_YIELD_PER = 200
+
+
+def _pdf_cache_key(doc: SalesDoc, company) -> str:
+    # ✅ lazy import: กัน migrate/upgrade พังถ้า reportlab ยังไม่พร้อม
+    from ..utils.pdf_fonts import font_token
+    from ..utils.sales_doc_pdf import LAYOUT_VERSION, logo_abs_path, logo_stamp
+
+    logo = logo_abs_path(doc.company_logo_path or getattr(company, "logo_path", None))
+    return pdf_cache.make_key(
+        "sales_doc",
+        doc.id,
+        doc.updated_at.isoformat() if doc.updated_at else "",
+        # ค่าที่ว่างในเอกสารดึงจากข้อมูลบริษัท -> แก้ข้อมูลบริษัทก็ต้องได้ key ใหม่
+        company.updated_at.isoformat() if company is not None and company.updated_at else "",
+        logo_stamp(logo),
+        LAYOUT_VERSION,
+        font_token(),
+    )
+
+
+def _render_doc_pdf(doc: SalesDoc, company) -> bytes:
+    from ..utils.sales_doc_pdf import render_sales_doc_pdf, sales_doc_snapshot
+
+    return render_sales_doc_pdf(sales_doc_snapshot(doc, company, DOC_TITLE.get(doc.doc_type)))
+
+
+@bp_docs.get("/docs/<int:doc_id>/pdf")
+def doc_pdf(doc_id: int):
+    """PDF ของเอกสาร: cache ตาม updated_at + ETag (เปิดซ้ำได้ 304)"""
+    doc = SalesDoc.query.get_or_404(doc_id)
+    company = CompanyProfile.query.first()
+    return pdf_cache.pdf_response(
+        _pdf_cache_key(doc, company),
+        lambda: _render_doc_pdf(doc, company),
+        download_name=f"{doc.doc_no}.pdf",
+        last_modified=doc.updated_at,
+        as_attachment=False,
+    )
+
+
+def _batch_params(values) -> dict:
+    """doc_type + month (YYYY-MM ตามวันที่เอกสาร) + status (ไม่ระบุ = ทุกสถานะยกเว้น VOID)"""
+    doc_type = (values.get("doc_type") or "").strip().upper()
+    if doc_type not in BATCH_DOC_TYPES:
+        raise ValueError("doc_type ต้องเป็น " + " / ".join(BATCH_DOC_TYPES))
+
+    month = (values.get("month") or "").strip()
+    try:
+        datetime.strptime(month, "%Y-%m")
+    except ValueError:
+        raise ValueError("month ต้องเป็นรูปแบบ YYYY-MM") from None
+
+    status = (values.get("status") or "").strip().upper() or None
+    if status and status not in ("DRAFT", "APPROVED", "VOID"):
+        raise ValueError("status ต้องเป็น DRAFT / APPROVED / VOID")
+
+    return {"doc_type": doc_type, "month": month, "status": status}
+
+
+def _batch_query(params: dict):
+    start = datetime.strptime(params["month"], "%Y-%m").date()
+    end = date(start.year + 1, 1, 1) if start.month == 12 else date(start.year, start.month + 1, 1)
+
+    stmt = select(SalesDoc).where(
+        SalesDoc.doc_type == params["doc_type"],
+        SalesDoc.issue_date >= start,
+        SalesDoc.issue_date < end,
+    )
+    if params.get("status"):
+        stmt = stmt.where(SalesDoc.status == params["status"])
+    else:
+        stmt = stmt.where(SalesDoc.status != "VOID")
+    return stmt
+
+
+def _batch_name(params: dict) -> str:
+    return f"{params['doc_type']}_{params['month']}.pdf"
+
+
+def _render_batch(params: dict, out, progress=None) -> int:
+    """
+    ✅ ทั้งเดือนเป็นไฟล์เดียว
+    - นับด้วย COUNT ก่อน, อ่านเอกสารแบบ yield_per + selectinload(items) -> ไม่ N+1 และไม่โหลดทั้งเดือนค้างไว้
+    """
+    from ..utils.sales_doc_pdf import render_sales_docs_batch, sales_doc_snapshot
+
+    stmt = _batch_query(params)
+    total = db.session.execute(select(func.count()).select_from(stmt.subquery())).scalar() or 0
+    if not total:
+        raise ValueError("ไม่พบเอกสารตามเงื่อนไข")
+
+    company = CompanyProfile.query.first()
+    title = DOC_TITLE.get(params["doc_type"])
+    docs = db.session.scalars(
+        stmt.options(selectinload(SalesDoc.items))
+        .order_by(SalesDoc.issue_date.asc(), SalesDoc.doc_no.asc())
+        .execution_options(yield_per=PDF_BATCH_YIELD_PER)
+    )
+    snapshots = (sales_doc_snapshot(d, company, title) for d in docs)
+    return render_sales_docs_batch(snapshots, out, progress=progress, total=total)
+
+
+@bp_docs.get("/docs/print.pdf")
+def docs_batch_pdf():
+    """
+    พิมพ์ทั้งเดือนเป็น PDF เดียว: ?doc_type=IV&month=YYYY-MM (&status=APPROVED)
+    - ?async=1 -> background job (202 + /jobs/<id>)
+    """
+    try:
+        params = _batch_params(request.args)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+
+    if request.args.get("async"):
+        return jobs.accepted_response(jobs.enqueue("sales_docs_pdf_batch", params))
+
+    buf = BytesIO()
+    try:
+        _render_batch(params, buf)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 404
+    buf.seek(0)
+    return send_file(buf, mimetype="application/pdf", as_attachment=True, download_name=_batch_name(params))
+
+
+@jobs.job_handler("sales_docs_pdf_batch")
+def _job_sales_docs_pdf_batch(params: dict, ctx) -> dict:
+    _render_batch(params, ctx.out_path, progress=ctx.progress)
+    return {"filename": _batch_name(params), "mimetype": "application/pdf"}
+
+
 # -------------------------------------------------
 # ✅ Download BOQ (Excel / PDF) (ที่หน้าเอกสาร)
 # -------------------------------------------------
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import os
+
+from flask import Blueprint, abort, jsonify, send_file, url_for
+
+from .. import db
+from ..models import Job
+from ..utils.jobs import maybe_cleanup
+
+bp_jobs = Blueprint("jobs", __name__, url_prefix="/jobs")
+
+
+def _serialize_job(job: Job) -> dict:
+    done = job.status == "DONE" and bool(job.result_path)
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "progress": job.progress or 0,
+        "message": job.message or "",
+        "error": job.error or "",
+        "created_at": job.created_at.isoformat() if job.created_at else "",
+        "started_at": job.started_at.isoformat() if job.started_at else "",
+        "finished_at": job.finished_at.isoformat() if job.finished_at else "",
+        "expires_at": job.expires_at.isoformat() if job.expires_at else "",
+        "download_url": url_for("jobs.job_download", job_id=job.id) if done else "",
+    }
+
+
+@bp_jobs.get("/<job_id>")
+def job_status(job_id: str):
+    # ✅ client ที่ poll อยู่หลัง restart -> job ค้างถูกกู้ (FAILED / ส่งเข้าคิวใหม่) ไม่วนรอตลอดไป
+    maybe_cleanup()
+    job = db.get_or_404(Job, job_id)
+    return jsonify(_serialize_job(job))
+
+
+@bp_jobs.get("/<job_id>/download")
+def job_download(job_id: str):
+    job = db.get_or_404(Job, job_id)
+    if job.status != "DONE" or not job.result_path or not os.path.exists(job.result_path):
+        abort(404)
+    return send_file(
+        job.result_path,
+        as_attachment=True,
+        download_name=job.result_name or job.id,
+        mimetype=job.result_mimetype or "application/octet-stream",
+    )
@@ -2,13 +2,14 @@ from __future__ import annotations
 
 import os
 import re
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 from io import BytesIO
 
 from flask import (
     Blueprint,
     abort,
     current_app,
+    jsonify,
     redirect,
     render_template,
     request,
@@ -16,21 +17,29 @@ from flask import (
     send_from_directory,
     url_for,
 )
-from sqlalchemy import func, or_, and_
+from sqlalchemy import and_, func, or_, select, type_coerce
 from sqlalchemy.orm import joinedload
 
 from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 
 from .. import db
+from ..utils import dashboard_cache, jobs, voucher_pdf, xlsx_stream
 from ..models import (
+    RANKED_PROJECT_ORDERS,
+    AdvanceExpense,
+    MaterialItem,
+    OtherExpense,
     Project,
-    SalesDoc,
+    ProjectCostRollup,
     SalesItem,
-    MaterialItem,
     SubcontractorPayment,
-    OtherExpense,
-    AdvanceExpense,  # ✅ NEW
+    dashboard_aggregates,
+    dashboard_project_rows,
+    expense_month_dates,
+    expense_monthly_aggregates,
+    income_monthly_aggregates,
+    ranked_projects,
 )
 
 bp_pages = Blueprint("pages", __name__)
@@ -45,26 +54,18 @@ def _num(x):
         return 0.0
 
 
-def _pick_month_date(obj, *attr_names):
-    """
-    เลือกวันที่ที่ควรใช้นับเดือน/ปีให้ dashboard:
-    - ถ้ามี field วันที่จริง (เช่น pay_date/expense_date/advance_date) ให้ใช้ก่อน
-    - ถ้าไม่มี ให้ fallback created_at (TimestampMixin)
-    """
-    for a in attr_names:
-        try:
-            dt = getattr(obj, a, None)
-            if dt:
-                return dt
-        except Exception:
-            pass
-    try:
-        return getattr(obj, "created_at", None)
-    except Exception:
-        return None
-
-
 def _project_totals(p: Project):
+    # ✅ ใช้ยอดจาก project_cost_rollups ถ้ามี (ไม่ต้องโหลดรายการย่อย)
+    r = getattr(p, "cost_rollup", None)
+    if r is not None:
+        return (
+            _num(r.materials_total),
+            _num(r.subs_payable_total),
+            _num(r.other_total),
+            _num(r.advances_total),
+            _num(r.grand_total),
+        )
+
     materials = sum(_num(m.unit_price) * _num(m.qty) for m in (p.materials or []))
     subs_pay = sum(
         (_num(s.contract_amount) - _num(s.withholding_amount))
@@ -150,7 +151,11 @@ def project_list():
     q = (request.args.get("q") or "").strip()
 
     # ✅ โหลด sales_doc ติดมาด้วย เพื่อใช้เป็น “งบประมาณ”
-    query = Project.query.options(joinedload(Project.sales_doc))
+    # ✅ โหลด cost_rollup ติดมาด้วย เพื่อใช้เป็น “ต้นทุนรวม” (ไม่ต้องโหลดรายการย่อย)
+    query = Project.query.options(
+        joinedload(Project.sales_doc),
+        joinedload(Project.cost_rollup),
+    )
 
     if q:
         like = f"%{q}%"
@@ -404,80 +409,254 @@ def vouchers_print(pid: int):
     )
 
 
-# -------------------------
-# Dashboard (โครงการ)
-# -------------------------
-@bp_pages.route("/dashboard")
-def dashboard():
-    today = date.today()
-    year = request.args.get("year", type=int) or today.year
-    month = request.args.get("month", type=int)
+# ------------------------------------------------------------
+# Vouchers batch PDF (ทุกโครงการ ตามช่วงวันที่)
+# - ดึงรายการด้วย select ต่อประเภท (join โครงการ) ไม่ต้องโหลดทีละโครงการ
+# - 1 ใบ / หน้า, render ใน process pool (ดู utils/voucher_pdf.py)
+# ------------------------------------------------------------
+VOUCHER_KINDS = ("M", "S", "E", "A")
+
+
+def _voucher_batch_params(values) -> dict:
+    """doc_type + from/to (YYYY-MM-DD, บังคับ) + kinds (M,S,E,A ไม่ระบุ = ทั้งหมด; PV_WHT = S เท่านั้น)"""
+    doc_type = (values.get("doc_type") or "PV").strip().upper()
+    if doc_type not in voucher_pdf.DOC_TYPES:
+        raise ValueError("doc_type ต้องเป็น " + " / ".join(voucher_pdf.DOC_TYPES))
+
+    start = _parse_ymd(values.get("from"))
+    end = _parse_ymd(values.get("to"))
+    if not start or not end:
+        raise ValueError("from / to ต้องเป็นรูปแบบ YYYY-MM-DD")
+    if end < start:
+        raise ValueError("to ต้องไม่ก่อน from")
+
+    raw = values.getlist("kinds") if hasattr(values, "getlist") else values.get("kinds")
+    if isinstance(raw, str):
+        raw = [raw]
+    wanted = {k.strip().upper() for part in (raw or []) for k in str(part).split(",")}
+    kinds = [k for k in VOUCHER_KINDS if k in wanted] or list(VOUCHER_KINDS)
+    if doc_type == "PV_WHT":
+        kinds = ["S"]
+
+    return {"doc_type": doc_type, "from": start.isoformat(), "to": end.isoformat(), "kinds": kinds}
 
-    years = list(range(today.year - 5, today.year + 2))
 
-    if month:
-        start_filter = and_(
-            Project.start_date.isnot(None),
-            func.extract("year", Project.start_date) == year,
-            func.extract("month", Project.start_date) == month,
+def _voucher_date(v) -> str:
+    if isinstance(v, datetime):
+        return v.date().isoformat()
+    if isinstance(v, date):
+        return v.isoformat()
+    return str(v)[:10] if v else ""
+
+
+def _voucher_queries(params: dict) -> list:
+    """
+    [(kind, select)] ของประเภทที่เลือก
+    - กรองด้วยวันที่เดียวกับที่พิมพ์บนใบสำคัญ (วันที่จริง -> fallback created_at)
+      ค่าใช้จ่าย / ผู้รับเหมาช่วง / เบิกล่วงหน้า = วันที่เดียวกับ dashboard รายจ่าย / export-all
+      วัสดุ = วันที่ใบกำกับภาษี -> fallback created_at (dashboard นับเดือนด้วย created_at)
+    """
+    month_dates = expense_month_dates()
+    start = _parse_ymd(params["from"])
+    end = _parse_ymd(params["to"])
+    kinds = params["kinds"]
+    out = []
+
+    def as_dt(expr):
+        # coalesce(วันที่จริง, created_at) -> อ่านค่ากลับเป็น datetime เสมอ
+        return type_coerce(expr, db.DateTime).label("d")
+
+    if "M" in kinds:
+        # ✅ กรองและพิมพ์วันที่เดียวกัน: ซื้อเดือน มี.ค. บันทึก เม.ย. -> อยู่ชุด มี.ค.
+        material_date = func.coalesce(MaterialItem.tax_invoice_date, MaterialItem.created_at)
+        out.append((
+            "M",
+            select(
+                MaterialItem.id,
+                Project.code,
+                Project.name,
+                as_dt(material_date),
+                MaterialItem.item_code,
+                MaterialItem.item_name,
+                (MaterialItem.unit_price * MaterialItem.qty).label("amount"),
+            )
+            .join(Project, Project.id == MaterialItem.project_id)
+            .where(_date_range_cond(material_date, start, end)),
+        ))
+
+    if "S" in kinds:
+        stmt = (
+            select(
+                SubcontractorPayment.id,
+                Project.code,
+                Project.name,
+                as_dt(month_dates["subs"]),
+                SubcontractorPayment.vendor_name,
+                SubcontractorPayment.contract_amount,
+                SubcontractorPayment.withholding_rate,
+                SubcontractorPayment.withholding_amount,
+            )
+            .join(Project, Project.id == SubcontractorPayment.project_id)
+            .where(_date_range_cond(month_dates["subs"], start, end))
         )
-        fallback_filter = and_(
-            Project.start_date.is_(None),
-            func.extract("year", Project.created_at) == year,
-            func.extract("month", Project.created_at) == month,
+        if params["doc_type"] == "PV_WHT":
+            stmt = stmt.where(SubcontractorPayment.withholding_amount > 0)
+        out.append(("S", stmt))
+
+    if "E" in kinds:
+        out.append((
+            "E",
+            select(
+                OtherExpense.id,
+                Project.code,
+                Project.name,
+                as_dt(month_dates["other"]),
+                OtherExpense.category,
+                OtherExpense.title,
+                OtherExpense.amount,
+            )
+            .join(Project, Project.id == OtherExpense.project_id)
+            .where(_date_range_cond(month_dates["other"], start, end)),
+        ))
+
+    if "A" in kinds:
+        out.append((
+            "A",
+            select(
+                AdvanceExpense.id,
+                Project.code,
+                Project.name,
+                as_dt(month_dates["advances"]),
+                AdvanceExpense.title,
+                AdvanceExpense.amount,
+            )
+            .join(Project, Project.id == AdvanceExpense.project_id)
+            .where(_date_range_cond(month_dates["advances"], start, end)),
+        ))
+
+    return out
+
+
+def _voucher_snapshot(doc_type: str, kind: str, r) -> dict:
+    """แถวจาก _voucher_queries -> dict ที่ voucher_pdf ใช้ (ค่าเดียวกับ vouchers_print)"""
+    snap = {
+        "doc_type": doc_type,
+        "kind": kind,
+        "id": r.id,
+        "date": _voucher_date(r.d),
+        "project_code": r.code or "",
+        "project_name": r.name or "",
+        "ref_no": "",
+    }
+    if kind == "M":
+        snap.update(
+            title="วัสดุ",
+            particular=f"{r.item_name or ''} ({r.item_code or ''})",
+            ref_no=r.item_code or "",
+            amount=str(r.amount or 0),
         )
-    else:
-        start_filter = and_(
-            Project.start_date.isnot(None),
-            func.extract("year", Project.start_date) == year,
+    elif kind == "S":
+        contract = r.contract_amount or 0
+        wht = r.withholding_amount or 0
+        snap.update(
+            title="ผู้รับเหมาช่วง",
+            particular=r.vendor_name or "ผู้รับเหมา",
+            vendor_name=r.vendor_name or "ผู้รับเหมา",
+            amount=str(contract - wht),
+            contract_amount=str(contract),
+            withholding_rate=str(r.withholding_rate or 0),
+            withholding_amount=str(wht),
         )
-        fallback_filter = and_(
-            Project.start_date.is_(None),
-            func.extract("year", Project.created_at) == year,
+    elif kind == "E":
+        snap.update(
+            title="ค่าใช้จ่ายอื่น",
+            particular=f"{r.category or 'อื่นๆ'} - {r.title or ''}",
+            amount=str(r.amount or 0),
         )
-
-    q = (
-        Project.query.options(joinedload(Project.sales_doc))
-        .filter(or_(start_filter, fallback_filter))
+    else:
+        snap.update(title="เงินเบิกล่วงหน้า", particular=r.title or "", amount=str(r.amount or 0))
+    return snap
+
+
+def _voucher_snapshots(params: dict) -> list:
+    """ทุกประเภทรวมกัน เรียงตาม วันที่ -> รหัสโครงการ -> ประเภท -> id"""
+    snaps = []
+    for kind, stmt in _voucher_queries(params):
+        for r in db.session.execute(stmt):
+            snaps.append(_voucher_snapshot(params["doc_type"], kind, r))
+    order = {k: i for i, k in enumerate(VOUCHER_KINDS)}
+    snaps.sort(key=lambda s: (s["date"], s["project_code"], order[s["kind"]], s["id"]))
+    return snaps
+
+
+def _voucher_batch_name(params: dict) -> str:
+    return f"{params['doc_type']}_{params['from']}_{params['to']}.pdf"
+
+
+def _render_voucher_batch(params: dict, out, progress=None) -> int:
+    snaps = _voucher_snapshots(params)
+    if not snaps:
+        raise ValueError("ไม่พบรายการในช่วงวันที่ที่เลือก")
+    return voucher_pdf.render_vouchers_batch(
+        snaps,
+        out,
+        workers=current_app.config.get("VOUCHER_PDF_WORKERS"),
+        progress=progress,
     )
-    projects = q.all()
 
-    tot_m = tot_s = tot_e = tot_a = tot_g = 0.0
-    tot_income = 0.0
-    rows = []
 
-    for p in projects:
-        m, s, e, a, g = _project_totals(p)
-        tot_m += m
-        tot_s += s
-        tot_e += e
-        tot_a += a
-        tot_g += g
+@bp_pages.route("/vouchers/batch.pdf")
+def vouchers_batch_pdf():
+    """
+    ใบสำคัญจ่ายทุกโครงการเป็น PDF เดียว: ?doc_type=PV|RR|PV_WHT&from=YYYY-MM-DD&to=YYYY-MM-DD (&kinds=M,S,E,A)
+    - ?async=1 -> background job (202 + /jobs/<id>)
+    """
+    try:
+        params = _voucher_batch_params(request.args)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
 
-        doc = getattr(p, "sales_doc", None)
-        if doc and getattr(doc, "status", None) == "APPROVED":
-            try:
-                tot_income += float(getattr(doc, "grand_total", 0) or 0)
-            except Exception:
-                pass
+    if request.args.get("async"):
+        return jobs.accepted_response(jobs.enqueue("vouchers_pdf_batch", params))
 
-        rows.append(
-            {
-                "id": p.id,
-                "code": p.code,
-                "name": p.name,
-                "materials": m,
-                "subs": s,
-                "expenses": e,
-                "advances": a,  # ✅ NEW
-                "total": g,
-            }
-        )
+    buf = BytesIO()
+    try:
+        _render_voucher_batch(params, buf)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 404
+    buf.seek(0)
+    return send_file(buf, mimetype="application/pdf", as_attachment=True, download_name=_voucher_batch_name(params))
+
+
+@jobs.job_handler("vouchers_pdf_batch")
+def _job_vouchers_pdf_batch(params: dict, ctx) -> dict:
+    _render_voucher_batch(params, ctx.out_path, progress=ctx.progress)
+    return {"filename": _voucher_batch_name(params), "mimetype": "application/pdf"}
+
+
+# -------------------------
+# Dashboard (โครงการ)
+# -------------------------
+@bp_pages.route("/dashboard")
+def dashboard():
+    today = date.today()
+    year = request.args.get("year", type=int) or today.year
+    month = request.args.get("month", type=int)
 
-    rows.sort(key=lambda r: r["total"], reverse=True)
-    top5 = rows[:5]
+    years = list(range(today.year - 5, today.year + 2))
 
-    profit_loss = tot_income - tot_g
+    # ✅ รวมยอดด้วย SQL (จำนวน query คงที่ ไม่ขึ้นกับจำนวนโครงการ) + cache จนกว่าข้อมูลจะเปลี่ยน
+    agg = dashboard_cache.get_or_compute(
+        "dashboard", year, month, lambda: dashboard_aggregates(year, month)
+    )
+
+    # ✅ Top 5 จัดอันดับใน SQL (ORDER BY + LIMIT) ตามตัวเลือก rank
+    rank = (request.args.get("rank") or "total").strip().lower()
+    if rank not in RANKED_PROJECT_ORDERS:
+        rank = "total"
+    top5 = dashboard_cache.get_or_compute(
+        "top_projects", year, month, lambda: ranked_projects(rank, year, month, limit=5), variant=rank
+    )
 
     class Totals:
         def __init__(self, m, s, e, a, g):
@@ -492,10 +671,11 @@ def dashboard():
         year=year,
         month=month,
         years=years,
-        totals=Totals(tot_m, tot_s, tot_e, tot_a, tot_g),
+        totals=Totals(agg["materials"], agg["subs"], agg["expenses"], agg["advances"], agg["grand"]),
         top5=top5,
-        total_income=round(tot_income, 2),
-        profit_loss=round(profit_loss, 2),
+        rank=rank,
+        total_income=round(agg["income"], 2),
+        profit_loss=round(agg["profit_loss"], 2),
     )
 
 
@@ -566,76 +746,279 @@ def dashboard_export_xlsx():
     year = request.args.get("year", type=int) or today.year
     month = request.args.get("month", type=int)
 
-    if month:
-        start_filter = and_(
-            Project.start_date.isnot(None),
-            func.extract("year", Project.start_date) == year,
-            func.extract("month", Project.start_date) == month,
+    # ✅ ?async=1 -> ทำใน background job แล้วตอบกลับทันที
+    if request.args.get("async"):
+        job = jobs.enqueue("dashboard_export", {"year": year, "month": month})
+        return jobs.accepted_response(job)
+
+    return xlsx_stream.stream_response(_dashboard_workbook(year, month), _dashboard_export_name(year, month))
+
+
+def _dashboard_export_name(year, month) -> str:
+    return f"dashboard_{year}_{month or 'all'}.xlsx"
+
+
+def _dashboard_workbook(year, month):
+    # ✅ อ่านทีละชุดจาก query ที่รวมยอดแล้ว (yield_per) + write_only -> memory คงที่
+    rows = dashboard_project_rows(year, month).order_by(Project.id.asc()).yield_per(xlsx_stream.XLSX_YIELD_PER)
+
+    wb = Workbook(write_only=True)
+    xlsx_stream.add_named_styles(wb)
+    ws = wb.create_sheet("Dashboard")
+
+    ws.append(
+        xlsx_stream.row(
+            ws,
+            ["รหัส", "ชื่อโครงการ", "ค่าวัสดุ", "ผู้รับเหมาช่วง", "อื่นๆ", "เงินเบิกล่วงหน้า", "รวม"],
+            style="xl_header",
         )
-        fallback_filter = and_(
-            Project.start_date.is_(None),
-            func.extract("year", Project.created_at) == year,
-            func.extract("month", Project.created_at) == month,
+    )
+
+    for r in rows:
+        ws.append(
+            xlsx_stream.row(
+                ws,
+                [r.code, r.name, _num(r.materials), _num(r.subs), _num(r.expenses), _num(r.advances), _num(r.total)],
+            )
         )
-    else:
-        start_filter = and_(
-            Project.start_date.isnot(None),
-            func.extract("year", Project.start_date) == year,
+    return wb
+
+
+@jobs.job_handler("dashboard_export")
+def _job_dashboard_export(params: dict, ctx) -> dict:
+    year, month = params.get("year"), params.get("month")
+    _dashboard_workbook(year, month).save(ctx.out_path)
+    return {"filename": _dashboard_export_name(year, month), "mimetype": xlsx_stream.XLSX_MIMETYPE}
+
+
+def _parse_ymd(value: str | None):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def _date_range_cond(col, start, end):
+    """start <= col < end+1 วัน (ช่วงปิดทั้ง 2 ฝั่ง, ใช้ index ได้)"""
+    conds = []
+    if start:
+        conds.append(col >= start)
+    if end:
+        conds.append(col < end + timedelta(days=1))
+    return and_(*conds) if conds else None
+
+
+def _ledger_sheets(start, end) -> list:
+    """
+    (ชื่อ sheet, หัวตาราง, select statement) ของ export-all
+    - กรองรายการย่อยด้วยวันที่เดียวกับ dashboard รายจ่าย (วันที่จริง -> fallback created_at)
+    - กรองโครงการด้วย start_date -> fallback created_at
+    """
+    month_dates = expense_month_dates()
+    r = ProjectCostRollup
+
+    proj_date = func.coalesce(Project.start_date, Project.created_at)
+    projects = (
+        select(
+            Project.code,
+            Project.name,
+            Project.status,
+            Project.customer_name,
+            Project.location,
+            Project.start_date,
+            Project.end_date,
+            Project.work_days,
+            func.coalesce(r.materials_total, 0),
+            func.coalesce(r.subs_payable_total, 0),
+            func.coalesce(r.other_total, 0),
+            func.coalesce(r.advances_total, 0),
+            func.coalesce(r.grand_total, 0),
         )
-        fallback_filter = and_(
-            Project.start_date.is_(None),
-            func.extract("year", Project.created_at) == year,
+        .outerjoin(r, r.project_id == Project.id)
+        .order_by(Project.id.asc())
+    )
+
+    materials = (
+        select(
+            Project.code,
+            MaterialItem.brand,
+            MaterialItem.item_code,
+            MaterialItem.item_name,
+            MaterialItem.unit,
+            MaterialItem.tax_invoice_no,
+            MaterialItem.tax_invoice_date,
+            MaterialItem.unit_price,
+            MaterialItem.qty,
+            MaterialItem.unit_price * MaterialItem.qty,
+            MaterialItem.note,
+            MaterialItem.created_at,
         )
+        .join(Project, Project.id == MaterialItem.project_id)
+        .order_by(MaterialItem.id.asc())
+    )
 
-    q = Project.query.filter(or_(start_filter, fallback_filter))
-    projects = q.all()
+    subs = (
+        select(
+            Project.code,
+            SubcontractorPayment.vendor_name,
+            SubcontractorPayment.pay_date,
+            SubcontractorPayment.contract_amount,
+            SubcontractorPayment.withholding_rate,
+            SubcontractorPayment.withholding_amount,
+            SubcontractorPayment.contract_amount - SubcontractorPayment.withholding_amount,
+            SubcontractorPayment.note,
+        )
+        .join(Project, Project.id == SubcontractorPayment.project_id)
+        .order_by(SubcontractorPayment.id.asc())
+    )
 
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Dashboard"
+    others = (
+        select(
+            Project.code,
+            OtherExpense.category,
+            OtherExpense.title,
+            OtherExpense.expense_date,
+            OtherExpense.amount,
+            OtherExpense.note,
+        )
+        .join(Project, Project.id == OtherExpense.project_id)
+        .order_by(OtherExpense.id.asc())
+    )
 
-    ws.append(["รหัส", "ชื่อโครงการ", "ค่าวัสดุ", "ผู้รับเหมาช่วง", "อื่นๆ", "เงินเบิกล่วงหน้า", "รวม"])
+    advances = (
+        select(
+            Project.code,
+            AdvanceExpense.title,
+            AdvanceExpense.advance_date,
+            AdvanceExpense.amount,
+            AdvanceExpense.note,
+        )
+        .join(Project, Project.id == AdvanceExpense.project_id)
+        .order_by(AdvanceExpense.id.asc())
+    )
 
-    for p in projects:
-        m, s, e, a, g = _project_totals(p)
-        ws.append([p.code, p.name, m, s, e, a, g])
+    filters = (
+        (projects, proj_date),
+        (materials, month_dates["materials"]),
+        (subs, month_dates["subs"]),
+        (others, month_dates["other"]),
+        (advances, month_dates["advances"]),
+    )
+    stmts = []
+    for stmt, col in filters:
+        cond = _date_range_cond(col, start, end)
+        stmts.append(stmt.where(cond) if cond is not None else stmt)
+    projects, materials, subs, others, advances = stmts
+
+    return [
+        (
+            "Projects",
+            [
+                "รหัสโครงการ", "ชื่อโครงการ", "สถานะ", "ลูกค้า", "สถานที่", "วันเริ่ม", "วันสิ้นสุด",
+                "วันทำงาน", "ค่าวัสดุ", "ผู้รับเหมาช่วง", "ค่าใช้จ่ายอื่น", "เงินเบิกล่วงหน้า", "รวมทั้งหมด",
+            ],
+            projects,
+        ),
+        (
+            "Materials",
+            [
+                "รหัสโครงการ", "ยี่ห้อ", "รหัสสินค้า", "รายการ", "หน่วย", "เลขที่ใบกำกับภาษี",
+                "วันที่ใบกำกับภาษี", "ราคา/หน่วย", "จำนวน", "รวม", "หมายเหตุ", "วันที่บันทึก",
+            ],
+            materials,
+        ),
+        (
+            "Subcontractors",
+            [
+                "รหัสโครงการ", "ผู้รับเหมา", "วันที่จ่าย", "ยอดตามสัญญา", "อัตราหัก ณ ที่จ่าย (%)",
+                "ยอดหัก ณ ที่จ่าย", "ยอดจ่ายจริง", "หมายเหตุ",
+            ],
+            subs,
+        ),
+        (
+            "Other expenses",
+            ["รหัสโครงการ", "หมวด", "รายการ", "วันที่", "จำนวนเงิน", "หมายเหตุ"],
+            others,
+        ),
+        (
+            "Advances",
+            ["รหัสโครงการ", "รายการ", "วันที่", "จำนวนเงิน", "หมายเหตุ"],
+            advances,
+        ),
+    ]
 
-    _excel_styles(ws)
 
-    bio = BytesIO()
-    wb.save(bio)
-    bio.seek(0)
+def _xlsx_value(v):
+    if v is None:
+        return ""
+    if isinstance(v, datetime):
+        return v.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(v, date):
+        return v.isoformat()
+    if isinstance(v, (int, float, str)):
+        return v
+    return _num(v)
 
-    return send_file(
-        bio,
-        as_attachment=True,
-        download_name=f"dashboard_{year}_{month or 'all'}.xlsx",
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    )
 
+@bp_pages.route("/projects/export-all.xlsx")
+def projects_export_all_xlsx():
+    """
+    ✅ สมุดบัญชีทุกโครงการ (1 sheet / ประเภท) กรองช่วงวันที่ได้ ?from=YYYY-MM-DD&to=YYYY-MM-DD
+    - server-side cursor (yield_per) + write_only -> ไม่โหลดทั้ง ledger เข้า memory
+    """
+    start = _parse_ymd(request.args.get("from"))
+    end = _parse_ymd(request.args.get("to"))
 
-# ------------------------------------------------------------
-# Finance dashboards (แยก รายรับ / รายจ่าย)
-# ------------------------------------------------------------
+    if request.args.get("async"):
+        job = jobs.enqueue(
+            "projects_export_all",
+            {"from": start.isoformat() if start else None, "to": end.isoformat() if end else None},
+        )
+        return jobs.accepted_response(job)
 
-@bp_pages.get("/dashboard/in come")
-def dashboard_income_typo_redirect():
-    return redirect(url_for("pages.dashboard_income"))
+    return xlsx_stream.stream_response(_ledger_workbook(start, end), _ledger_export_name(start, end))
 
 
-@bp_pages.get("/dashboard/income")
-def dashboard_income():
-    """Dashboard รายรับ (นับจากใบกำกับภาษี IV ที่สถานะ APPROVED)"""
-    today = date.today()
-    year = request.args.get("year", type=int) or today.year
+def _ledger_export_name(start, end) -> str:
+    suffix = f"{start or 'all'}_{end or 'all'}" if (start or end) else "all"
+    return f"projects_ledger_{suffix}.xlsx"
+
+
+def _ledger_workbook(start, end, progress=None):
+    wb = Workbook(write_only=True)
+    xlsx_stream.add_named_styles(wb)
+
+    sheets = _ledger_sheets(start, end)
+    for i, (title, header, stmt) in enumerate(sheets):
+        ws = wb.create_sheet(title)
+        ws.append(xlsx_stream.row(ws, header, style="xl_header"))
+
+        result = db.session.execute(stmt.execution_options(yield_per=xlsx_stream.XLSX_YIELD_PER))
+        for row in result:
+            ws.append(xlsx_stream.row(ws, [_xlsx_value(v) for v in row]))
+        result.close()
+
+        if progress:
+            progress(i + 1, len(sheets), title)
+    return wb
+
+
+@jobs.job_handler("projects_export_all")
+def _job_projects_export_all(params: dict, ctx) -> dict:
+    start = _parse_ymd(params.get("from"))
+    end = _parse_ymd(params.get("to"))
+    _ledger_workbook(start, end, progress=ctx.progress).save(ctx.out_path)
+    return {"filename": _ledger_export_name(start, end), "mimetype": xlsx_stream.XLSX_MIMETYPE}
 
-    q = (
-        SalesDoc.query.filter(SalesDoc.doc_type == "IV")
-        .filter(SalesDoc.status == "APPROVED")
-        .filter(SalesDoc.issue_date.isnot(None))
-    )
 
-    docs = q.all()
+# ------------------------------------------------------------
+# Finance dashboards (แยก รายรับ / รายจ่าย)
+# ------------------------------------------------------------
+
+def _income_summary(year: int) -> dict:
+    agg = income_monthly_aggregates(year)
 
     month_totals = {m: 0.0 for m in range(1, 13)}
     month_count = {m: 0 for m in range(1, 13)}
@@ -645,33 +1028,78 @@ def dashboard_income():
     total_wht = 0.0
     total_net = 0.0
 
-    for d in docs:
-        try:
-            if not d.issue_date or int(d.issue_date.year) != int(year):
-                continue
-            m = int(d.issue_date.month)
-        except Exception:
+    for m, r in agg.items():
+        if m not in month_totals:
             continue
+        month_totals[m] += r["gross"]
+        month_count[m] += r["count"]
+
+        total_income += r["gross"]
+        total_vat += r["vat"]
+        total_wht += r["wht"]
+        total_net += r["net"]
+
+    return {
+        "series": [round(month_totals[m], 2) for m in range(1, 13)],
+        "counts": [month_count[m] for m in range(1, 13)],
+        "total_income": round(total_income, 2),
+        "total_vat": round(total_vat, 2),
+        "total_wht": round(total_wht, 2),
+        "total_net": round(total_net, 2),
+    }
+
+
+def _expense_summary(year: int) -> dict:
+    agg = expense_monthly_aggregates(year)
+
+    month_totals = {m: 0.0 for m in range(1, 13)}
+    month_count = {m: 0 for m in range(1, 13)}
+    cat_totals = {}
+
+    for key, by_month in agg.items():
+        cat_totals[key] = 0.0
+        for m, (amt, n) in by_month.items():
+            if m not in month_totals:
+                continue
+            month_totals[m] += amt
+            month_count[m] += n
+            cat_totals[key] += amt
+
+    total_materials = cat_totals.get("materials", 0.0)
+    total_subs = cat_totals.get("subs", 0.0)
+    total_other = cat_totals.get("other", 0.0)
+    total_adv = cat_totals.get("advances", 0.0)
+    total_expense = total_materials + total_subs + total_other + total_adv
+
+    return {
+        "series": [round(month_totals[m], 2) for m in range(1, 13)],
+        "counts": [month_count[m] for m in range(1, 13)],
+        "total_expense": round(total_expense, 2),
+        "total_materials": round(total_materials, 2),
+        "total_subs": round(total_subs, 2),
+        "total_other": round(total_other, 2),
+        "total_advances": round(total_adv, 2),  # ✅ NEW (ถ้า template ยังไม่รับ ก็ไม่พัง)
+    }
 
-        gross = _num(getattr(d, "gross_total", 0))
-        vat = _num(getattr(d, "vat_amount", 0))
-        wht = _num(getattr(d, "wht_amount", 0))
-        net_pay = _num(getattr(d, "grand_total", 0))
 
-        month_totals[m] += gross
-        month_count[m] += 1
+@bp_pages.get("/dashboard/in come")
+def dashboard_income_typo_redirect():
+    return redirect(url_for("pages.dashboard_income"))
+
+
+@bp_pages.get("/dashboard/income")
+def dashboard_income():
+    """Dashboard รายรับ (นับจากใบกำกับภาษี IV ที่สถานะ APPROVED)"""
+    today = date.today()
+    year = request.args.get("year", type=int) or today.year
 
-        total_income += gross
-        total_vat += vat
-        total_wht += wht
-        total_net += net_pay
+    # ✅ GROUP BY เดือนใน SQL จากยอดที่บันทึกไว้ใน sales_docs + cache จนกว่าข้อมูลจะเปลี่ยน
+    data = dashboard_cache.get_or_compute("income", year, None, lambda: _income_summary(year))
 
     labels = [
         "ม.ค.", "ก.พ.", "มี.ค.", "เม.ย.", "พ.ค.", "มิ.ย.",
         "ก.ค.", "ส.ค.", "ก.ย.", "ต.ค.", "พ.ย.", "ธ.ค."
     ]
-    series = [round(month_totals[m], 2) for m in range(1, 13)]
-    counts = [month_count[m] for m in range(1, 13)]
     years = list(range(today.year - 5, today.year + 2))
 
     return render_template(
@@ -679,12 +1107,7 @@ def dashboard_income():
         year=year,
         years=years,
         labels=labels,
-        series=series,
-        counts=counts,
-        total_income=round(total_income, 2),
-        total_vat=round(total_vat, 2),
-        total_wht=round(total_wht, 2),
-        total_net=round(total_net, 2),
+        **data,
     )
 
 
@@ -697,67 +1120,13 @@ def dashboard_expense():
     today = date.today()
     year = request.args.get("year", type=int) or today.year
 
-    mats = MaterialItem.query.all()
-    subs = SubcontractorPayment.query.all()
-    oth = OtherExpense.query.all()
-    adv = AdvanceExpense.query.all()  # ✅ NEW
-
-    month_totals = {m: 0.0 for m in range(1, 13)}
-    month_count = {m: 0 for m in range(1, 13)}
-
-    total_materials = 0.0
-    total_subs = 0.0
-    total_other = 0.0
-    total_adv = 0.0
-    total_expense = 0.0
-
-    def _acc(dt, amount):
-        nonlocal total_expense
-        try:
-            if not dt or int(dt.year) != int(year):
-                return
-            m = int(dt.month)
-        except Exception:
-            return
-        amt = _num(amount)
-        month_totals[m] += amt
-        month_count[m] += 1
-        total_expense += amt
-
-    for it in mats:
-        dt = _pick_month_date(it, "created_at")
-        amt = _num(getattr(it, "unit_price", 0)) * _num(getattr(it, "qty", 0))
-        if dt and int(dt.year) == int(year):
-            total_materials += amt
-        _acc(dt, amt)
-
-    for it in subs:
-        dt = _pick_month_date(it, "pay_date", "created_at")  # ✅ NEW
-        amt = max(0.0, _num(getattr(it, "contract_amount", 0)) - _num(getattr(it, "withholding_amount", 0)))
-        if dt and int(dt.year) == int(year):
-            total_subs += amt
-        _acc(dt, amt)
-
-    for it in oth:
-        dt = _pick_month_date(it, "expense_date", "created_at")  # ✅ NEW
-        amt = _num(getattr(it, "amount", 0))
-        if dt and int(dt.year) == int(year):
-            total_other += amt
-        _acc(dt, amt)
-
-    for it in adv:
-        dt = _pick_month_date(it, "advance_date", "created_at")  # ✅ NEW
-        amt = _num(getattr(it, "amount", 0))
-        if dt and int(dt.year) == int(year):
-            total_adv += amt
-        _acc(dt, amt)
+    # ✅ GROUP BY เดือนใน SQL (ไม่โหลดรายการทั้งหมดมากรองใน Python) + cache จนกว่าข้อมูลจะเปลี่ยน
+    data = dashboard_cache.get_or_compute("expense", year, None, lambda: _expense_summary(year))
 
     labels = [
         "ม.ค.", "ก.พ.", "มี.ค.", "เม.ย.", "พ.ค.", "มิ.ย.",
         "ก.ค.", "ส.ค.", "ก.ย.", "ต.ค.", "พ.ย.", "ธ.ค."
     ]
-    series = [round(month_totals[m], 2) for m in range(1, 13)]
-    counts = [month_count[m] for m in range(1, 13)]
     years = list(range(today.year - 5, today.year + 2))
 
     return render_template(
@@ -765,13 +1134,7 @@ def dashboard_expense():
         year=year,
         years=years,
         labels=labels,
-        series=series,
-        counts=counts,
-        total_expense=round(total_expense, 2),
-        total_materials=round(total_materials, 2),
-        total_subs=round(total_subs, 2),
-        total_other=round(total_other, 2),
-        total_advances=round(total_adv, 2),  # ✅ NEW (ถ้า template ยังไม่รับ ก็ไม่พัง)
+        **data,
     )
 
 
@@ -1,18 +1,41 @@
 from __future__ import annotations
 
-from datetime import date
+import os
+import tempfile
+from datetime import date, datetime
 from decimal import Decimal, ROUND_HALF_UP
-
-from flask import Blueprint, flash, redirect, render_template, request, send_file, url_for
+from io import BytesIO
+
+import click
+from flask import (
+    Blueprint,
+    current_app,
+    flash,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    send_file,
+    url_for,
+)
 
 from .. import db
-from ..models import CompanyProfile, WithholdingCertificate, WithholdingEntity, WithholdingPerson
+from ..models import (
+    CompanyProfile,
+    WithholdingCertificate,
+    WithholdingEntity,
+    WithholdingPerson,
+    withholding_filing_rows,
+    withholding_filing_summary,
+)
+from ..utils import jobs, pdf_cache, xlsx_stream
 
 
 bp_withholding_docs = Blueprint(
     "withholding_docs",
     __name__,
     url_prefix="/withholding/docs",
+    cli_group="withholding",
 )
 
 
@@ -52,6 +75,13 @@ def _q2(v: Decimal) -> Decimal:
         return v
 
 
+def _month_range(month: str):
+    """YYYY-MM -> (วันที่ 1 ของเดือน, วันที่ 1 ของเดือนถัดไป)"""
+    start = datetime.strptime(month, "%Y-%m").date()
+    end = date(start.year + 1, 1, 1) if start.month == 12 else date(start.year, start.month + 1, 1)
+    return start, end
+
+
 # =========================================================
 # List
 # =========================================================
@@ -247,13 +277,467 @@ def docs_edit(doc_id: int):
 def docs_pdf(doc_id: int):
     doc = WithholdingCertificate.query.get_or_404(doc_id)
 
+    # ✅ ?async=1 -> render ใน background job แล้วตอบกลับทันที
+    if request.args.get("async"):
+        return jobs.accepted_response(jobs.enqueue("withholding_pdf", {"doc_id": doc.id}))
+
+    # ✅ cache ตาม (id, updated_at, ฟอร์ม, layout) + ETag/Last-Modified -> ดาวน์โหลดซ้ำไม่ต้อง render ใหม่
+    return pdf_cache.pdf_response(
+        _pdf_cache_key(doc),
+        lambda: _render_pdf(doc),
+        download_name=f"{doc.doc_no}.pdf",
+        last_modified=_pdf_last_modified(doc),
+    )
+
+
+def _payee(doc):
+    if doc.payee_kind == "PERSON":
+        return doc.payee_person
+    if doc.payee_kind == "ENTITY":
+        return doc.payee_entity
+    return None
+
+
+def _pdf_last_modified(doc):
+    # ชื่อ/ที่อยู่ผู้ถูกหักอ่านจาก master -> แก้ master ก็ต้องนับเป็นเปลี่ยน
+    payee = _payee(doc)
+    stamps = [doc.updated_at, getattr(payee, "updated_at", None)]
+    return max((s for s in stamps if s), default=None)
+
+
+def _pdf_cache_key(doc) -> str:
     # ✅ lazy import: กัน migrate/upgrade พังถ้า reportlab ยังไม่พร้อม
-    from ..utils.withholding_pdf import build_withholding_pdf
+    from ..utils.pdf_fonts import font_token
+    from ..utils.withholding_pdf import layout_token, template_digest
+
+    payee = _payee(doc)
+    return pdf_cache.make_key(
+        "withholding",
+        doc.id,
+        doc.updated_at.isoformat() if doc.updated_at else "",
+        payee.updated_at.isoformat() if getattr(payee, "updated_at", None) else "",
+        template_digest(),
+        layout_token(),
+        font_token(),
+    )
+
+
+def _render_pdf(doc) -> bytes:
+    from ..utils.withholding_pdf import render_withholding_pdf
+
+    return render_withholding_pdf(doc)
+
+
+@jobs.job_handler("withholding_pdf")
+def _job_withholding_pdf(params: dict, ctx) -> dict:
+    doc = db.session.get(WithholdingCertificate, int(params["doc_id"]))
+    if doc is None:
+        raise ValueError(f"withholding certificate {params['doc_id']} not found")
+
+    data = pdf_cache.get_cache().get_or_render(_pdf_cache_key(doc), lambda: _render_pdf(doc))
+    with open(ctx.out_path, "wb") as f:
+        f.write(data)
+    return {"filename": f"{doc.doc_no}.pdf", "mimetype": "application/pdf"}
+
+
+# =========================================================
+# Batch PDF (หลายใบ: รวม PDF / ZIP)
+# =========================================================
+BATCH_FORMATS = {"pdf": "application/pdf", "zip": "application/zip"}
+
+
+def _batch_filters(values) -> dict:
+    """
+    อ่าน/ตรวจตัวกรอง: form_type, month (YYYY-MM), payee_kind, payee_id, format
+    - ผิดรูปแบบ -> ValueError
+    """
+    form_type = _s(values.get("form_type")).upper() or None
+    if form_type and form_type not in ("PND3", "PND53"):
+        raise ValueError("form_type ต้องเป็น PND3 หรือ PND53")
+
+    month = _s(values.get("month")) or None
+    if month:
+        try:
+            datetime.strptime(month, "%Y-%m")
+        except ValueError:
+            raise ValueError("month ต้องเป็นรูปแบบ YYYY-MM") from None
+
+    payee_kind = _s(values.get("payee_kind")).upper() or None
+    if payee_kind and payee_kind not in ("PERSON", "ENTITY"):
+        raise ValueError("payee_kind ต้องเป็น PERSON หรือ ENTITY")
+
+    payee_id = _to_int(values.get("payee_id"))
+    if payee_id and not payee_kind:
+        raise ValueError("ระบุ payee_id ต้องระบุ payee_kind ด้วย")
+
+    fmt = (_s(values.get("format")) or "pdf").lower()
+    if fmt not in BATCH_FORMATS:
+        raise ValueError("format ต้องเป็น pdf หรือ zip")
+
+    return {
+        "form_type": form_type,
+        "month": month,
+        "payee_kind": payee_kind,
+        "payee_id": payee_id,
+        "format": fmt,
+    }
+
+
+def _batch_query(filters: dict):
+    qry = WithholdingCertificate.query.filter(WithholdingCertificate.is_active.is_(True))
+
+    if filters.get("form_type"):
+        qry = qry.filter(WithholdingCertificate.form_type == filters["form_type"])
+
+    if filters.get("month"):
+        start, end = _month_range(filters["month"])
+        qry = qry.filter(WithholdingCertificate.payment_date >= start)
+        qry = qry.filter(WithholdingCertificate.payment_date < end)
+
+    if filters.get("payee_kind"):
+        qry = qry.filter(WithholdingCertificate.payee_kind == filters["payee_kind"])
+        if filters.get("payee_id"):
+            col = (
+                WithholdingCertificate.payee_person_id
+                if filters["payee_kind"] == "PERSON"
+                else WithholdingCertificate.payee_entity_id
+            )
+            qry = qry.filter(col == filters["payee_id"])
+
+    return qry.order_by(WithholdingCertificate.doc_no.asc())
+
+
+def _batch_name(filters: dict) -> str:
+    parts = ["withholding", filters.get("form_type") or "ALL", filters.get("month") or "all"]
+    if filters.get("payee_kind"):
+        parts.append(f"{filters['payee_kind']}{filters.get('payee_id') or ''}")
+    return "_".join(parts) + f".{filters['format']}"
+
+
+def _render_batch(filters: dict, out, progress=None) -> int:
+    from ..utils.withholding_pdf import certificate_snapshot, render_batch
+
+    snapshots = [certificate_snapshot(d) for d in _batch_query(filters).all()]
+    if not snapshots:
+        raise ValueError("ไม่พบเอกสารตามเงื่อนไข")
+
+    return render_batch(
+        snapshots,
+        out,
+        fmt=filters["format"],
+        workers=current_app.config.get("WITHHOLDING_PDF_WORKERS"),
+        progress=progress,
+    )
+
+
+@bp_withholding_docs.post("/batch")
+def docs_batch():
+    """
+    render หลายใบใน background job -> 202 + /jobs/<id> (มี progress)
+    form/query: form_type, month=YYYY-MM, payee_kind, payee_id, format=pdf|zip
+    """
+    try:
+        filters = _batch_filters(request.values)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+
+    if _batch_query(filters).count() == 0:
+        return jsonify({"ok": False, "error": "ไม่พบเอกสารตามเงื่อนไข"}), 400
+
+    return jobs.accepted_response(jobs.enqueue("withholding_pdf_batch", filters))
+
+
+@jobs.job_handler("withholding_pdf_batch")
+def _job_withholding_pdf_batch(params: dict, ctx) -> dict:
+    _render_batch(params, ctx.out_path, progress=ctx.progress)
+    return {"filename": _batch_name(params), "mimetype": BATCH_FORMATS[params["format"]]}
+
+
+@bp_withholding_docs.cli.command("render-batch")
+@click.option("--form-type", default=None, help="PND3 / PND53")
+@click.option("--month", default=None, help="YYYY-MM (ตามวันที่จ่าย)")
+@click.option("--payee-kind", default=None, help="PERSON / ENTITY")
+@click.option("--payee-id", default=None, type=int)
+@click.option("--format", "fmt", default="pdf", show_default=True, help="pdf / zip")
+@click.option("--out", "out_path", default=None, help="ไฟล์ผลลัพธ์ (default: ตั้งชื่อตามตัวกรอง)")
+def render_batch_command(form_type, month, payee_kind, payee_id, fmt, out_path):
+    """render หนังสือรับรองหัก ณ ที่จ่ายหลายใบเป็น PDF รวม หรือ ZIP"""
+    try:
+        filters = _batch_filters(
+            {
+                "form_type": form_type,
+                "month": month,
+                "payee_kind": payee_kind,
+                "payee_id": str(payee_id) if payee_id else None,
+                "format": fmt,
+            }
+        )
+    except ValueError as e:
+        raise click.BadParameter(str(e)) from None
+
+    out_path = out_path or _batch_name(filters)
+
+    def _progress(done, total, message=None):
+        click.echo(f"\r{done}/{total}", nl=(done == total))
+
+    try:
+        n = _render_batch(filters, out_path, progress=_progress)
+    except ValueError as e:
+        raise click.ClickException(str(e)) from None
+    click.echo(f"{n} เอกสาร -> {out_path}")
+
+
+# =========================================================
+# ใบแนบ ภ.ง.ด.3 / ภ.ง.ด.53 รายเดือน (PDF / Excel)
+# =========================================================
+ATTACHMENT_FORMATS = {"pdf": "application/pdf", "xlsx": xlsx_stream.XLSX_MIMETYPE}
+
+
+def _attachment_params(values) -> dict:
+    """form_type (PND3 / PND53) + month (YYYY-MM) บังคับ -> ผิดรูปแบบ ValueError"""
+    form_type = _s(values.get("form_type")).upper()
+    if form_type not in ("PND3", "PND53"):
+        raise ValueError("form_type ต้องเป็น PND3 หรือ PND53")
+
+    month = _s(values.get("month"))
+    try:
+        _month_range(month)
+    except ValueError:
+        raise ValueError("month ต้องเป็นรูปแบบ YYYY-MM") from None
+
+    return {"form_type": form_type, "month": month}
+
+
+def _attachment_name(params: dict, fmt: str) -> str:
+    return f"attachment_{params['form_type']}_{params['month']}.{fmt}"
+
+
+def _attachment_payer() -> dict:
+    cp = CompanyProfile.get_one()
+    return {"name": cp.company_name, "tax_id": cp.tax_id, "branch_no": "00000"}
+
+
+def _attachment_rows(params: dict):
+    """
+    ✅ รายการทั้งเดือน: 1 query (join ผู้ถูกหัก) อ่านแบบ yield_per
+    - จำนวนแผ่นคำนวณจาก COUNT ใน SQL ก่อน -> ไม่ต้องโหลดทุกแถวเพื่อนับ
+    return (result, period, total_rows) — ผู้เรียกต้อง result.close()
+    """
+    start, end = _month_range(params["month"])
+    summary = withholding_filing_summary(start, end, params["form_type"])
+    total_rows = summary[0]["count"] if summary else 0
 
-    pdf_path = build_withholding_pdf(doc)  # returns a temp file path
+    stmt = withholding_filing_rows(params["form_type"], start, end)
+    result = db.session.execute(stmt.execution_options(yield_per=xlsx_stream.XLSX_YIELD_PER))
+    return result, start, total_rows
+
+
+def _attachment_pdf(params: dict, out, progress=None) -> dict:
+    from ..utils.withholding_attachment import render_attachment_pdf
+
+    result, period, total_rows = _attachment_rows(params)
+    try:
+        return render_attachment_pdf(
+            result, out, params["form_type"], period, _attachment_payer(), total_rows, progress=progress
+        )
+    finally:
+        result.close()
+
+
+def _attachment_workbook(params: dict, progress=None):
+    from openpyxl import Workbook
+
+    from ..utils.withholding_attachment import write_attachment_sheet
+
+    wb = Workbook(write_only=True)
+    xlsx_stream.add_named_styles(wb)
+
+    result, period, total_rows = _attachment_rows(params)
+    try:
+        write_attachment_sheet(
+            wb, result, params["form_type"], period, _attachment_payer(), progress=progress, total_rows=total_rows
+        )
+    finally:
+        result.close()
+    return wb
+
+
+@bp_withholding_docs.get("/filing")
+def docs_filing():
+    """สรุปยอดต่อแบบ / เดือน (GROUP BY ใน SQL) + ลิงก์ดาวน์โหลดใบแนบ"""
+    year = _to_int(request.args.get("year")) or date.today().year
+    rows = withholding_filing_summary(date(year, 1, 1), date(year + 1, 1, 1))
+    return render_template("withholding/filing.html", rows=rows, year=year)
+
+
+@bp_withholding_docs.get("/attachment.<fmt>")
+def docs_attachment(fmt: str):
+    """ใบแนบ ภ.ง.ด.3/53: ?form_type=PND53&month=YYYY-MM (&async=1)"""
+    if fmt not in ATTACHMENT_FORMATS:
+        return jsonify({"ok": False, "error": "รองรับเฉพาะ .pdf / .xlsx"}), 404
+    try:
+        params = _attachment_params(request.args)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+
+    if request.args.get("async"):
+        return jobs.accepted_response(jobs.enqueue("withholding_attachment", {**params, "format": fmt}))
+
+    if fmt == "xlsx":
+        return xlsx_stream.stream_response(_attachment_workbook(params), _attachment_name(params, fmt))
+
+    buf = BytesIO()
+    _attachment_pdf(params, buf)
+    buf.seek(0)
     return send_file(
-        pdf_path,
+        buf,
+        mimetype=ATTACHMENT_FORMATS[fmt],
         as_attachment=True,
-        download_name=f"{doc.doc_no}.pdf",
-        mimetype="application/pdf",
+        download_name=_attachment_name(params, fmt),
     )
+
+
+@jobs.job_handler("withholding_attachment")
+def _job_withholding_attachment(params: dict, ctx) -> dict:
+    fmt = params["format"]
+    if fmt == "xlsx":
+        _attachment_workbook(params, progress=ctx.progress).save(ctx.out_path)
+    else:
+        _attachment_pdf(params, ctx.out_path, progress=ctx.progress)
+    return {"filename": _attachment_name(params, fmt), "mimetype": ATTACHMENT_FORMATS[fmt]}
+
+
+# =========================================================
+# RD e-Filing (ไฟล์ข้อความคั่นด้วย |)
+# =========================================================
+def _efiling_params(values) -> dict:
+    """
+    form_type (บังคับ) + month (YYYY-MM) หรือ year (ทั้งปี) + encoding (cp874 / utf-8)
+    - ผิดรูปแบบ -> ValueError
+    """
+    from ..utils.withholding_efiling import EFILING_ENCODINGS
+
+    form_type = _s(values.get("form_type")).upper()
+    if form_type not in ("PND3", "PND53"):
+        raise ValueError("form_type ต้องเป็น PND3 หรือ PND53")
+
+    month = _s(values.get("month")) or None
+    year = _to_int(values.get("year"))
+    if month:
+        try:
+            _month_range(month)
+        except ValueError:
+            raise ValueError("month ต้องเป็นรูปแบบ YYYY-MM") from None
+    elif not year or not (1900 <= year <= 9999):
+        raise ValueError("ต้องระบุ month (YYYY-MM) หรือ year")
+
+    encoding = (_s(values.get("encoding")) or EFILING_ENCODINGS[0]).lower()
+    if encoding not in EFILING_ENCODINGS:
+        raise ValueError("encoding ต้องเป็น " + " หรือ ".join(EFILING_ENCODINGS))
+
+    return {"form_type": form_type, "month": month, "year": None if month else year, "encoding": encoding}
+
+
+def _efiling_range(params: dict):
+    if params.get("month"):
+        return _month_range(params["month"])
+    return date(params["year"], 1, 1), date(params["year"] + 1, 1, 1)
+
+
+def _efiling_name(params: dict) -> str:
+    return f"efiling_{params['form_type']}_{params.get('month') or params['year']}.txt"
+
+
+def _write_efiling(params: dict, path: str, progress=None) -> dict:
+    """
+    ✅ 1 query (join ผู้ถูกหัก) อ่านแบบ yield_per แล้วเขียนลงไฟล์ทีละบรรทัด
+    - ตรวจเลขผู้เสียภาษี 13 หลักระหว่างเขียน -> ผิดแม้แต่รายการเดียวถือว่าไฟล์ใช้ยื่นไม่ได้ (ผู้เรียกตัดสิน)
+    """
+    from ..utils.withholding_efiling import write_efiling
+
+    start, end = _efiling_range(params)
+    total = None
+    if progress:
+        total = sum(r["count"] for r in withholding_filing_summary(start, end, params["form_type"]))
+
+    stmt = withholding_filing_rows(params["form_type"], start, end)
+    result = db.session.execute(stmt.execution_options(yield_per=xlsx_stream.XLSX_YIELD_PER))
+    try:
+        with open(path, "wb") as fh:
+            return write_efiling(result, fh, encoding=params["encoding"], progress=progress, total=total)
+    finally:
+        result.close()
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _efiling_error(info: dict) -> str:
+    return f"เลขผู้เสียภาษี/ข้อมูลไม่ถูกต้อง {info['error_count']} รายการ"
+
+
+@bp_withholding_docs.get("/efiling.txt")
+def docs_efiling():
+    """
+    ไฟล์ยื่นแบบ RD e-Filing: ?form_type=PND53&month=YYYY-MM | &year=YYYY (&encoding=utf-8) (&async=1)
+    - มีรายการไม่ถูกต้อง -> 400 + รายการที่ต้องแก้
+    """
+    try:
+        params = _efiling_params(request.args)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+
+    if request.args.get("async"):
+        return jobs.accepted_response(jobs.enqueue("withholding_efiling", params))
+
+    fd, path = tempfile.mkstemp(suffix=".txt")
+    os.close(fd)
+    try:
+        info = _write_efiling(params, path)
+    except Exception:
+        _remove_file(path)
+        raise
+
+    if info["error_count"]:
+        _remove_file(path)
+        return jsonify({"ok": False, "error": _efiling_error(info), "invalid": info["errors"]}), 400
+
+    return xlsx_stream.stream_temp_file(path, f"text/plain; charset={params['encoding']}", _efiling_name(params))
+
+
+@jobs.job_handler("withholding_efiling")
+def _job_withholding_efiling(params: dict, ctx) -> dict:
+    info = _write_efiling(params, ctx.out_path, progress=ctx.progress)
+    if info["error_count"]:
+        bad = ", ".join(e["doc_no"] for e in info["errors"][:20])
+        raise ValueError(f"{_efiling_error(info)}: {bad}")
+    return {"filename": _efiling_name(params), "mimetype": "text/plain"}
+
+
+@bp_withholding_docs.cli.command("efile")
+@click.option("--form-type", required=True, help="PND3 / PND53")
+@click.option("--month", default=None, help="YYYY-MM (ตามวันที่จ่าย)")
+@click.option("--year", default=None, type=int, help="ทั้งปี (ถ้าไม่ระบุ --month)")
+@click.option("--encoding", default="cp874", show_default=True, help="cp874 / utf-8")
+@click.option("--out", "out_path", default=None, help="ไฟล์ผลลัพธ์ (default: ตั้งชื่อตามตัวกรอง)")
+def efile_command(form_type, month, year, encoding, out_path):
+    """export ไฟล์ยื่นแบบ RD e-Filing (คั่นด้วย |)"""
+    try:
+        params = _efiling_params(
+            {"form_type": form_type, "month": month, "year": str(year) if year else None, "encoding": encoding}
+        )
+    except ValueError as e:
+        raise click.BadParameter(str(e)) from None
+
+    out_path = out_path or _efiling_name(params)
+    info = _write_efiling(params, out_path)
+    if info["error_count"]:
+        for e in info["errors"]:
+            click.echo(f"{e['doc_no']}: {e['tax_id'] or '-'} {e['error']}", err=True)
+        _remove_file(out_path)
+        raise click.ClickException(_efiling_error(info))
+    click.echo(f"{info['count']} รายการ -> {out_path}")
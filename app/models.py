@@ -1,9 +1,10 @@
 from __future__ import annotations
 
+from dataclasses import dataclass
 from datetime import date, datetime
 from decimal import Decimal, ROUND_HALF_UP
 
-from sqlalchemy import CheckConstraint, Index, func
+from sqlalchemy import CheckConstraint, Index, and_, case, event, func, inspect, literal, or_, select, text, true
 
 from . import db
 
@@ -124,32 +125,56 @@ class Project(db.Model, TimestampMixin):
         order_by="AdvanceExpense.id",
     )
 
+    # ✅ ยอดรวมต้นทุนที่คำนวณไว้แล้ว (ดูแลโดย flush events ด้านล่าง)
+    cost_rollup = db.relationship(
+        "ProjectCostRollup",
+        uselist=False,
+        viewonly=True,
+        lazy="select",
+    )
+
     __table_args__ = (
         Index("ix_projects_code", "code"),
         Index("ix_projects_name", "name"),
         Index("ix_projects_sales_doc_id", "sales_doc_id"),
+        Index("ix_projects_updated_at_id", "updated_at", "id"),
         CheckConstraint("work_days >= 0", name="ck_projects_work_days_nonneg"),
     )
 
     @property
     def total_material_cost(self) -> float:
+        r = self.cost_rollup
+        if r is not None:
+            return float(r.materials_total or 0)
         return float(sum((m.total_cost or 0) for m in self.materials))
 
     @property
     def total_subcontractor_cost(self) -> float:
         # จ่ายจริง = ว่าจ้าง - หัก ณ ที่จ่าย
+        r = self.cost_rollup
+        if r is not None:
+            return float(r.subs_payable_total or 0)
         return float(sum((s.payable_amount or 0) for s in self.subcontractors))
 
     @property
     def total_other_expense(self) -> float:
+        r = self.cost_rollup
+        if r is not None:
+            return float(r.other_total or 0)
         return float(sum((e.amount or 0) for e in self.expenses))
 
     @property
     def total_advance_expense(self) -> float:
+        r = self.cost_rollup
+        if r is not None:
+            return float(r.advances_total or 0)
         return float(sum((a.amount or 0) for a in self.advances))
 
     @property
     def total_cost(self) -> float:
+        r = self.cost_rollup
+        if r is not None:
+            return float(r.grand_total or 0)
         return float(
             self.total_material_cost
             + self.total_subcontractor_cost
@@ -186,6 +211,7 @@ class MaterialItem(db.Model, TimestampMixin):
         Index("ix_material_items_project_id", "project_id"),
         Index("ix_material_items_tax_invoice_no", "tax_invoice_no"),
         Index("ix_material_items_tax_invoice_date", "tax_invoice_date"),
+        Index("ix_material_items_created_at", "created_at"),
     )
 
     @property
@@ -219,6 +245,7 @@ class SubcontractorPayment(db.Model, TimestampMixin):
         CheckConstraint("contract_amount >= 0", name="ck_sub_contract_amount_nonneg"),
         CheckConstraint("withholding_rate >= 0", name="ck_sub_wht_rate_nonneg"),
         CheckConstraint("withholding_amount >= 0", name="ck_sub_wht_amount_nonneg"),
+        Index("ix_subcontractor_payments_month_date", text("COALESCE(pay_date, created_at)")),
     )
 
     @property
@@ -248,6 +275,7 @@ class OtherExpense(db.Model, TimestampMixin):
     __table_args__ = (
         CheckConstraint("amount >= 0", name="ck_other_amount_nonneg"),
         Index("ix_other_expenses_category", "category"),
+        Index("ix_other_expenses_month_date", text("COALESCE(expense_date, created_at)")),
     )
 
 
@@ -274,54 +302,346 @@ class AdvanceExpense(db.Model, TimestampMixin):
     __table_args__ = (
         CheckConstraint("amount >= 0", name="ck_advance_amount_nonneg"),
         Index("ix_advance_expenses_project_id", "project_id"),
+        Index("ix_advance_expenses_month_date", text("COALESCE(advance_date, created_at)")),
+    )
+
+
+# =========================================================
+# Project cost rollups
+# =========================================================
+class ProjectCostRollup(db.Model):
+    """
+    ✅ ยอดรวมต้นทุนต่อโครงการ (1 แถว / 1 โครงการ)
+    - หน้า list / dashboard / API อ่านจากตารางนี้ แทนการโหลดรายการย่อยทั้งหมด
+    - อัปเดตอัตโนมัติทุกครั้งที่ flush รายการวัสดุ/ผู้รับเหมา/ค่าใช้จ่าย/เงินเบิก
+    """
+    __tablename__ = "project_cost_rollups"
+
+    project_id = db.Column(
+        db.Integer,
+        db.ForeignKey("projects.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+
+    materials_total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    subs_payable_total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    other_total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    advances_total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    grand_total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+
+    materials_count = db.Column(db.Integer, nullable=False, default=0)
+    subs_count = db.Column(db.Integer, nullable=False, default=0)
+    other_count = db.Column(db.Integer, nullable=False, default=0)
+    advances_count = db.Column(db.Integer, nullable=False, default=0)
+
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self) -> str:
+        return f"<ProjectCostRollup {self.project_id} {self.grand_total}>"
+
+
+def _project_cost_subqueries(project_ids=None) -> tuple:
+    """
+    grouped subqueries (pid, total, n) ของรายการย่อยทั้ง 4 ประเภท
+    - project_ids: list/subquery ของ Project.id ที่ต้องการ (None = ทุกโครงการ)
+    """
+
+    def _grouped(model, amount_expr, label):
+        q = select(
+            model.project_id.label("pid"),
+            func.coalesce(func.sum(amount_expr), 0).label(label),
+            func.count(model.id).label("n"),
+        )
+        if project_ids is not None:
+            q = q.where(model.project_id.in_(project_ids))
+        return q.group_by(model.project_id).subquery()
+
+    mat = _grouped(MaterialItem, MaterialItem.unit_price * MaterialItem.qty, "materials")
+    sub = _grouped(
+        SubcontractorPayment,
+        SubcontractorPayment.contract_amount - SubcontractorPayment.withholding_amount,
+        "subs",
+    )
+    oth = _grouped(OtherExpense, OtherExpense.amount, "expenses")
+    adv = _grouped(AdvanceExpense, AdvanceExpense.amount, "advances")
+    return mat, sub, oth, adv
+
+
+def _upsert_insert(connection, table, key_columns: tuple, columns):
+    """
+    INSERT ... ON CONFLICT (key) DO UPDATE SET (column อื่นทั้งหมด = ค่าใหม่) ของ dialect
+    - ใช้แทน DELETE + INSERT: 2 transaction เขียน key เดียวกันพร้อมกันไม่ชน unique
+    - dialect ที่ไม่รองรับ -> None (caller ถอยไป DELETE + INSERT)
+    """
+    name = connection.dialect.name
+    if name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+
+    def finish(stmt):
+        return stmt.on_conflict_do_update(
+            index_elements=list(key_columns),
+            set_={c: stmt.excluded[c] for c in columns if c not in key_columns},
+        )
+
+    return insert(table), finish
+
+
+def refresh_project_cost_rollups(connection, project_ids=None) -> None:
+    """
+    คำนวณ project_cost_rollups ใหม่จาก SQL (ไม่โหลด ORM objects)
+    - project_ids=None = rebuild ทุกโครงการ
+    """
+    if project_ids is not None:
+        project_ids = sorted({int(x) for x in project_ids if x is not None})
+        if not project_ids:
+            return
+
+    mat, sub, oth, adv = _project_cost_subqueries(project_ids)
+
+    m_total = func.coalesce(mat.c.materials, 0)
+    s_total = func.coalesce(sub.c.subs, 0)
+    o_total = func.coalesce(oth.c.expenses, 0)
+    a_total = func.coalesce(adv.c.advances, 0)
+
+    sel = (
+        select(
+            Project.id,
+            m_total,
+            s_total,
+            o_total,
+            a_total,
+            m_total + s_total + o_total + a_total,
+            func.coalesce(mat.c.n, 0),
+            func.coalesce(sub.c.n, 0),
+            func.coalesce(oth.c.n, 0),
+            func.coalesce(adv.c.n, 0),
+            literal(datetime.utcnow(), db.DateTime),
+        )
+        .select_from(Project)
+        .outerjoin(mat, mat.c.pid == Project.id)
+        .outerjoin(sub, sub.c.pid == Project.id)
+        .outerjoin(oth, oth.c.pid == Project.id)
+        .outerjoin(adv, adv.c.pid == Project.id)
     )
 
+    columns = [
+        "project_id",
+        "materials_total",
+        "subs_payable_total",
+        "other_total",
+        "advances_total",
+        "grand_total",
+        "materials_count",
+        "subs_count",
+        "other_count",
+        "advances_count",
+        "updated_at",
+    ]
+    t = ProjectCostRollup.__table__
+    # แถวของโครงการที่ไม่มีแล้ว (ลบในรอบเดียวกัน / SQLite ไม่บังคับ FK cascade)
+    gone = t.delete().where(~t.c.project_id.in_(select(Project.id)))
+    if project_ids is not None:
+        sel = sel.where(Project.id.in_(project_ids))
+        gone = gone.where(t.c.project_id.in_(project_ids))
+    else:
+        # SQLite: INSERT ... SELECT ... ON CONFLICT ต้องมี WHERE (กันกำกวมกับ JOIN ... ON)
+        sel = sel.where(true())
+
+    upsert = _upsert_insert(connection, t, ("project_id",), columns)
+    if upsert is None:
+        delete_stmt = t.delete()
+        if project_ids is not None:
+            delete_stmt = delete_stmt.where(t.c.project_id.in_(project_ids))
+        connection.execute(delete_stmt)
+        connection.execute(t.insert().from_select(columns, sel))
+        return
+
+    # ✅ upsert ตาม project_id: 2 session แก้รายการของโครงการเดียวกันพร้อมกัน ไม่ชน primary key
+    stmt, finish = upsert
+    connection.execute(gone)
+    connection.execute(finish(stmt.from_select(columns, sel)))
+
+
+_ROLLUP_CHILD_MODELS = (MaterialItem, SubcontractorPayment, OtherExpense, AdvanceExpense)
+_PROJECT_CHILD_ATTRS = ("materials", "subcontractors", "expenses", "advances")
+
+
+@event.listens_for(db.session, "before_flush")
+def _project_touch_before_flush(session, flush_context, instances):
+    # ✅ เพิ่ม/แก้/ลบรายการย่อย = โครงการเปลี่ยน (updated_at ใช้เป็น Last-Modified ของ API)
+    touched = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, _ROLLUP_CHILD_MODELS):
+            if obj in session.dirty and not session.is_modified(obj):
+                continue
+            if obj.project is not None:
+                touched.add(obj.project)
+        elif isinstance(obj, Project) and obj in session.dirty:
+            # ลบด้วย delete-orphan: แถวลูกยังไม่อยู่ใน session.deleted ตอนนี้ -> ดูจาก collection
+            state = inspect(obj)
+            if any(state.attrs[a].history.has_changes() for a in _PROJECT_CHILD_ATTRS):
+                touched.add(obj)
+
+    now = datetime.utcnow()
+    for p in touched:
+        if p not in session.deleted:
+            p.updated_at = now
+
+
+@event.listens_for(db.session, "after_flush")
+def _rollups_after_flush(session, flush_context):
+    touched = set()
+    removed = set()
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Project):
+            if obj in session.deleted:
+                removed.add(obj.id)
+            else:
+                # collection เปลี่ยน (เช่น .clear()) -> orphan ถูกลบใน flush นี้
+                touched.add(obj.id)
+        elif isinstance(obj, _ROLLUP_CHILD_MODELS):
+            touched.add(obj.project_id)
+            # ย้ายรายการข้ามโครงการ -> ต้องคำนวณโครงการเดิมด้วย
+            hist = inspect(obj).attrs.project_id.history
+            touched.update(hist.deleted or ())
+
+    touched.discard(None)
+    touched -= removed
+
+    if not touched and not removed:
+        return
+
+    conn = session.connection()
+    if removed:
+        t = ProjectCostRollup.__table__
+        conn.execute(t.delete().where(t.c.project_id.in_(removed)))
+    if touched:
+        refresh_project_cost_rollups(conn, touched)
+
+    session.info.setdefault("_stale_rollups", set()).update(touched | removed)
+
+
+@event.listens_for(db.session, "after_flush_postexec")
+def _rollups_expire_stale(session, flush_context):
+    stale = session.info.pop("_stale_rollups", None)
+    if not stale:
+        return
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, ProjectCostRollup) and obj.project_id in stale:
+            session.expire(obj)
+        elif isinstance(obj, Project) and obj.id in stale:
+            session.expire(obj, ["cost_rollup"])
+
+
+# =========================================================
+# Project version (ใช้ทำ ETag ของ /api/projects/<pid>)
+# =========================================================
+def project_version(project_id: int) -> tuple | None:
+    """
+    สถานะล่าสุดของโครงการ + รายการย่อยทั้ง 4 ประเภท จาก SQL ครั้งเดียว (ไม่โหลด ORM objects)
+    - ต่อ table: updated_at ล่าสุด + จำนวนแถว + ผลรวม id
+      (ลบแถวไม่มี updated_at ใหม่ -> จำนวน/ผลรวม id เปลี่ยนแทน)
+    -> (updated_at ล่าสุดของทั้งหมด, tuple ของค่าทั้งหมด) หรือ None ถ้าไม่มีโครงการ
+    """
+    parts = [
+        select(literal("project"), Project.updated_at, literal(1), Project.id).where(Project.id == project_id)
+    ]
+    for model in _ROLLUP_CHILD_MODELS:
+        parts.append(
+            select(
+                literal(model.__tablename__),
+                func.max(model.updated_at),
+                func.count(model.id),
+                func.coalesce(func.sum(model.id), 0),
+            ).where(model.project_id == project_id)
+        )
+
+    rows = {r[0]: tuple(r[1:]) for r in db.session.execute(parts[0].union_all(*parts[1:]))}
+    if "project" not in rows:
+        return None
+    last_modified = max(r[0] for r in rows.values() if r[0] is not None)
+    return last_modified, tuple(sorted(rows.items()))
+
 
 # =========================================================
 # Dashboard aggregates
 # =========================================================
-def dashboard_aggregates(year: int | None = None, month: int | None = None) -> dict:
+def dashboard_project_filter(year: int | None = None, month: int | None = None):
     """
-    Aggregate totals for dashboard (filtered by Project.start_date month/year if provided).
+    เงื่อนไขเลือกโครงการตามเดือน/ปี:
+    - ใช้ Project.start_date ก่อน
+    - ถ้าไม่มี start_date ให้ fallback created_at
     """
-    proj_q = db.session.query(Project.id)
+    start_conds = [Project.start_date.isnot(None)]
+    fallback_conds = [Project.start_date.is_(None)]
 
     if year:
-        proj_q = proj_q.filter(func.extract("year", Project.start_date) == int(year))
+        start_conds.append(func.extract("year", Project.start_date) == int(year))
+        fallback_conds.append(func.extract("year", Project.created_at) == int(year))
     if month:
-        proj_q = proj_q.filter(func.extract("month", Project.start_date) == int(month))
+        start_conds.append(func.extract("month", Project.start_date) == int(month))
+        fallback_conds.append(func.extract("month", Project.created_at) == int(month))
 
-    project_ids_subq = proj_q.subquery()
+    return or_(and_(*start_conds), and_(*fallback_conds))
 
-    materials_total = (
-        db.session.query(func.coalesce(func.sum(MaterialItem.unit_price * MaterialItem.qty), 0))
-        .filter(MaterialItem.project_id.in_(project_ids_subq))
-        .scalar()
-        or 0
-    )
 
-    subs_payable_total = (
+def dashboard_project_rows(year: int | None = None, month: int | None = None):
+    """
+    query รายโครงการ (id, code, name, materials, subs, expenses, advances, total)
+    อ่านจาก project_cost_rollups -> 1 query ไม่ว่าจะมีกี่โครงการ
+    """
+    r = ProjectCostRollup
+    return (
         db.session.query(
-            func.coalesce(
-                func.sum(SubcontractorPayment.contract_amount - SubcontractorPayment.withholding_amount),
-                0,
-            )
+            Project.id.label("id"),
+            Project.code.label("code"),
+            Project.name.label("name"),
+            func.coalesce(r.materials_total, 0).label("materials"),
+            func.coalesce(r.subs_payable_total, 0).label("subs"),
+            func.coalesce(r.other_total, 0).label("expenses"),
+            func.coalesce(r.advances_total, 0).label("advances"),
+            func.coalesce(r.grand_total, 0).label("total"),
         )
-        .filter(SubcontractorPayment.project_id.in_(project_ids_subq))
-        .scalar()
-        or 0
+        .outerjoin(r, r.project_id == Project.id)
+        .filter(dashboard_project_filter(year, month))
     )
 
-    other_total = (
-        db.session.query(func.coalesce(func.sum(OtherExpense.amount), 0))
-        .filter(OtherExpense.project_id.in_(project_ids_subq))
-        .scalar()
-        or 0
+
+def dashboard_aggregates(year: int | None = None, month: int | None = None) -> dict:
+    """
+    Aggregate totals for dashboard (filtered by Project.start_date month/year,
+    fallback Project.created_at) — จำนวน query คงที่ ไม่ขึ้นกับจำนวนโครงการ
+    """
+    proj_filter = dashboard_project_filter(year, month)
+    project_ids_subq = select(Project.id).where(proj_filter)
+    r = ProjectCostRollup
+
+    totals = (
+        db.session.query(
+            func.coalesce(func.sum(r.materials_total), 0),
+            func.coalesce(func.sum(r.subs_payable_total), 0),
+            func.coalesce(func.sum(r.other_total), 0),
+            func.coalesce(func.sum(r.advances_total), 0),
+            func.coalesce(func.sum(r.grand_total), 0),
+        )
+        .filter(r.project_id.in_(project_ids_subq))
+        .one()
+    )
+    materials_total, subs_payable_total, other_total, advances_total, grand_total = (
+        float(v or 0) for v in totals
     )
 
-    advances_total = (
-        db.session.query(func.coalesce(func.sum(AdvanceExpense.amount), 0))
-        .filter(AdvanceExpense.project_id.in_(project_ids_subq))
+    # รายรับ = QT ที่ APPROVED และผูกกับโครงการในช่วงที่กรอง
+    income_total = float(
+        db.session.query(func.coalesce(func.sum(SalesDoc.stored_grand_total), 0))
+        .join(Project, Project.sales_doc_id == SalesDoc.id)
+        .filter(proj_filter)
+        .filter(SalesDoc.status == "APPROVED")
         .scalar()
         or 0
     )
@@ -337,109 +657,183 @@ def dashboard_aggregates(year: int | None = None, month: int | None = None) -> d
 
     status_rows = (
         db.session.query(Project.status, func.count(Project.id))
-        .filter(Project.id.in_(project_ids_subq))
+        .filter(proj_filter)
         .group_by(Project.status)
         .all()
     )
     projects_by_status = {s: int(n) for s, n in status_rows}
 
-    mat_rows = (
-        db.session.query(
-            MaterialItem.project_id.label("pid"),
-            func.coalesce(func.sum(MaterialItem.unit_price * MaterialItem.qty), 0).label("materials"),
-        )
-        .filter(MaterialItem.project_id.in_(project_ids_subq))
-        .group_by(MaterialItem.project_id)
-        .subquery()
-    )
+    return {
+        "materials": materials_total,
+        "subs": subs_payable_total,
+        "expenses": other_total,
+        "advances": advances_total,
+        "grand": grand_total,
+        "income": income_total,
+        "profit_loss": income_total - grand_total,
+        "other_by_category": other_by_category,
+        "projects_by_status": projects_by_status,
+    }
 
-    sub_rows = (
-        db.session.query(
-            SubcontractorPayment.project_id.label("pid"),
-            func.coalesce(
-                func.sum(SubcontractorPayment.contract_amount - SubcontractorPayment.withholding_amount),
-                0,
-            ).label("subs"),
+
+# ลำดับที่ ranked_projects รองรับ
+RANKED_PROJECT_ORDERS = ("total", "materials", "subs", "margin")
+
+
+def ranked_projects(
+    by: str = "total",
+    year: int | None = None,
+    month: int | None = None,
+    limit: int = 5,
+    ascending: bool = False,
+) -> list:
+    """
+    โครงการ top-N ตาม total / materials / subs / margin (ORDER BY + LIMIT ใน SQL)
+    - margin = ยอด QT ที่ APPROVED - ต้นทุนรวม
+    - ascending=True -> น้อยไปมาก (เช่น โครงการที่ขาดทุนมากสุด)
+    """
+    if by not in RANKED_PROJECT_ORDERS:
+        raise ValueError(f"by must be one of {RANKED_PROJECT_ORDERS}")
+
+    r = ProjectCostRollup
+    income = func.coalesce(SalesDoc.stored_grand_total, 0)
+    cost = func.coalesce(r.grand_total, 0)
+    sort_cols = {
+        "total": cost,
+        "materials": func.coalesce(r.materials_total, 0),
+        "subs": func.coalesce(r.subs_payable_total, 0),
+        "margin": income - cost,
+    }
+    sort_col = sort_cols[by]
+
+    q = (
+        dashboard_project_rows(year, month)
+        .add_columns(income.label("income"), (income - cost).label("margin"))
+        .outerjoin(
+            SalesDoc,
+            and_(SalesDoc.id == Project.sales_doc_id, SalesDoc.status == "APPROVED"),
         )
-        .filter(SubcontractorPayment.project_id.in_(project_ids_subq))
-        .group_by(SubcontractorPayment.project_id)
-        .subquery()
+        .order_by(sort_col.asc() if ascending else sort_col.desc(), Project.id.asc())
+        .limit(int(limit))
     )
 
-    oth_rows = (
-        db.session.query(
-            OtherExpense.project_id.label("pid"),
-            func.coalesce(func.sum(OtherExpense.amount), 0).label("expenses"),
-        )
-        .filter(OtherExpense.project_id.in_(project_ids_subq))
-        .group_by(OtherExpense.project_id)
-        .subquery()
+    return [
+        {
+            "id": row.id,
+            "code": row.code,
+            "name": row.name,
+            "materials": float(row.materials or 0),
+            "subs": float(row.subs or 0),
+            "expenses": float(row.expenses or 0),
+            "advances": float(row.advances or 0),
+            "total": float(row.total or 0),
+            "income": float(row.income or 0),
+            "margin": float(row.margin or 0),
+        }
+        for row in q.all()
+    ]
+
+
+def _expense_sources() -> tuple:
+    """
+    (key, model, วันที่ที่ใช้นับเดือน, ยอดเงินต่อแถว) ของรายจ่ายทั้ง 4 ประเภท
+    - วันที่: ใช้วันที่จริงของรายการก่อน -> fallback created_at
+    """
+    sub_net = SubcontractorPayment.contract_amount - SubcontractorPayment.withholding_amount
+    return (
+        (
+            "materials",
+            MaterialItem,
+            MaterialItem.created_at,
+            MaterialItem.unit_price * MaterialItem.qty,
+        ),
+        (
+            "subs",
+            SubcontractorPayment,
+            func.coalesce(SubcontractorPayment.pay_date, SubcontractorPayment.created_at),
+            case((sub_net > 0, sub_net), else_=0),
+        ),
+        (
+            "other",
+            OtherExpense,
+            func.coalesce(OtherExpense.expense_date, OtherExpense.created_at),
+            OtherExpense.amount,
+        ),
+        (
+            "advances",
+            AdvanceExpense,
+            func.coalesce(AdvanceExpense.advance_date, AdvanceExpense.created_at),
+            AdvanceExpense.amount,
+        ),
     )
 
-    adv_rows = (
-        db.session.query(
-            AdvanceExpense.project_id.label("pid"),
-            func.coalesce(func.sum(AdvanceExpense.amount), 0).label("advances"),
+
+def expense_month_dates() -> dict:
+    """{"materials" | "subs" | "other" | "advances": SQL expression วันที่ที่ใช้นับเดือน}"""
+    return {key: month_date for key, _model, month_date, _amount in _expense_sources()}
+
+
+def expense_monthly_aggregates(year: int) -> dict:
+    """
+    รายจ่ายรายเดือนของปีที่เลือก (GROUP BY เดือน ใน SQL)
+    return {"materials": {month: (total, count)}, "subs": ..., "other": ..., "advances": ...}
+    - กรองปีด้วยช่วงวันที่ (>= 1 ม.ค. และ < 1 ม.ค. ปีถัดไป) เพื่อให้ใช้ index ได้
+    """
+    start = date(int(year), 1, 1)
+    end = date(int(year) + 1, 1, 1)
+
+    out = {}
+    for key, model, month_date, amount in _expense_sources():
+        month_col = func.extract("month", month_date)
+        rows = (
+            db.session.query(
+                month_col.label("m"),
+                func.coalesce(func.sum(amount), 0).label("total"),
+                func.count(model.id).label("n"),
+            )
+            .filter(month_date >= start)
+            .filter(month_date < end)
+            .group_by(month_col)
+            .all()
         )
-        .filter(AdvanceExpense.project_id.in_(project_ids_subq))
-        .group_by(AdvanceExpense.project_id)
-        .subquery()
-    )
+        out[key] = {int(r.m): (float(r.total or 0), int(r.n or 0)) for r in rows}
+    return out
+
+
+def income_monthly_aggregates(year: int) -> dict:
+    """
+    รายรับรายเดือน (IV ที่ APPROVED) ของปีที่เลือก -> 1 query (GROUP BY เดือน)
+    return {month: {"gross", "vat", "wht", "net", "count"}}
+    """
+    start = date(int(year), 1, 1)
+    end = date(int(year) + 1, 1, 1)
+    month_col = func.extract("month", SalesDoc.issue_date)
 
-    top5_q = (
+    rows = (
         db.session.query(
-            Project.code.label("code"),
-            Project.name.label("name"),
-            func.coalesce(mat_rows.c.materials, 0).label("materials"),
-            func.coalesce(sub_rows.c.subs, 0).label("subs"),
-            func.coalesce(oth_rows.c.expenses, 0).label("expenses"),
-            func.coalesce(adv_rows.c.advances, 0).label("advances"),
-            (
-                func.coalesce(mat_rows.c.materials, 0)
-                + func.coalesce(sub_rows.c.subs, 0)
-                + func.coalesce(oth_rows.c.expenses, 0)
-                + func.coalesce(adv_rows.c.advances, 0)
-            ).label("total"),
-        )
-        .filter(Project.id.in_(project_ids_subq))
-        .outerjoin(mat_rows, mat_rows.c.pid == Project.id)
-        .outerjoin(sub_rows, sub_rows.c.pid == Project.id)
-        .outerjoin(oth_rows, oth_rows.c.pid == Project.id)
-        .outerjoin(adv_rows, adv_rows.c.pid == Project.id)
-        .order_by(
-            (
-                func.coalesce(mat_rows.c.materials, 0)
-                + func.coalesce(sub_rows.c.subs, 0)
-                + func.coalesce(oth_rows.c.expenses, 0)
-                + func.coalesce(adv_rows.c.advances, 0)
-            ).desc()
+            month_col.label("m"),
+            func.coalesce(func.sum(SalesDoc.stored_gross_total), 0).label("gross"),
+            func.coalesce(func.sum(SalesDoc.stored_vat_amount), 0).label("vat"),
+            func.coalesce(func.sum(SalesDoc.stored_wht_amount), 0).label("wht"),
+            func.coalesce(func.sum(SalesDoc.stored_grand_total), 0).label("net"),
+            func.count(SalesDoc.id).label("n"),
         )
-        .limit(5)
-    )
-
-    top5 = []
-    for r in top5_q.all():
-        top5.append(
-            {
-                "code": r.code,
-                "name": r.name,
-                "materials": float(r.materials or 0),
-                "subs": float(r.subs or 0),
-                "expenses": float(r.expenses or 0),
-                "advances": float(r.advances or 0),
-                "total": float(r.total or 0),
-            }
-        )
-
+        .filter(SalesDoc.doc_type == "IV")
+        .filter(SalesDoc.status == "APPROVED")
+        .filter(SalesDoc.issue_date >= start)
+        .filter(SalesDoc.issue_date < end)
+        .group_by(month_col)
+        .all()
+    )
     return {
-        "materials": float(materials_total),
-        "subs": float(subs_payable_total),
-        "expenses": float(other_total),
-        "advances": float(advances_total),
-        "grand": float(materials_total + subs_payable_total + other_total + advances_total),
-        "other_by_category": other_by_category,
-        "projects_by_status": projects_by_status,
-        "top5": top5,
+        int(r.m): {
+            "gross": float(r.gross or 0),
+            "vat": float(r.vat or 0),
+            "wht": float(r.wht or 0),
+            "net": float(r.net or 0),
+            "count": int(r.n or 0),
+        }
+        for r in rows
     }
 
 
@@ -478,6 +872,63 @@ class CompanyProfile(db.Model, TimestampMixin):
 # =========================================================
 # Sales docs & items
 # =========================================================
+@dataclass(frozen=True)
+class DocTotals:
+    """
+    ยอดเงินของเอกสารขาย (QT/IV/RC/BL)
+    - subtotal = sum(qty*unit - line_discount)
+    - net_before_tax = subtotal - discount_total
+    - WHT คิดก่อน VAT: net_after_wht = net_before_tax - wht_amount
+    - VAT = net_after_wht * vat_rate
+    - grand_total = gross_total = net_after_wht + vat_amount
+    """
+
+    vat_rate: Decimal
+    wht_rate: Decimal
+    subtotal: Decimal
+    discount_total: Decimal
+    net_before_tax: Decimal
+    wht_amount: Decimal
+    net_after_wht: Decimal
+    vat_amount: Decimal
+    gross_total: Decimal
+    grand_total: Decimal
+
+    @classmethod
+    def compute(cls, doc: "SalesDoc") -> "DocTotals":
+        d, q2 = SalesDoc._d, SalesDoc._q2
+        zero = Decimal("0")
+
+        total = zero
+        for it in (doc.items or []):
+            total += (d(it.qty) * d(it.unit_price)) - d(it.discount_amount)
+
+        subtotal = q2(max(total, zero))
+        discount_total = q2(max(d(doc.discount_amount), zero))
+        net_before_tax = q2(max(subtotal - discount_total, zero))
+
+        vat_rate = d(doc.vat_rate)
+        wht_rate = d(doc.wht_rate)
+
+        wht_amount = q2(max((net_before_tax * wht_rate) / Decimal("100"), zero))
+        net_after_wht = q2(max(net_before_tax - wht_amount, zero))
+        vat_amount = q2(max((net_after_wht * vat_rate) / Decimal("100"), zero))
+        gross_total = q2(max(net_after_wht + vat_amount, zero))
+
+        return cls(
+            vat_rate=vat_rate,
+            wht_rate=wht_rate,
+            subtotal=subtotal,
+            discount_total=discount_total,
+            net_before_tax=net_before_tax,
+            wht_amount=wht_amount,
+            net_after_wht=net_after_wht,
+            vat_amount=vat_amount,
+            gross_total=gross_total,
+            grand_total=gross_total,
+        )
+
+
 class SalesDoc(db.Model, TimestampMixin):
     __tablename__ = "sales_docs"
 
@@ -532,8 +983,20 @@ class SalesDoc(db.Model, TimestampMixin):
     boq_excel_path = db.Column(db.String(255), nullable=True)
     boq_pdf_path = db.Column(db.String(255), nullable=True)
 
+    # ✅ ยอดเงินที่บันทึกไว้ (คำนวณใหม่อัตโนมัติตอน flush) -> ใช้ทำ dashboard / SUM ใน SQL
+    # NOTE: ชื่อ attribute ต่างจากชื่อคอลัมน์ เพราะ property ด้านล่าง (subtotal ฯลฯ) คำนวณสดจาก items
+    stored_subtotal = db.Column("subtotal", db.Numeric(14, 2), nullable=False, default=0)
+    stored_vat_amount = db.Column("vat_amount", db.Numeric(14, 2), nullable=False, default=0)
+    stored_wht_amount = db.Column("wht_amount", db.Numeric(14, 2), nullable=False, default=0)
+    stored_gross_total = db.Column("gross_total", db.Numeric(14, 2), nullable=False, default=0)
+    stored_grand_total = db.Column("grand_total", db.Numeric(14, 2), nullable=False, default=0)
+
     items = db.relationship("SalesItem", backref="doc", cascade="all, delete-orphan", lazy=True)
 
+    __table_args__ = (
+        Index("ix_sales_docs_type_status_issue_date", "doc_type", "status", "issue_date"),
+    )
+
     @staticmethod
     def _d(v) -> Decimal:
         if v is None:
@@ -555,68 +1018,60 @@ class SalesDoc(db.Model, TimestampMixin):
         except Exception:
             return v
 
+    # -------------------------------------------------
+    # ✅ Totals: คำนวณครั้งเดียว (1 รอบ items) แล้ว cache ไว้บน instance
+    # - cache ถูกล้างเมื่อ items / discount / vat_rate / wht_rate เปลี่ยน (ดู events ด้านล่าง)
+    # -------------------------------------------------
+    @property
+    def totals(self) -> "DocTotals":
+        cached = self.__dict__.get("_totals_cache")
+        if cached is None:
+            cached = DocTotals.compute(self)
+            self.__dict__["_totals_cache"] = cached
+        return cached
+
+    def invalidate_totals(self) -> None:
+        self.__dict__.pop("_totals_cache", None)
+
     @property
     def subtotal(self) -> Decimal:
-        total = Decimal("0")
-        for it in (self.items or []):
-            qty = self._d(getattr(it, "qty", 0))
-            price = self._d(getattr(it, "unit_price", 0))
-            disc = self._d(getattr(it, "discount_amount", 0))
-            total += (qty * price) - disc
-        if total < 0:
-            total = Decimal("0")
-        return self._q2(total)
+        return self.totals.subtotal
 
     @property
     def discount_total(self) -> Decimal:
-        v = self._d(self.discount_amount)
-        if v < 0:
-            v = Decimal("0")
-        return self._q2(v)
+        return self.totals.discount_total
 
     @property
     def net_before_tax(self) -> Decimal:
-        v = self.subtotal - self.discount_total
-        if v < 0:
-            v = Decimal("0")
-        return self._q2(v)
+        return self.totals.net_before_tax
 
     @property
     def wht_amount(self) -> Decimal:
-        rate = self._d(self.wht_rate)
-        v = (self.net_before_tax * rate) / Decimal("100")
-        if v < 0:
-            v = Decimal("0")
-        return self._q2(v)
+        return self.totals.wht_amount
 
     @property
     def net_after_wht(self) -> Decimal:
-        v = self.net_before_tax - self.wht_amount
-        if v < 0:
-            v = Decimal("0")
-        return self._q2(v)
+        return self.totals.net_after_wht
 
     @property
     def vat_amount(self) -> Decimal:
-        rate = self._d(self.vat_rate)
-        v = (self.net_after_wht * rate) / Decimal("100")
-        if v < 0:
-            v = Decimal("0")
-        return self._q2(v)
+        return self.totals.vat_amount
 
     @property
     def gross_total(self) -> Decimal:
-        v = self.net_after_wht + self.vat_amount
-        if v < 0:
-            v = Decimal("0")
-        return self._q2(v)
+        return self.totals.gross_total
 
     @property
     def grand_total(self) -> Decimal:
-        v = self.gross_total
-        if v < 0:
-            v = Decimal("0")
-        return self._q2(v)
+        return self.totals.grand_total
+
+    def refresh_stored_totals(self) -> None:
+        t = self.totals
+        self.stored_subtotal = t.subtotal
+        self.stored_vat_amount = t.vat_amount
+        self.stored_wht_amount = t.wht_amount
+        self.stored_gross_total = t.gross_total
+        self.stored_grand_total = t.grand_total
 
     @staticmethod
     def next_doc_no(doc_type: str = "QT") -> str:
@@ -658,6 +1113,343 @@ class SalesItem(db.Model, TimestampMixin):
             return 0
 
 
+# ---------------------------------------------------------
+# ✅ ล้าง DocTotals cache เมื่อข้อมูลที่ใช้คำนวณเปลี่ยน
+# ---------------------------------------------------------
+def _invalidate_doc_totals(target, *args):
+    target.invalidate_totals()
+
+
+def _invalidate_item_doc_totals(target, *args):
+    doc = target.doc
+    if doc is not None:
+        doc.invalidate_totals()
+
+
+for _attr in (SalesDoc.discount_amount, SalesDoc.vat_rate, SalesDoc.wht_rate):
+    event.listen(_attr, "set", _invalidate_doc_totals)
+
+for _evt in ("append", "remove", "bulk_replace"):
+    event.listen(SalesDoc.items, _evt, _invalidate_doc_totals)
+
+for _evt in ("load", "refresh", "expire"):
+    event.listen(SalesDoc, _evt, _invalidate_doc_totals)
+
+for _attr in (SalesItem.qty, SalesItem.unit_price, SalesItem.discount_amount):
+    event.listen(_attr, "set", _invalidate_item_doc_totals)
+
+
+def _item_doc(session, item: SalesItem) -> SalesDoc | None:
+    """
+    เอกสารของรายการ: ตาม relationship ก่อน -> fallback doc_id
+    (SalesItem(doc_id=...) ที่ add เข้า session ตรง ๆ ยังไม่มี obj.doc ตอน flush)
+    """
+    if item.doc is not None:
+        return item.doc
+    if item.doc_id is None:
+        return None
+    return session.get(SalesDoc, item.doc_id)
+
+
+@event.listens_for(db.session, "before_flush")
+def _sales_doc_totals_before_flush(session, flush_context, instances):
+    docs = set()
+    item_changed = set()
+
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, SalesDoc):
+            docs.add(obj)
+        elif isinstance(obj, SalesItem):
+            doc = _item_doc(session, obj)
+            if doc is None:
+                continue
+            # ✅ รายการใหม่ที่ผูกด้วย doc_id อย่างเดียว -> ใส่เข้า doc.items ให้ยอดรวมนับด้วย
+            if obj not in doc.items:
+                doc.items.append(obj)
+            docs.add(doc)
+            item_changed.add(doc)
+
+    for obj in list(session.deleted):
+        if isinstance(obj, SalesItem):
+            doc = _item_doc(session, obj)
+            if doc is None:
+                continue
+            if obj in doc.items:
+                doc.items.remove(obj)
+            docs.add(doc)
+            item_changed.add(doc)
+
+    for doc in docs:
+        if doc in session.deleted:
+            continue
+        doc.refresh_stored_totals()
+        # ✅ แก้รายการ = เอกสารเปลี่ยน (updated_at ใช้เป็น cache key ของ PDF)
+        if doc in item_changed:
+            doc.updated_at = datetime.utcnow()
+
+
+# =========================================================
+# Monthly rollups (กราฟแนวโน้มหลายปี)
+# =========================================================
+class MonthlyRollup(db.Model):
+    """
+    ✅ ยอดรวมรายเดือนต่อ metric (1 แถว / metric / เดือน)
+    - /api/reports/timeseries อ่านจากตารางนี้ -> กราฟ 5 ปี = 60 แถว ไม่ต้อง scan รายการย่อย
+    - อัปเดตอัตโนมัติทุกครั้งที่ flush รายจ่ายทั้ง 4 ประเภท / SalesDoc
+    """
+    __tablename__ = "monthly_rollups"
+
+    metric = db.Column(db.String(20), primary_key=True)
+    period = db.Column(db.Date, primary_key=True)  # วันที่ 1 ของเดือน
+
+    total = db.Column(db.Numeric(16, 2), nullable=False, default=0)
+    row_count = db.Column(db.Integer, nullable=False, default=0)
+
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self) -> str:
+        return f"<MonthlyRollup {self.metric} {self.period} {self.total}>"
+
+
+# metric ที่เก็บในตาราง ("expense" = ผลรวมของ 4 ประเภทรายจ่าย คำนวณตอน query)
+MONTHLY_ROLLUP_METRICS = ("income", "materials", "subs", "other", "advances")
+EXPENSE_METRICS = ("materials", "subs", "other", "advances")
+TIMESERIES_METRICS = ("income", "expense") + EXPENSE_METRICS
+
+
+def _month_start(d) -> date:
+    return date(d.year, d.month, 1)
+
+
+def _next_month(d) -> date:
+    return date(d.year + 1, 1, 1) if d.month == 12 else date(d.year, d.month + 1, 1)
+
+
+def _monthly_rollup_sources() -> dict:
+    """
+    metric -> (model, วันที่ที่ใช้นับเดือน, ยอดเงินต่อแถว, เงื่อนไขเพิ่มเติม)
+    - รายจ่าย: ใช้นิยามเดียวกับหน้า /dashboard/expense
+    - รายรับ: IV ที่ APPROVED ตาม issue_date (เหมือนหน้า /dashboard/income)
+    """
+    out = {key: (model, month_date, amount, ()) for key, model, month_date, amount in _expense_sources()}
+    out["income"] = (
+        SalesDoc,
+        SalesDoc.issue_date,
+        SalesDoc.stored_gross_total,
+        (SalesDoc.doc_type == "IV", SalesDoc.status == "APPROVED"),
+    )
+    return out
+
+
+def refresh_monthly_rollups(connection, metric: str, periods=None) -> None:
+    """
+    คำนวณ monthly_rollups ของ metric ใหม่จาก SQL (GROUP BY เดือน)
+    - periods: วันที่ใดๆ ในเดือนที่ต้องคำนวณ (None = rebuild ทั้ง metric)
+    """
+    if periods is not None:
+        periods = sorted({_month_start(p) for p in periods if p is not None})
+        if not periods:
+            return
+
+    model, month_date, amount, conds = _monthly_rollup_sources()[metric]
+    y = func.extract("year", month_date)
+    m = func.extract("month", month_date)
+
+    q = select(
+        y.label("y"),
+        m.label("m"),
+        func.coalesce(func.sum(amount), 0).label("total"),
+        func.count(model.id).label("n"),
+    ).where(month_date.isnot(None))
+    for cond in conds:
+        q = q.where(cond)
+    if periods is not None:
+        # ช่วงวันที่ของแต่ละเดือน -> ใช้ index ของวันที่ได้
+        q = q.where(or_(*[and_(month_date >= p, month_date < _next_month(p)) for p in periods]))
+    rows = connection.execute(q.group_by(y, m)).all()
+
+    t = MonthlyRollup.__table__
+    now = datetime.utcnow()
+    values = [
+        {
+            "metric": metric,
+            "period": date(int(r.y), int(r.m), 1),
+            "total": r.total or 0,
+            "row_count": int(r.n or 0),
+            "updated_at": now,
+        }
+        for r in rows
+        if r.n
+    ]
+
+    columns = ("metric", "period", "total", "row_count", "updated_at")
+    upsert = _upsert_insert(connection, t, ("metric", "period"), columns)
+    if upsert is None:
+        delete_stmt = t.delete().where(t.c.metric == metric)
+        if periods is not None:
+            delete_stmt = delete_stmt.where(t.c.period.in_(periods))
+        connection.execute(delete_stmt)
+        if values:
+            connection.execute(t.insert(), values)
+        return
+
+    # ✅ upsert ตาม (metric, period): 2 transaction เขียนเดือนเดียวกันพร้อมกัน ไม่ชน primary key
+    # เดือนที่ไม่เหลือรายการแล้ว -> ลบ (ไม่มีแถวให้ชน)
+    kept = [v["period"] for v in values]
+    empty = t.delete().where(t.c.metric == metric)
+    if periods is not None:
+        empty = empty.where(t.c.period.in_([p for p in periods if p not in kept]))
+    elif kept:
+        empty = empty.where(t.c.period.notin_(kept))
+    if periods is None or len(kept) < len(periods):
+        connection.execute(empty)
+    if values:
+        stmt, finish = upsert
+        connection.execute(finish(stmt), values)
+
+
+# model -> (metric, ชื่อ field วันที่, fallback created_at ถ้าวันที่ว่าง)
+_MONTHLY_ROLLUP_MODELS = {
+    MaterialItem: ("materials", None, True),
+    SubcontractorPayment: ("subs", "pay_date", True),
+    OtherExpense: ("other", "expense_date", True),
+    AdvanceExpense: ("advances", "advance_date", True),
+    SalesDoc: ("income", "issue_date", False),
+}
+
+
+def _rollup_periods_of(obj, date_attr, use_created_at) -> set:
+    """เดือนที่ obj อยู่ ทั้งค่าปัจจุบันและค่าเดิมก่อนแก้ (ย้ายเดือน -> ต้องคำนวณทั้ง 2 เดือน)"""
+    created = obj.created_at if use_created_at else None
+    values = [None]
+    if date_attr:
+        values = [getattr(obj, date_attr)]
+        values += list(inspect(obj).attrs[date_attr].history.deleted or ())
+    return {_month_start(v or created) for v in values if (v or created)}
+
+
+def _keep_old_month(target, value, oldvalue, initiator):
+    return value
+
+
+# active_history: โหลดค่าวันที่เดิมก่อนแก้ แม้ object ถูก expire (เช่นหลัง commit)
+# -> history.deleted มีเดือนเดิมเสมอ
+for _model, (_metric, _date_attr, _fallback) in _MONTHLY_ROLLUP_MODELS.items():
+    if _date_attr:
+        event.listen(
+            getattr(_model, _date_attr), "set", _keep_old_month, active_history=True, retval=True
+        )
+
+
+@event.listens_for(db.session, "after_flush")
+def _monthly_rollups_after_flush(session, flush_context):
+    periods = {}
+    rebuild = set()
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        spec = _MONTHLY_ROLLUP_MODELS.get(type(obj))
+        if spec is None:
+            continue
+        metric, date_attr, use_created_at = spec
+        if metric in rebuild:
+            continue
+        try:
+            periods.setdefault(metric, set()).update(
+                _rollup_periods_of(obj, date_attr, use_created_at)
+            )
+        except Exception:
+            # อ่านวันที่ของแถวที่ถูกลบไม่ได้ -> rebuild ทั้ง metric (เกิดน้อยมาก)
+            rebuild.add(metric)
+
+    if not periods and not rebuild:
+        return
+
+    conn = session.connection()
+    for metric in rebuild:
+        refresh_monthly_rollups(conn, metric)
+    for metric, ps in periods.items():
+        if metric not in rebuild:
+            refresh_monthly_rollups(conn, metric, ps)
+
+
+# =========================================================
+# Bulk insert รายการย่อยของโครงการ (import / ฟอร์มที่มีหลายพันแถว)
+# =========================================================
+BULK_CHILD_MODELS = (MaterialItem, SubcontractorPayment, OtherExpense, AdvanceExpense)
+
+
+def bulk_insert_project_children(connection, project_id: int, rows_by_model: dict) -> dict:
+    """
+    ✅ INSERT รายการย่อยด้วย Core: 1 statement ต่อ model (executemany + RETURNING id)
+    - SQLAlchemy 2.0 รวมเป็น multi-row VALUES ให้เอง (insertmanyvalues) ทั้ง SQLite / psycopg
+    - rows_by_model: {MaterialItem: [dict ค่าของ column, ...], ...} (ไม่ต้องใส่ project_id)
+    - ไม่ผ่าน unit of work -> flush events ไม่ทำงาน: refresh rollups ของโครงการ + เดือนที่โดน
+      updated_at ของโครงการ ในนี้ + คิว change_log ไว้เขียนตอน commit
+    -> {model: [id ที่สร้าง เรียงน้อยไปมาก]}
+       (ไม่ขอ RETURNING เรียงตาม rows: SQLite จะถอยไป INSERT ทีละแถว)
+    """
+    now = datetime.utcnow()
+    out = {}
+    for model, rows in rows_by_model.items():
+        if model not in BULK_CHILD_MODELS:
+            raise ValueError(f"bulk insert ไม่รองรับ {model.__name__}")
+        if not rows:
+            continue
+
+        t = model.__table__
+        params = [{**r, "project_id": project_id, "created_at": now, "updated_at": now} for r in rows]
+        result = connection.execute(t.insert().returning(t.c.id), params)
+        out[model] = sorted(result.scalars().all())
+
+        metric, date_attr, _fallback = _MONTHLY_ROLLUP_MODELS[model]
+        periods = {r.get(date_attr) or now for r in rows} if date_attr else {now}
+        refresh_monthly_rollups(connection, metric, periods)
+
+    if out:
+        refresh_project_cost_rollups(connection, [project_id])
+        t = Project.__table__
+        connection.execute(t.update().where(t.c.id == project_id).values(updated_at=now))
+        queue_changes(
+            db.session,
+            [("projects", project_id, "U")]
+            + [(_SYNC_ENTITY_OF[model], i, "U") for model, ids in out.items() for i in ids],
+        )
+    return out
+
+
+def monthly_timeseries(metric: str, start: date, end: date) -> list:
+    """
+    ยอดรายเดือนของ metric ตั้งแต่เดือน start ถึงเดือน end (รวมทั้ง 2 เดือน)
+    return [{"period": "YYYY-MM", "total": float, "count": int}, ...] (เดือนที่ไม่มีข้อมูล = 0)
+    """
+    start = _month_start(start)
+    end = _month_start(end)
+    metrics = EXPENSE_METRICS if metric == "expense" else (metric,)
+
+    r = MonthlyRollup
+    rows = (
+        db.session.query(
+            r.period,
+            func.coalesce(func.sum(r.total), 0).label("total"),
+            func.coalesce(func.sum(r.row_count), 0).label("n"),
+        )
+        .filter(r.metric.in_(metrics))
+        .filter(r.period >= start)
+        .filter(r.period <= end)
+        .group_by(r.period)
+        .all()
+    )
+    by_period = {_month_start(row.period): (float(row.total or 0), int(row.n or 0)) for row in rows}
+
+    out = []
+    p = start
+    while p <= end:
+        total, n = by_period.get(p, (0.0, 0))
+        out.append({"period": p.strftime("%Y-%m"), "total": round(total, 2), "count": n})
+        p = _next_month(p)
+    return out
+
+
 # =========================================================
 # ✅ Withholding master data (NEW)
 # =========================================================
@@ -819,3 +1611,300 @@ class WithholdingCertificate(db.Model, TimestampMixin):
             except Exception:
                 last_no = 0
         return f"{head}{last_no + 1:04d}"
+
+
+# =========================================================
+# Withholding filing (ใบแนบ ภ.ง.ด.3 / ภ.ง.ด.53 รายเดือน)
+# =========================================================
+def withholding_filing_summary(start: date | None = None, end: date | None = None, form_type: str | None = None) -> list:
+    """
+    ✅ ยอดรวมต่อ (แบบ, เดือนที่จ่าย) — GROUP BY ใน SQL
+    - start / end: ช่วงวันที่จ่าย [start, end)
+    return [{"form_type", "period": date(วันที่ 1), "count", "base_total", "wht_total"}]
+    """
+    WC = WithholdingCertificate
+    y = func.extract("year", WC.payment_date)
+    m = func.extract("month", WC.payment_date)
+
+    q = select(
+        WC.form_type,
+        y.label("y"),
+        m.label("m"),
+        func.count(WC.id).label("n"),
+        func.coalesce(func.sum(WC.base_amount), 0).label("base_total"),
+        func.coalesce(func.sum(WC.wht_amount), 0).label("wht_total"),
+    ).where(WC.is_active.is_(True))
+    if form_type:
+        q = q.where(WC.form_type == form_type)
+    if start:
+        q = q.where(WC.payment_date >= start)
+    if end:
+        q = q.where(WC.payment_date < end)
+
+    rows = db.session.execute(q.group_by(WC.form_type, y, m).order_by(y, m, WC.form_type)).all()
+    return [
+        {
+            "form_type": r.form_type,
+            "period": date(int(r.y), int(r.m), 1),
+            "count": int(r.n or 0),
+            "base_total": Decimal(str(r.base_total or 0)),
+            "wht_total": Decimal(str(r.wht_total or 0)),
+        }
+        for r in rows
+    ]
+
+
+def withholding_filing_rows(form_type: str | None = None, start: date | None = None, end: date | None = None):
+    """
+    ✅ select รายการสำหรับยื่นแบบ: query เดียว join ผู้ถูกหัก (บุคคล / นิติบุคคล)
+    - ไม่โหลด ORM object -> ใช้กับ yield_per ได้ (ใบแนบ / e-Filing)
+    - เรียงตามวันที่จ่าย แล้วเลขที่เอกสาร
+    """
+    WC = WithholdingCertificate
+    P = WithholdingPerson
+    E = WithholdingEntity
+
+    q = (
+        select(
+            WC.id,
+            WC.form_type,
+            WC.doc_no,
+            WC.payee_kind,
+            WC.payment_date,
+            WC.income_type,
+            WC.description,
+            WC.base_amount,
+            WC.wht_rate,
+            WC.wht_amount,
+            case((WC.payee_kind == "ENTITY", E.company_name), else_=P.full_name).label("payee_name"),
+            case((WC.payee_kind == "ENTITY", E.tax_id), else_=P.tax_id).label("payee_tax_id"),
+            case((WC.payee_kind == "ENTITY", E.address), else_=P.address).label("payee_address"),
+        )
+        .outerjoin(P, P.id == WC.payee_person_id)
+        .outerjoin(E, E.id == WC.payee_entity_id)
+        .where(WC.is_active.is_(True))
+    )
+    if form_type:
+        q = q.where(WC.form_type == form_type)
+    if start:
+        q = q.where(WC.payment_date >= start)
+    if end:
+        q = q.where(WC.payment_date < end)
+
+    return q.order_by(WC.payment_date.asc(), WC.doc_no.asc(), WC.id.asc())
+
+
+# =========================================================
+# Background jobs (ดู app/utils/jobs.py)
+# =========================================================
+class Job(db.Model):
+    """
+    ✅ งานหนักที่ทำเบื้องหลัง (export / PDF ชุด / rebuild rollups)
+    - status: QUEUED -> RUNNING -> DONE / FAILED
+    - ไฟล์ผลลัพธ์อยู่ที่ result_path และถูกลบเมื่อเลย expires_at
+    """
+    __tablename__ = "jobs"
+
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    kind = db.Column(db.String(40), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default="QUEUED")
+    params = db.Column(db.JSON, nullable=True)
+
+    progress = db.Column(db.Integer, nullable=False, default=0)  # 0-100
+    message = db.Column(db.String(200), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+
+    result_path = db.Column(db.String(500), nullable=True)
+    result_name = db.Column(db.String(200), nullable=True)
+    result_mimetype = db.Column(db.String(100), nullable=True)
+
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_jobs_status_created_at", "status", "created_at"),
+        Index("ix_jobs_expires_at", "expires_at"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<Job {self.id} {self.kind} {self.status}>"
+
+
+# =========================================================
+# Change log (delta sync ของ PWA offline: GET /api/sync)
+# =========================================================
+class ChangeLog(db.Model):
+    """
+    ✅ บันทึกว่าแถวไหนถูกสร้าง/แก้/ลบ (เก็บจาก flush events + bulk insert ไม่ต้องแก้ทุก route)
+    - id = change token (เพิ่มขึ้นเรื่อยๆ) client เก็บ token ล่าสุดแล้วถามเฉพาะที่ใหม่กว่า
+    - INSERT ตอน commit (ไม่ใช่ตอน flush) -> token เรียงตามลำดับ commit ดู _change_log_before_commit
+    - op: U = สร้าง/แก้ (ส่งค่าปัจจุบันของแถว), D = ลบ
+    """
+    __tablename__ = "change_log"
+
+    # SQLite autoincrement ได้เฉพาะ INTEGER PRIMARY KEY
+    id = db.Column(db.BigInteger().with_variant(db.Integer, "sqlite"), primary_key=True)
+    entity = db.Column(db.String(30), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(1), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (Index("ix_change_log_changed_at", "changed_at"),)
+
+    def __repr__(self) -> str:
+        return f"<ChangeLog {self.id} {self.op} {self.entity}:{self.entity_id}>"
+
+
+# ชื่อ entity ใน /api/sync -> model
+SYNC_ENTITIES = {
+    "projects": Project,
+    "materials": MaterialItem,
+    "subcontractors": SubcontractorPayment,
+    "expenses": OtherExpense,
+    "advances": AdvanceExpense,
+    "customers": Customer,
+    "sales_docs": SalesDoc,
+    "sales_items": SalesItem,
+}
+_SYNC_ENTITY_OF = {model: name for name, model in SYNC_ENTITIES.items()}
+
+
+# pg_advisory_xact_lock key ของการเขียน change_log (ค่าคงที่ใดๆ ที่ไม่ชนกับ lock อื่นของแอป)
+CHANGE_LOG_LOCK_KEY = 0x636C6F67
+
+
+def log_changes(connection, entries) -> None:
+    """entries: [(entity, entity_id, op), ...] -> INSERT ครั้งเดียว (executemany)"""
+    now = datetime.utcnow()
+    rows = [{"entity": e, "entity_id": i, "op": op, "changed_at": now} for e, i, op in entries]
+    if rows:
+        connection.execute(ChangeLog.__table__.insert(), rows)
+
+
+def queue_changes(session, entries) -> None:
+    """entries: [(entity, entity_id, op), ...] -> เขียนลง change_log ตอน session commit"""
+    session.info.setdefault("_change_log", []).extend(entries)
+
+
+def _queue_change(target, op: str) -> None:
+    session = inspect(target).session
+    if session is not None:
+        queue_changes(session, [(_SYNC_ENTITY_OF[type(target)], target.id, op)])
+
+
+def _change_after_insert(mapper, connection, target):
+    _queue_change(target, "U")
+
+
+def _change_after_update(mapper, connection, target):
+    # after_update ถูกเรียกกับทุก object ที่ dirty แม้ค่าไม่เปลี่ยน (เช่น set ค่าเดิม) -> ข้าม
+    session = inspect(target).session
+    if session is not None and session.is_modified(target, include_collections=False):
+        _queue_change(target, "U")
+
+
+def _change_after_delete(mapper, connection, target):
+    _queue_change(target, "D")
+
+
+for _model in SYNC_ENTITIES.values():
+    event.listen(_model, "after_insert", _change_after_insert)
+    event.listen(_model, "after_update", _change_after_update)
+    event.listen(_model, "after_delete", _change_after_delete)
+
+
+@event.listens_for(db.session, "before_commit")
+def _change_log_before_commit(session):
+    """
+    ✅ token ต้องเรียงตามลำดับ commit ไม่ใช่ลำดับ flush
+    ถ้า INSERT ตอน flush: transaction ที่เปิดค้างนานได้ token ต่ำกว่าของที่ commit ไปแล้ว
+    -> client ที่ sync ผ่าน token นั้นไปแล้วจะไม่เห็นการเปลี่ยนแปลงนี้เลย
+    - flush ที่เหลือก่อน แล้วค่อย INSERT log ทั้ง transaction ทีเดียว
+    - PostgreSQL: ถือ advisory lock ตั้งแต่ INSERT จน commit เสร็จ (ปล่อยหลังข้อมูลมองเห็นแล้ว)
+      -> transaction ถัดไปได้ token หลัง commit ก่อนหน้าเสมอ (รอแค่ช่วง INSERT -> COMMIT)
+    - SQLite: มี writer ได้ทีละ transaction อยู่แล้ว
+    """
+    session.flush()
+    entries = session.info.pop("_change_log", None)
+    if not entries:
+        return
+    # แถวเดียวกันหลาย event ใน transaction เดียว -> เก็บอันสุดท้าย
+    latest = {(e, i): op for e, i, op in entries}
+    connection = session.connection()
+    if connection.dialect.name == "postgresql":
+        connection.execute(select(func.pg_advisory_xact_lock(CHANGE_LOG_LOCK_KEY)))
+    log_changes(connection, [(e, i, op) for (e, i), op in latest.items()])
+
+
+@event.listens_for(db.session, "after_rollback")
+def _change_log_after_rollback(session):
+    session.info.pop("_change_log", None)
+
+
+def current_change_token() -> int:
+    return int(db.session.execute(select(func.max(ChangeLog.id))).scalar() or 0)
+
+
+def prune_change_log(connection, before: datetime) -> int:
+    """ลบ log ที่เก่ากว่า before (เก็บแถวล่าสุดไว้เสมอ -> ยังรู้ว่า token เก่าเกินไหม)"""
+    t = ChangeLog.__table__
+    newest = connection.execute(select(func.max(t.c.id))).scalar()
+    if newest is None:
+        return 0
+    result = connection.execute(t.delete().where(t.c.changed_at < before, t.c.id < newest))
+    return result.rowcount or 0
+
+
+def _sync_value(v):
+    if isinstance(v, (date, datetime)):
+        return v.isoformat()
+    if isinstance(v, Decimal):
+        return float(v)
+    return v
+
+
+def sync_changes(since: int, limit: int) -> dict | None:
+    """
+    การเปลี่ยนแปลงหลัง token since (เรียงตาม token, ไม่เกิน limit รายการ log)
+    - แถวเดียวกันหลายครั้ง -> ส่งครั้งเดียวด้วยค่าปัจจุบัน (อ่านจาก table ตรงๆ ด้วย Core ไม่โหลด ORM)
+    - U แต่แถวไม่อยู่แล้ว (ถูกลบทีหลัง) -> ส่งเป็นลบ
+    -> None ถ้า log ช่วงที่ต้องการถูกลบไปแล้ว (client ต้องโหลดใหม่ทั้งหมด)
+    """
+    t = ChangeLog.__table__
+    oldest = db.session.execute(select(func.min(t.c.id))).scalar()
+    if oldest is not None and since < oldest - 1:
+        return None
+
+    rows = db.session.execute(
+        select(t.c.id, t.c.entity, t.c.entity_id, t.c.op)
+        .where(t.c.id > since)
+        .order_by(t.c.id.asc())
+        .limit(limit + 1)
+    ).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    latest = {}
+    for r in rows:
+        latest[(r.entity, r.entity_id)] = r.op
+
+    changes = {}
+    for name, model in SYNC_ENTITIES.items():
+        ids = [i for (e, i), op in latest.items() if e == name and op == "U"]
+        deleted = {i for (e, i), op in latest.items() if e == name and op == "D"}
+        upserted = []
+        if ids:
+            table = model.__table__
+            found = db.session.execute(select(table).where(table.c.id.in_(ids)).order_by(table.c.id)).all()
+            upserted = [{k: _sync_value(v) for k, v in row._mapping.items()} for row in found]
+            deleted |= set(ids) - {row["id"] for row in upserted}
+        if upserted or deleted:
+            changes[name] = {"upserted": upserted, "deleted": sorted(deleted)}
+
+    return {
+        "token": rows[-1].id if rows else since,
+        "has_more": has_more,
+        "changes": changes,
+    }
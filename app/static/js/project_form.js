@@ -12,6 +12,10 @@
 
   const byId = (id) => document.getElementById(id);
 
+  // ✅ id ของแถวเดิม (ว่าง = แถวใหม่) -> server จับคู่แถวตาม id แทนการลบแล้วสร้างใหม่
+  const setRowId = (tr, data) => { if (data.id) tr.dataset.id = data.id; };
+  const rowId = (tr) => (tr.dataset.id ? Number(tr.dataset.id) : null);
+
   function rowRemove(btn){
     const tr = btn.closest('tr');
     if (tr) tr.remove();
@@ -45,6 +49,7 @@
     tbody(){ return byId('materials_table')?.querySelector('tbody'); },
     addRow(data={}){
       const tr = document.createElement('tr');
+      setRowId(tr, data);
 
       const tdBrand = document.createElement('td');
       tdBrand.appendChild(makeInput('ยี่ห้อ', data.brand));
@@ -100,7 +105,7 @@
         const total = unit_price * qty;
         tds[7].textContent = fmt2(total);
 
-        rows.push({brand, item_code, item_name, tax_invoice_no, tax_invoice_date, unit_price, qty});
+        rows.push({id: rowId(tr), brand, item_code, item_name, tax_invoice_no, tax_invoice_date, unit_price, qty});
       });
       return rows;
     }
@@ -110,6 +115,7 @@
     tbody(){ return byId('subs_table')?.querySelector('tbody'); },
     addRow(data={}){
       const tr = document.createElement('tr');
+      setRowId(tr, data);
 
       const tdName = document.createElement('td');
       tdName.appendChild(makeInput('ชื่อผู้รับเหมาช่วง', data.vendor_name));
@@ -164,7 +170,7 @@
         const withholding_amount = num(val(tds[4].querySelector('input')));
         const payable = Math.max(0, contract_amount - withholding_amount);
         tds[5].textContent = fmt2(payable);
-        rows.push({vendor_name, pay_date, contract_amount, withholding_rate, withholding_amount});
+        rows.push({id: rowId(tr), vendor_name, pay_date, contract_amount, withholding_rate, withholding_amount});
       });
       return rows;
     }
@@ -174,6 +180,7 @@
     tbody(){ return byId('expenses_table')?.querySelector('tbody'); },
     addRow(data={}){
       const tr = document.createElement('tr');
+      setRowId(tr, data);
 
       const tdCat = document.createElement('td');
       tdCat.appendChild(makeInput('เช่น น้ำมัน', data.category || 'อื่นๆ'));
@@ -204,7 +211,7 @@
         const title = val(tds[1].querySelector('input'));
         const expense_date = val(tds[2].querySelector('input'));
         const amount = num(val(tds[3].querySelector('input')));
-        rows.push({category, title, expense_date, amount});
+        rows.push({id: rowId(tr), category, title, expense_date, amount});
       });
       return rows;
     }
@@ -214,6 +221,7 @@
     tbody(){ return byId('advances_table')?.querySelector('tbody'); },
     addRow(data={}){
       const tr = document.createElement('tr');
+      setRowId(tr, data);
 
       const tdTitle = document.createElement('td');
       tdTitle.appendChild(makeInput('รายการ', data.title));
@@ -240,7 +248,7 @@
         const title = val(tds[0].querySelector('input'));
         const advance_date = val(tds[1].querySelector('input'));
         const amount = num(val(tds[2].querySelector('input')));
-        rows.push({title, advance_date, amount});
+        rows.push({id: rowId(tr), title, advance_date, amount});
       });
       return rows;
     }
@@ -1,4 +1,4 @@
-const CACHE_NAME = 'contractor-pwa-v1';
+const CACHE_NAME = 'contractor-pwa-v2';
 const ASSETS = [
   '/',
   '/projects',
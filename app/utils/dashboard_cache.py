@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Flask
+
+# =========================================================
+# Dashboard result cache
+# - key = (view, year, month[, variant])
+# - ล้าง cache อัตโนมัติหลัง commit ที่แตะ model ที่ dashboard นั้นใช้
+# - backend:
+#     memory : dict ใน process (LRU + TTL) -> ใช้กับ worker เดียว / dev
+#              หลาย worker (หรือ `flask jobs worker` เขียนข้อมูล) = process อื่นไม่รู้ว่าต้องล้าง
+#              -> ค้างได้นานสุด DASHBOARD_CACHE_TTL วินาที
+#     redis  : ใช้ร่วมกันหลาย gunicorn worker (ต้อง pip install redis)
+# =========================================================
+
+# view -> ชื่อ model ที่ถ้าเปลี่ยนแล้วต้องล้าง cache ของ view นั้น
+VIEW_DEPENDENCIES = {
+    "dashboard": {
+        "Project",
+        "MaterialItem",
+        "SubcontractorPayment",
+        "OtherExpense",
+        "AdvanceExpense",
+        "SalesDoc",
+        "SalesItem",
+    },
+    "top_projects": {
+        "Project",
+        "MaterialItem",
+        "SubcontractorPayment",
+        "OtherExpense",
+        "AdvanceExpense",
+        "SalesDoc",
+        "SalesItem",
+    },
+    "income": {"SalesDoc", "SalesItem"},
+    "expense": {"MaterialItem", "SubcontractorPayment", "OtherExpense", "AdvanceExpense"},
+}
+
+
+class MemoryBackend:
+    """LRU dict ใน process เดียว (entry หมดอายุหลัง ttl วินาที)"""
+
+    def __init__(self, max_entries: int = 128, ttl: int = 3600):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = int(ttl)
+        self._data: OrderedDict = OrderedDict()  # (view, key) -> (หมดอายุ monotonic, value)
+        self._gens: dict = {}  # view -> จำนวนครั้งที่ถูกล้าง
+        self._lock = threading.Lock()
+
+    def version(self, view: str) -> int:
+        with self._lock:
+            return self._gens.get(view, 0)
+
+    def get(self, view: str, key: str, version: int):
+        with self._lock:
+            k = (view, key)
+            entry = self._data.get(k)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._data[k]
+                return None
+            self._data.move_to_end(k)
+            return entry[1]
+
+    def set(self, view: str, key: str, value, version: int) -> None:
+        with self._lock:
+            # ถูกล้างระหว่าง compute -> ค่าที่คำนวณได้อาจเก่าแล้ว ไม่เก็บ
+            if self._gens.get(view, 0) != version:
+                return
+            k = (view, key)
+            self._data[k] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(k)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def invalidate(self, views) -> None:
+        views = set(views)
+        with self._lock:
+            for view in views:
+                self._gens[view] = self._gens.get(view, 0) + 1
+            for k in [k for k in self._data if k[0] in views]:
+                del self._data[k]
+
+
+class RedisBackend:
+    """
+    ใช้ Redis ร่วมกันหลาย worker
+    - ล้าง cache ด้วยการเพิ่ม generation ของ view (ทุก worker เห็นพร้อมกัน)
+    - การไล่ entry เก่าออก: ใช้ TTL + maxmemory-policy (เช่น allkeys-lru) ของ Redis
+    """
+
+    def __init__(self, url: str, ttl: int = 3600, namespace: str = "contract_pwa:dash"):
+        # ✅ lazy import: ไม่บังคับติดตั้ง redis ถ้าใช้ memory backend
+        import redis
+
+        self._r = redis.Redis.from_url(url)
+        self.ttl = int(ttl)
+        self.ns = namespace
+
+    def version(self, view: str) -> int:
+        return int(self._r.get(f"{self.ns}:gen:{view}") or 0)
+
+    def get(self, view: str, key: str, version: int):
+        raw = self._r.get(f"{self.ns}:{view}:{version}:{key}")
+        if raw is None:
+            return None
+        return json.loads(raw)
+
+    def set(self, view: str, key: str, value, version: int) -> None:
+        # เขียนลง generation ที่อ่านไว้ก่อน compute: ถูกล้างระหว่างนั้น = ไม่มีใครอ่าน key นี้อีก (หมดอายุตาม TTL)
+        self._r.set(
+            f"{self.ns}:{view}:{version}:{key}",
+            json.dumps(value),
+            ex=self.ttl,
+        )
+
+    def invalidate(self, views) -> None:
+        pipe = self._r.pipeline()
+        for view in views:
+            pipe.incr(f"{self.ns}:gen:{view}")
+        pipe.execute()
+
+
+_backend = MemoryBackend()
+_listeners_installed = False
+
+
+def get_backend():
+    return _backend
+
+
+def _make_key(year, month, variant: str = "") -> str:
+    key = f"{int(year) if year else 'all'}-{int(month) if month else 'all'}"
+    return f"{key}-{variant}" if variant else key
+
+
+def get_or_compute(view: str, year, month, compute, variant: str = ""):
+    """
+    คืนผลจาก cache ถ้ามี ไม่งั้นเรียก compute() แล้วเก็บไว้
+    - ค่าที่เก็บต้องเป็น JSON ได้ (dict/list/float/int/str)
+    - variant: แยก cache ของ view เดียวกันที่ต่างกันแค่ตัวเลือก (เช่น ลำดับ top-N)
+    """
+    key = _make_key(year, month, variant)
+    try:
+        # ✅ อ่าน version ก่อน compute: commit ที่ล้าง cache ระหว่าง compute -> ไม่เขียนค่าเก่ากลับ
+        version = _backend.version(view)
+        hit = _backend.get(view, key, version)
+    except Exception:
+        version = None
+        hit = None
+    if hit is not None:
+        return hit
+
+    value = compute()
+    if version is not None:
+        try:
+            _backend.set(view, key, value, version)
+        except Exception:
+            pass
+    return value
+
+
+def invalidate(views=None) -> None:
+    try:
+        _backend.invalidate(views or VIEW_DEPENDENCIES.keys())
+    except Exception:
+        pass
+
+
+def mark_dirty(session, model_names) -> None:
+    """
+    บอกว่า transaction นี้เขียน model เหล่านี้ -> ล้าง view ที่เกี่ยวข้องหลัง commit
+    - ใช้กับการเขียนด้วย Core (เช่น bulk insert) ที่ไม่ผ่าน flush events
+    """
+    session.info.setdefault("_dashboard_dirty_models", set()).update(model_names)
+
+
+def _install_listeners(session) -> None:
+    from sqlalchemy import event
+
+    @event.listens_for(session, "after_flush")
+    def _track_dirty_models(sess, flush_context):
+        mark_dirty(sess, {type(obj).__name__ for obj in list(sess.new) + list(sess.dirty) + list(sess.deleted)})
+
+    @event.listens_for(session, "after_commit")
+    def _invalidate_after_commit(sess):
+        names = sess.info.pop("_dashboard_dirty_models", None)
+        if not names:
+            return
+        views = [v for v, deps in VIEW_DEPENDENCIES.items() if deps & names]
+        if views:
+            invalidate(views)
+
+    @event.listens_for(session, "after_soft_rollback")
+    def _forget_after_rollback(sess, previous_transaction):
+        sess.info.pop("_dashboard_dirty_models", None)
+
+
+def init_app(app: Flask) -> None:
+    global _backend, _listeners_installed
+
+    backend = (app.config.get("DASHBOARD_CACHE_BACKEND") or "memory").lower()
+    if backend == "redis" and app.config.get("DASHBOARD_CACHE_URL"):
+        _backend = RedisBackend(
+            app.config["DASHBOARD_CACHE_URL"],
+            ttl=app.config.get("DASHBOARD_CACHE_TTL", 3600),
+        )
+    else:
+        _backend = MemoryBackend(
+            app.config.get("DASHBOARD_CACHE_MAX_ENTRIES", 128),
+            ttl=app.config.get("DASHBOARD_CACHE_TTL", 3600),
+        )
+
+    if not _listeners_installed:
+        from .. import db
+
+        _install_listeners(db.session)
+        _listeners_installed = True
@@ -0,0 +1,267 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from typing import NamedTuple
+
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfgen import canvas
+
+from .pdf_fonts import FALLBACK_FONT, register_ttf
+
+# =========================================================
+# Form layouts (ตำแหน่งช่องบนแบบฟอร์มราชการ เช่น 50 ทวิ)
+# - 1 ฟอร์ม = 1 ไฟล์ JSON ใน utils/form_layouts/<name>.json (มี version)
+# - โหลด + compile ครั้งเดียวต่อ process -> draw list (tuple) ที่คำนวณพิกัดไว้แล้ว
+# - render = วน draw list แล้ววาดค่าจาก values (dict) ไม่คำนวณตำแหน่งซ้ำทุกใบ
+#
+# ไฟล์ layout:
+#   name, version, template (PDF ฟอร์มเปล่า, optional), offset [dx, dy]
+#   fonts    : {"key": {"name": ชื่อที่ลงทะเบียน, "file": path ใต้ app/}}
+#   defaults : ค่าเริ่มต้นของทุก field (font, size, align, ...)
+#   fields   : [{name, type, x, y, value?, ...}]  (value ไม่ระบุ = ใช้ name)
+#
+# field types:
+#   text  : ข้อความ 1 บรรทัด, align L / C / R
+#   wrap  : ตัดบรรทัดตามคำภายใน width ไม่เกิน max_lines (leading = size + 2)
+#   boxes : ตัวอักษรลงช่องตาม pattern ("#" = 1 ช่อง, ตัวอื่น = เว้นระยะตาม separators pt)
+#           digits: true -> ใช้เฉพาะตัวเลขของค่า
+#   check : เครื่องหมายถูกในกล่องขนาด box เมื่อค่าเป็นจริง (field ไม่มี value = วาดเสมอ)
+# =========================================================
+
+LAYOUT_DIR = os.path.join(os.path.dirname(__file__), "form_layouts")
+
+
+# -------------------------
+# Draw ops (compile แล้ว)
+# -------------------------
+class TextOp(NamedTuple):
+    value: str
+    font: str
+    size: float
+    x: float
+    y: float
+    align: str
+
+
+class WrapOp(NamedTuple):
+    value: str
+    font: str
+    size: float
+    x: float
+    y: float
+    width: float
+    max_lines: int
+
+
+class BoxesOp(NamedTuple):
+    value: str
+    font: str
+    size: float
+    slots: tuple  # ((cx, baseline), ...)
+    digits: bool
+    skip: str  # ตัวคั่นที่ตัดออกจากค่าก่อนลงช่อง
+
+
+class CheckOp(NamedTuple):
+    value: str | None
+    points: tuple  # 3 จุดของเครื่องหมายถูก
+    line_width: float
+
+
+class Layout(NamedTuple):
+    name: str
+    version: int
+    digest: str
+    template: str | None
+    ops: tuple
+    anchors: tuple  # ((field name, x, y), ...) สำหรับ debug
+
+    @property
+    def token(self) -> str:
+        """ใช้ประกอบ cache key: เปลี่ยน version หรือแก้ไฟล์ layout = key ใหม่"""
+        return f"{self.name}:{self.version}:{self.digest[:16]}"
+
+    def draw(self, c: canvas.Canvas, values: dict) -> None:
+        for op in self.ops:
+            _DRAW[type(op)](c, op, values)
+
+    def draw_anchors(self, c: canvas.Canvas) -> None:
+        c.saveState()
+        c.setLineWidth(1)
+        c.setFont(FALLBACK_FONT, 7)
+        for name, x, y in self.anchors:
+            c.circle(x, y, 2, stroke=1, fill=0)
+            c.drawString(x + 4, y + 2, name)
+        c.restoreState()
+
+
+# -------------------------
+# Compile
+# -------------------------
+def _compile_field(f: dict, fonts: dict, dx: float, dy: float):
+    kind = f["type"]
+    value = f.get("value", f["name"])
+    x = float(f["x"]) + dx
+    y = float(f["y"]) + dy
+    font = fonts[f["font"]]
+    size = float(f["size"])
+
+    if kind == "text":
+        align = (f.get("align") or "L").upper()
+        if align not in ("L", "C", "R"):
+            raise ValueError(f"{f['name']}: align must be L / C / R")
+        return TextOp(value, font, size, x, y, align)
+
+    if kind == "wrap":
+        return WrapOp(value, font, size, x, y, float(f["width"]), int(f.get("max_lines", 2)))
+
+    if kind == "boxes":
+        box_w = float(f["box_w"])
+        box_h = float(f["box_h"])
+        seps = {k: float(v) for k, v in (f.get("separators") or {}).items()}
+        baseline = y + box_h / 2.0 - size * float(f["baseline_tweak"])
+        slots = []
+        xi = x
+        for ch in f["pattern"]:
+            if ch == "#":
+                slots.append((xi + box_w / 2.0, baseline))
+                xi += box_w
+            elif ch in seps:
+                xi += seps[ch]
+            else:
+                raise ValueError(f"{f['name']}: separator {ch!r} has no width")
+        return BoxesOp(value, font, size, tuple(slots), bool(f.get("digits")), "".join(seps))
+
+    if kind == "check":
+        box = float(f.get("box", 14))
+        pad = box * 0.22
+        points = (
+            (x + pad, y + box * 0.45),
+            (x + box * 0.42, y + pad),
+            (x + box - pad, y + box - pad),
+        )
+        return CheckOp(f.get("value"), points, float(f.get("line_width", 1.8)))
+
+    raise ValueError(f"{f['name']}: unknown field type {kind!r}")
+
+
+def compile_layout(data: dict, digest: str = "") -> Layout:
+    fonts = {key: register_ttf(spec["name"], spec["file"]) for key, spec in (data.get("fonts") or {}).items()}
+    fonts.setdefault(None, FALLBACK_FONT)
+    defaults = data.get("defaults") or {}
+    dx, dy = (data.get("offset") or (0, 0))
+
+    ops = []
+    anchors = []
+    for raw in data["fields"]:
+        f = {**defaults, **raw}
+        f.setdefault("font", None)
+        ops.append(_compile_field(f, fonts, float(dx), float(dy)))
+        anchors.append((f["name"], float(f["x"]) + dx, float(f["y"]) + dy))
+
+    return Layout(
+        name=data["name"],
+        version=int(data["version"]),
+        digest=digest,
+        template=data.get("template"),
+        ops=tuple(ops),
+        anchors=tuple(anchors),
+    )
+
+
+_layouts: dict = {}
+_layouts_lock = threading.Lock()
+
+
+def get_layout(name: str) -> Layout:
+    """layout ที่ compile แล้ว (ครั้งเดียวต่อ process)"""
+    layout = _layouts.get(name)
+    if layout is not None:
+        return layout
+
+    with _layouts_lock:
+        layout = _layouts.get(name)
+        if layout is None:
+            path = os.path.join(LAYOUT_DIR, f"{name}.json")
+            with open(path, "rb") as f:
+                raw = f.read()
+            layout = compile_layout(json.loads(raw), hashlib.sha256(raw).hexdigest())
+            _layouts[name] = layout
+        return layout
+
+
+# -------------------------
+# Draw
+# -------------------------
+def _draw_text(c: canvas.Canvas, op: TextOp, values: dict) -> None:
+    text = values.get(op.value) or ""
+    if not text:
+        return
+    c.setFont(op.font, op.size)
+    if op.align == "R":
+        c.drawRightString(op.x, op.y, text)
+    elif op.align == "C":
+        c.drawCentredString(op.x, op.y, text)
+    else:
+        c.drawString(op.x, op.y, text)
+
+
+def _draw_wrap(c: canvas.Canvas, op: WrapOp, values: dict) -> None:
+    text = values.get(op.value) or ""
+    if not text:
+        return
+    c.setFont(op.font, op.size)
+    lines = []
+    cur = ""
+    for w in text.replace("\n", " ").split():
+        test = (cur + " " + w).strip()
+        if pdfmetrics.stringWidth(test, op.font, op.size) <= op.width:
+            cur = test
+        else:
+            if cur:
+                lines.append(cur)
+            cur = w
+            if len(lines) >= op.max_lines:
+                break
+    if len(lines) < op.max_lines and cur:
+        lines.append(cur)
+
+    y = op.y
+    for ln in lines[:op.max_lines]:
+        c.drawString(op.x, y, ln)
+        y -= op.size + 2
+
+
+def _draw_boxes(c: canvas.Canvas, op: BoxesOp, values: dict) -> None:
+    text = str(values.get(op.value) or "")
+    if op.digits:
+        chars = [ch for ch in text if ch.isdigit()]
+    else:
+        chars = [ch for ch in text if not ch.isspace() and ch not in op.skip]
+    if not chars:
+        return
+    c.setFont(op.font, op.size)
+    for (cx, baseline), ch in zip(op.slots, chars):
+        c.drawCentredString(cx, baseline, ch)
+
+
+def _draw_check(c: canvas.Canvas, op: CheckOp, values: dict) -> None:
+    if op.value is not None and not values.get(op.value):
+        return
+    (x1, y1), (x2, y2), (x3, y3) = op.points
+    c.saveState()
+    c.setLineWidth(op.line_width)
+    c.line(x1, y1, x2, y2)
+    c.line(x2, y2, x3, y3)
+    c.restoreState()
+
+
+_DRAW = {
+    TextOp: _draw_text,
+    WrapOp: _draw_wrap,
+    BoxesOp: _draw_boxes,
+    CheckOp: _draw_check,
+}
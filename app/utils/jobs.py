@@ -0,0 +1,367 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+from flask import Flask, current_app, jsonify, url_for
+from flask.cli import AppGroup
+
+# =========================================================
+# Background jobs
+# - ตาราง jobs เก็บสถานะ / ความคืบหน้า / ไฟล์ผลลัพธ์
+# - executor (JOBS_EXECUTOR):
+#     thread : รันใน thread pool ของ web process เอง (default)
+#     worker : web แค่ enqueue แล้วให้ `flask jobs worker` (process แยก) หยิบไปรัน
+# - ไฟล์ผลลัพธ์อยู่ใน JOBS_RESULT_DIR และถูกลบเมื่อเกิน JOBS_RESULT_TTL วินาที
+# - job ที่ค้างเพราะ process ตาย (restart / deploy) ถูกกู้ตอน cleanup (ดู recover_stale)
+# =========================================================
+
+STATUS_QUEUED = "QUEUED"
+STATUS_RUNNING = "RUNNING"
+STATUS_DONE = "DONE"
+STATUS_FAILED = "FAILED"
+
+CLEANUP_INTERVAL = 600  # วินาที
+
+_handlers: dict = {}
+_executor: ThreadPoolExecutor | None = None
+_cleanup_lock = threading.Lock()
+_last_cleanup: float | None = None
+_process_started = datetime.utcnow()
+
+
+def job_handler(kind: str):
+    """
+    ลงทะเบียนฟังก์ชันทำงานของ job ประเภท kind
+    - handler(params: dict, ctx: JobContext) -> {"filename", "mimetype"} | None
+    - ถ้ามีไฟล์ผลลัพธ์ ให้เขียนลง ctx.out_path
+    """
+
+    def decorator(fn):
+        _handlers[kind] = fn
+        return fn
+
+    return decorator
+
+
+class JobContext:
+    """สิ่งที่ handler ใช้ระหว่างทำงาน: path ไฟล์ผลลัพธ์ + รายงานความคืบหน้า"""
+
+    def __init__(self, job_id: str, out_path: str):
+        self.job_id = job_id
+        self.out_path = out_path
+        self._last_pct = -1
+
+    def progress(self, done: int, total: int | None = None, message: str | None = None) -> None:
+        pct = int(done * 100 / total) if total else int(done)
+        pct = max(0, min(100, pct))
+        if pct == self._last_pct and not message:
+            return
+        self._last_pct = pct
+        _update(self.job_id, progress=pct, message=(message or None) and str(message)[:200])
+
+
+def _update(job_id: str, **values) -> None:
+    # ✅ ใช้ connection แยก: ไม่ commit transaction ของ handler (เช่น server-side cursor ที่ยังอ่านอยู่)
+    from .. import db
+    from ..models import Job
+
+    with db.engine.begin() as conn:
+        conn.execute(Job.__table__.update().where(Job.__table__.c.id == job_id).values(**values))
+
+
+def _result_dir() -> str:
+    path = current_app.config["JOBS_RESULT_DIR"]
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _remove_file(path: str | None) -> None:
+    if not path:
+        return
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# -------------------------
+# Enqueue / run
+# -------------------------
+def enqueue(kind: str, params: dict | None = None):
+    """สร้าง job (QUEUED) แล้วส่งให้ executor ถ้าเป็นโหมด thread"""
+    from .. import db
+    from ..models import Job
+
+    if kind not in _handlers:
+        raise ValueError(f"unknown job kind: {kind}")
+
+    job = Job(id=uuid.uuid4().hex, kind=kind, status=STATUS_QUEUED, params=params or {})
+    db.session.add(job)
+    db.session.commit()
+
+    if _executor is not None:
+        _executor.submit(_run_in_app, current_app._get_current_object(), job.id)
+
+    maybe_cleanup()
+    return job
+
+
+def accepted_response(job):
+    """202 + ลิงก์สถานะ (ใช้ตอบ request ที่สั่งงานแบบ ?async=1)"""
+    return (
+        jsonify(
+            {
+                "ok": True,
+                "job_id": job.id,
+                "status": job.status,
+                "status_url": url_for("jobs.job_status", job_id=job.id),
+            }
+        ),
+        202,
+    )
+
+
+def _run_in_app(app: Flask, job_id: str) -> None:
+    from .. import db
+
+    with app.app_context():
+        try:
+            run_job(job_id)
+        finally:
+            db.session.remove()
+
+
+def _claim(job_id: str) -> bool:
+    """QUEUED -> RUNNING แบบ atomic (กันรันซ้ำเมื่อมีทั้ง thread และ worker)"""
+    from .. import db
+    from ..models import Job
+
+    t = Job.__table__
+    with db.engine.begin() as conn:
+        res = conn.execute(
+            t.update()
+            .where(t.c.id == job_id)
+            .where(t.c.status == STATUS_QUEUED)
+            .values(status=STATUS_RUNNING, started_at=datetime.utcnow(), progress=0)
+        )
+    return res.rowcount == 1
+
+
+def run_job(job_id: str) -> bool:
+    """รัน job ที่ QUEUED อยู่ -> False ถ้ามีคนอื่นหยิบไปแล้ว"""
+    from .. import db
+    from ..models import Job
+
+    if not _claim(job_id):
+        return False
+
+    job = db.session.get(Job, job_id)
+    handler = _handlers.get(job.kind)
+    ctx = JobContext(job_id, os.path.join(_result_dir(), job_id))
+    ttl = timedelta(seconds=int(current_app.config.get("JOBS_RESULT_TTL", 86400)))
+
+    try:
+        if handler is None:
+            raise RuntimeError(f"unknown job kind: {job.kind}")
+        result = handler(dict(job.params or {}), ctx) or {}
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception("job %s (%s) failed", job_id, job.kind)
+        _remove_file(ctx.out_path)
+        now = datetime.utcnow()
+        _update(job_id, status=STATUS_FAILED, error=str(e)[:2000], finished_at=now, expires_at=now + ttl)
+        return True
+
+    db.session.rollback()
+    has_file = os.path.exists(ctx.out_path)
+    now = datetime.utcnow()
+    _update(
+        job_id,
+        status=STATUS_DONE,
+        progress=100,
+        result_path=ctx.out_path if has_file else None,
+        result_name=result.get("filename") if has_file else None,
+        result_mimetype=result.get("mimetype") if has_file else None,
+        finished_at=now,
+        expires_at=now + ttl,
+    )
+    return True
+
+
+def _next_queued_id() -> str | None:
+    from .. import db
+    from ..models import Job
+
+    return db.session.execute(
+        db.select(Job.id)
+        .where(Job.status == STATUS_QUEUED)
+        .order_by(Job.created_at.asc())
+        .limit(1)
+    ).scalar()
+
+
+def work(poll: float = 1.0, once: bool = False) -> int:
+    """
+    loop ของ `flask jobs worker`: หยิบ job เก่าสุดที่ QUEUED มารันทีละงาน
+    - once=True: รันจนคิวว่างแล้วจบ
+    """
+    from .. import db
+
+    done = 0
+    while True:
+        job_id = _next_queued_id()
+        db.session.rollback()
+        if job_id:
+            if run_job(job_id):
+                done += 1
+            db.session.remove()
+            continue
+
+        if once:
+            return done
+        maybe_cleanup()
+        time.sleep(poll)
+
+
+# -------------------------
+# TTL cleanup
+# -------------------------
+def cleanup_expired(now: datetime | None = None) -> int:
+    """ลบ job ที่หมดอายุ + ไฟล์ผลลัพธ์ -> จำนวน job ที่ลบ"""
+    from .. import db
+    from ..models import Job
+
+    now = now or datetime.utcnow()
+    rows = db.session.execute(
+        db.select(Job.id, Job.result_path).where(Job.expires_at.isnot(None)).where(Job.expires_at < now)
+    ).all()
+    if not rows:
+        return 0
+
+    for _job_id, path in rows:
+        _remove_file(path)
+
+    db.session.execute(db.delete(Job).where(Job.id.in_([r[0] for r in rows])))
+    db.session.commit()
+    return len(rows)
+
+
+def recover_stale(now: datetime | None = None) -> tuple:
+    """
+    กู้ job ที่ไม่มีใครทำต่อแล้ว -> (จำนวนที่ตั้งเป็น FAILED, จำนวนที่ส่งเข้าคิวใหม่)
+    - RUNNING นานเกิน JOBS_RUNNING_TIMEOUT -> FAILED (process ที่รันอยู่ตายไปแล้ว)
+      ถ้าจริง ๆ ยังรันอยู่และทำเสร็จทีหลัง run_job จะเขียน DONE ทับเอง
+    - โหมด thread: QUEUED ที่สร้างก่อน process นี้เริ่ม หรือค้างเกิน CLEANUP_INTERVAL
+      -> ส่งเข้า executor ของ process นี้ (คิวใน memory ของ process เดิมหายไปแล้ว)
+      ถ้า process อื่นยังถืออยู่ก็ไม่เป็นไร: _claim ให้รันได้ที่เดียว
+    """
+    from .. import db
+    from ..models import Job
+
+    now = now or datetime.utcnow()
+    t = Job.__table__
+    timeout = timedelta(seconds=int(current_app.config.get("JOBS_RUNNING_TIMEOUT", 3600)))
+    ttl = timedelta(seconds=int(current_app.config.get("JOBS_RESULT_TTL", 86400)))
+
+    stale = db.session.execute(
+        db.select(Job.id).where(Job.status == STATUS_RUNNING).where(Job.started_at < now - timeout)
+    ).scalars().all()
+    db.session.rollback()
+    failed = 0
+    if stale:
+        with db.engine.begin() as conn:
+            failed = conn.execute(
+                t.update()
+                .where(t.c.id.in_(stale))
+                .where(t.c.status == STATUS_RUNNING)
+                .values(
+                    status=STATUS_FAILED,
+                    error="งานหยุดค้าง (process ที่รันอยู่ถูกปิดหรือ restart) กรุณาสั่งใหม่",
+                    finished_at=now,
+                    expires_at=now + ttl,
+                )
+            ).rowcount
+        for job_id in stale:
+            _remove_file(os.path.join(_result_dir(), job_id))
+
+    resubmitted = 0
+    if _executor is not None:
+        cutoff = max(_process_started, now - timedelta(seconds=CLEANUP_INTERVAL))
+        orphans = db.session.execute(
+            db.select(Job.id)
+            .where(Job.status == STATUS_QUEUED)
+            .where(Job.created_at < cutoff)
+            .order_by(Job.created_at.asc())
+        ).scalars().all()
+        db.session.rollback()
+        app = current_app._get_current_object()
+        for job_id in orphans:
+            _executor.submit(_run_in_app, app, job_id)
+        resubmitted = len(orphans)
+
+    return failed, resubmitted
+
+
+def maybe_cleanup() -> None:
+    """cleanup + กู้ job ค้าง ไม่เกิน 1 ครั้ง / CLEANUP_INTERVAL ต่อ process (ครั้งแรกทำทันที)"""
+    global _last_cleanup
+
+    if _last_cleanup is not None and time.monotonic() - _last_cleanup < CLEANUP_INTERVAL:
+        return
+    if not _cleanup_lock.acquire(blocking=False):
+        return
+    try:
+        _last_cleanup = time.monotonic()
+        recover_stale()
+        cleanup_expired()
+    except Exception:
+        current_app.logger.exception("job cleanup failed")
+    finally:
+        _cleanup_lock.release()
+
+
+# -------------------------
+# CLI: flask jobs ...
+# -------------------------
+jobs_cli = AppGroup("jobs", help="Background jobs")
+
+
+@jobs_cli.command("worker")
+@click.option("--poll", default=1.0, show_default=True, help="วินาทีที่รอเมื่อคิวว่าง")
+@click.option("--once", is_flag=True, help="รันจนคิวว่างแล้วจบ")
+def worker_command(poll: float, once: bool) -> None:
+    """รัน job ที่อยู่ในคิว"""
+    done = work(poll=poll, once=once)
+    click.echo(f"jobs done: {done}")
+
+
+@jobs_cli.command("cleanup")
+def cleanup_command() -> None:
+    """กู้ job ที่ค้าง + ลบ job และไฟล์ผลลัพธ์ที่หมดอายุ"""
+    failed, resubmitted = recover_stale()
+    click.echo(f"jobs failed (stale): {failed}, requeued: {resubmitted}")
+    click.echo(f"jobs removed: {cleanup_expired()}")
+
+
+def init_app(app: Flask) -> None:
+    global _executor
+
+    if not app.config.get("JOBS_RESULT_DIR"):
+        app.config["JOBS_RESULT_DIR"] = os.path.join(app.instance_path, "job_results")
+    app.cli.add_command(jobs_cli)
+
+    executor = (app.config.get("JOBS_EXECUTOR") or "thread").lower()
+    if executor == "thread" and _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=max(1, int(app.config.get("JOBS_THREADS", 2))),
+            thread_name_prefix="jobs",
+        )
+    elif executor != "thread" and _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import tempfile
+import threading
+from io import BytesIO
+
+from flask import Flask, Response, request, send_file
+
+# =========================================================
+# Rendered PDF cache (content-addressed, เก็บบน disk)
+# - key = sha256 ของสิ่งที่กำหนดหน้าตา PDF (เช่น id + updated_at + hash ฟอร์ม + layout version)
+#   -> ข้อมูล/ฟอร์ม/ตำแหน่งเปลี่ยน = ได้ key ใหม่เอง ไม่ต้องสั่งล้าง
+# - จำกัดขนาดรวมด้วย LRU (ใช้ mtime ของไฟล์เป็นเวลาที่ใช้ล่าสุด)
+# - ใช้ key เดียวกันเป็น ETag -> re-download ได้ 304 โดยไม่ต้องอ่านไฟล์
+# =========================================================
+
+
+def make_key(*parts) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(str(part).encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+class PdfCache:
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max(0, int(max_bytes))
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.pdf")
+
+    def get(self, key: str) -> bytes | None:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            os.utime(path)  # ✅ LRU: ใช้ล่าสุด = mtime ล่าสุด
+        except OSError:
+            pass
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+
+        # เขียนไฟล์ชั่วคราวแล้ว rename -> ไม่มีใครอ่านเจอไฟล์ครึ่งๆ
+        fd, tmp = tempfile.mkstemp(dir=folder, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except Exception:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+        self._evict()
+
+    def _evict(self) -> None:
+        with self._lock:
+            entries = []
+            total = 0
+            for root, _dirs, files in os.walk(self.directory):
+                for name in files:
+                    if not name.endswith(".pdf"):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, path))
+                    total += st.st_size
+
+            if total <= self.max_bytes:
+                return
+
+            entries.sort()
+            for _mtime, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+    def get_or_render(self, key: str, render) -> bytes:
+        data = self.get(key)
+        if data is None:
+            data = render()
+            try:
+                self.put(key, data)
+            except OSError:
+                pass
+        return data
+
+
+_cache: PdfCache | None = None
+
+
+def get_cache() -> PdfCache:
+    if _cache is None:
+        raise RuntimeError("pdf_cache.init_app(app) has not been called")
+    return _cache
+
+
+def pdf_response(key: str, render, download_name: str, last_modified=None, as_attachment: bool = True):
+    """
+    ส่ง PDF พร้อม ETag / Last-Modified
+    - If-None-Match ตรง -> 304 ทันที (ไม่อ่าน cache / ไม่ render)
+    - ไม่งั้นอ่านจาก cache หรือ render(): () -> bytes แล้วเก็บไว้
+    """
+    if request.if_none_match and request.if_none_match.contains(key):
+        resp = Response(status=304)
+        resp.set_etag(key)
+        if last_modified:
+            resp.last_modified = last_modified
+    else:
+        data = get_cache().get_or_render(key, render)
+        resp = send_file(
+            BytesIO(data),
+            mimetype="application/pdf",
+            as_attachment=as_attachment,
+            download_name=download_name,
+            etag=key,
+            last_modified=last_modified,
+            conditional=True,
+        )
+
+    # ให้ browser ถามใหม่ทุกครั้ง (ได้ 304 ถ้าไม่เปลี่ยน)
+    resp.cache_control.private = True
+    resp.cache_control.no_cache = True
+    return resp
+
+
+def init_app(app: Flask) -> None:
+    global _cache
+
+    directory = app.config.get("PDF_CACHE_DIR") or os.path.join(app.instance_path, "pdf_cache")
+    max_mb = int(app.config.get("PDF_CACHE_MAX_MB", 256))
+    _cache = PdfCache(directory, max_mb * 1024 * 1024)
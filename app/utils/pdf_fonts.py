@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import os
+import threading
+from io import BytesIO
+
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+# =========================================================
+# Font service สำหรับ PDF ทุกตัว (50 ทวิ / ใบแนบ / เอกสารขาย / ใบสำคัญจ่าย)
+# - ลงทะเบียน TTF ครั้งเดียวต่อ process (ชื่อเดียวกัน = ใช้ของเดิม)
+# - reportlab ฝังเฉพาะ glyph ที่ใช้จริงอยู่แล้ว (subset ต่อเอกสาร) แต่ subset ของ
+#   THSarabunNew ยังบวม ~70KB เพราะ copy hinting (fpgm/prep/cvt + instructions ใน glyf)
+#   และ name table ทั้งก้อนติดไปด้วย
+#   -> ✅ ให้ fontTools (Subsetter) สร้าง "lean" TTF ใน memory ครั้งเดียว: เก็บทุก glyph / cmap
+#      แต่ตัด hinting + ย่อ name table (outline / advance width เหมือนเดิม -> ตำแหน่งตัวอักษรไม่เปลี่ยน)
+# - subset ต่อเอกสารยังเป็นของ reportlab เอง (ไม่ไปแตะ method ภายในของ reportlab)
+# - ไม่มี fontTools / สร้าง lean ไม่ได้ (ไฟล์แปลก) -> ลงทะเบียนไฟล์ตรง ๆ เหมือนเดิม
+# =========================================================
+
+THAI_FONT_NAME = "THSarabunNew"
+THAI_FONT_REL = os.path.join("static", "fonts", "THSarabunNew.ttf")
+FALLBACK_FONT = "Helvetica"
+
+# เปลี่ยนวิธีเตรียม font (ผลคือ byte ของ PDF เปลี่ยน) -> เพิ่มเลขนี้ (เป็นส่วนหนึ่งของ cache key)
+FONT_VERSION = 3
+
+# name table: เก็บเฉพาะ family / style / unique / full / version / postscript
+_KEEP_NAME_IDS = [1, 2, 3, 4, 5, 6]
+
+
+def _app_dir() -> str:
+    return os.path.dirname(os.path.dirname(__file__))
+
+
+# -------------------------
+# Lean TTF (ตัด hinting)
+# -------------------------
+def lean_ttf(data: bytes) -> bytes:
+    """TTF เดิมที่ตัด hinting + ย่อ name table (ทุก glyph / cmap / metrics เหมือนเดิม)"""
+    # ✅ lazy import: ไม่มี fontTools ก็ยังใช้ไฟล์ font ตรง ๆ ได้
+    from fontTools import subset
+    from fontTools.ttLib import TTFont as FTFont
+
+    options = subset.Options()
+    options.hinting = False
+    options.name_IDs = _KEEP_NAME_IDS
+    options.name_languages = ["*"]
+    options.glyph_names = False
+    options.notdef_outline = True
+    options.layout_features = ["*"]
+    options.drop_tables += ["DSIG"]
+
+    font = FTFont(BytesIO(data))
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(glyphs=font.getGlyphOrder(), unicodes=font.getBestCmap().keys())
+    subsetter.subset(font)
+
+    out = BytesIO()
+    font.save(out)
+    return out.getvalue()
+
+
+# -------------------------
+# Register
+# -------------------------
+_font_lock = threading.Lock()
+
+
+def register_ttf(name: str, rel_path: str) -> str:
+    """ลงทะเบียน TTF ครั้งเดียวต่อ process -> ชื่อ font ที่ใช้ได้ (ไม่มีไฟล์ = Helvetica)"""
+    path = os.path.join(_app_dir(), rel_path)
+    with _font_lock:
+        try:
+            pdfmetrics.getFont(name)
+            return name
+        except Exception:
+            pass
+        if not os.path.exists(path):
+            return FALLBACK_FONT
+
+        try:
+            with open(path, "rb") as f:
+                font = TTFont(name, BytesIO(lean_ttf(f.read())))
+        except Exception:
+            font = TTFont(name, path)
+        pdfmetrics.registerFont(font)
+        return name
+
+
+_thai_font: str | None = None
+
+
+def thai_font() -> str:
+    """ชื่อ font ไทยที่ลงทะเบียนแล้ว (ไม่มีไฟล์ font = Helvetica)"""
+    # ✅ สำเร็จแล้วจำไว้ ไม่ต้องเข้า lock ทุกครั้ง
+    global _thai_font
+    if _thai_font:
+        return _thai_font
+
+    name = register_ttf(THAI_FONT_NAME, THAI_FONT_REL)
+    if name == THAI_FONT_NAME:
+        _thai_font = name
+    return name
+
+
+def font_token() -> str:
+    """ใช้ประกอบ cache key: เปลี่ยนวิธีเตรียม font = key ใหม่"""
+    return f"fonts:{FONT_VERSION}"
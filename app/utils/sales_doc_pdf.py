@@ -0,0 +1,471 @@
+from __future__ import annotations
+
+import os
+import threading
+import unicodedata
+from decimal import Decimal
+from io import BytesIO
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfgen import canvas
+
+from .pdf_fonts import thai_font
+from .withholding_pdf import _fmt_money
+
+# =========================================================
+# PDF เอกสารขาย (QT / IV / RC / BL) — render ฝั่ง server แทนการพิมพ์จาก browser
+# - หน้าตาเดียวกับ docs/print_doc.html
+# - font / โลโก้ โหลดครั้งเดียวต่อ process (โลโก้ cache ตาม mtime/size ของไฟล์)
+# - รายการยาว -> ตัดหน้าอัตโนมัติ, หน้าถัดไปมีหัวแบบย่อ + หัวตาราง
+# - batch: หลายเอกสารใน canvas เดียว (ใช้ font ร่วมกัน ไฟล์ไม่บวม)
+# =========================================================
+
+# เปลี่ยนตำแหน่ง/หน้าตา -> เพิ่มเลขนี้ (เป็นส่วนหนึ่งของ cache key)
+LAYOUT_VERSION = 1
+
+PAGE_W, PAGE_H = A4
+MARGIN = 34
+CONTENT_W = PAGE_W - 2 * MARGIN
+
+FONT_SIZE = 12
+SMALL = 10.5
+LINE_H = 14
+
+# (หัวคอลัมน์, ความกว้าง) — รายละเอียด = ที่เหลือ
+ITEM_COLUMNS = [("#", 30), ("รายละเอียด", None), ("จำนวน", 60), ("ราคาต่อหน่วย", 80), ("ยอดรวม", 85)]
+TABLE_HEAD_H = 20
+ROW_PAD = 6
+MAX_ROW_LINES = 40
+
+FOOTER_H = 20
+# ยอดรวม + หมายเหตุ/การชำระเงิน + ลายเซ็น (ต้องอยู่หน้าเดียวกัน)
+TOTALS_H = 5 * 16 + 8
+NOTES_H = 86
+SIGN_H = 64
+CLOSING_H = TOTALS_H + NOTES_H + SIGN_H
+
+
+def _app_dir() -> str:
+    return os.path.dirname(os.path.dirname(__file__))
+
+
+# -------------------------
+# Logo cache
+# -------------------------
+_logo_lock = threading.Lock()
+_logos: dict = {}
+
+
+def logo_abs_path(rel_path: str | None) -> str | None:
+    """logo_path ใน DB (เช่น 'uploads/company_logo.png') -> path จริงใต้ static"""
+    if not rel_path:
+        return None
+    rel = rel_path.replace("\\", "/").lstrip("/")
+    if rel.startswith("static/"):
+        rel = rel[len("static/"):]
+    static_dir = os.path.join(_app_dir(), "static")
+    path = os.path.normpath(os.path.join(static_dir, rel))
+    if not path.startswith(os.path.normpath(static_dir) + os.sep):
+        return None
+    return path
+
+
+def logo_stamp(path: str | None) -> str:
+    """ใช้ใน cache key: เปลี่ยนไฟล์โลโก้ (ชื่อเดิม) ก็ได้ key ใหม่"""
+    if not path:
+        return ""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return ""
+    return f"{st.st_mtime_ns}:{st.st_size}"
+
+
+def _get_logo(path: str | None):
+    """ImageReader ที่ decode แล้ว (ต่อ process) -> None ถ้าไม่มี/อ่านไม่ได้"""
+    stamp = logo_stamp(path)
+    if not stamp:
+        return None
+    with _logo_lock:
+        hit = _logos.get(path)
+        if hit and hit[0] == stamp:
+            return hit[1]
+        try:
+            with open(path, "rb") as f:
+                reader = ImageReader(BytesIO(f.read()))
+            reader.getSize()
+        except Exception:
+            reader = None
+        _logos[path] = (stamp, reader)
+        return reader
+
+
+# -------------------------
+# Snapshot (ค่าที่ใช้ render: ไม่ผูก session)
+# -------------------------
+def _d(v) -> Decimal:
+    return Decimal(str(v if v is not None else 0))
+
+
+def sales_doc_snapshot(doc, company=None, title: str | None = None) -> dict:
+    """
+    ดึงค่าที่ต้องใช้จาก SalesDoc (+ CompanyProfile สำรองแบบเดียวกับ print_doc.html)
+    """
+    c = company
+    t = doc.totals
+
+    def pick(doc_value, attr):
+        return doc_value or (getattr(c, attr, None) if c else None)
+
+    bank = {}
+    if doc.doc_type == "QT" and c:
+        bank = {
+            "ธนาคาร": c.payment_bank,
+            "เลขบัญชี": c.payment_account_no,
+            "ชื่อบัญชี": c.payment_account_name,
+            "สาขา": c.payment_branch,
+        }
+
+    return {
+        "id": doc.id,
+        "doc_type": doc.doc_type,
+        "title": title or doc.doc_type,
+        "doc_no": doc.doc_no,
+        "issue_date": doc.issue_date.strftime("%d/%m/%Y") if doc.issue_date else "",
+        "due_date": doc.due_date.strftime("%d/%m/%Y") if doc.due_date else "",
+        "company": {
+            "name": pick(doc.company_name, "company_name") or "บริษัทของฉัน",
+            "tax_id": pick(doc.company_tax_id, "tax_id"),
+            "address": pick(doc.company_address, "address"),
+            "phone": pick(doc.company_phone, "phone"),
+            "email": pick(doc.company_email, "email"),
+            "website": pick(doc.company_website, "website"),
+            "logo": logo_abs_path(pick(doc.company_logo_path, "logo_path")),
+        },
+        "customer": {
+            "name": doc.customer_name,
+            "address": doc.customer_address,
+            "tax_id": doc.customer_tax_id,
+            "phone": doc.customer_phone,
+            "email": doc.customer_email,
+        },
+        "subject": doc.subject,
+        "description": doc.description,
+        "items": [
+            (
+                it.description or "",
+                _fmt_money(it.qty),
+                _fmt_money(it.unit_price),
+                _fmt_money(_d(it.qty) * _d(it.unit_price) - _d(it.discount_amount)),
+            )
+            for it in doc.items
+        ],
+        "totals": [
+            ("รวมเป็นเงิน", _fmt_money(t.net_before_tax)),
+            (f"หักภาษี ณ ที่จ่าย {t.wht_rate:.2f}%", "- " + _fmt_money(t.wht_amount)),
+            ("ยอดหลังหัก ณ ที่จ่าย", _fmt_money(t.net_after_wht)),
+            (f"ภาษีมูลค่าเพิ่ม {t.vat_rate:.2f}%", "+ " + _fmt_money(t.vat_amount)),
+            ("ยอดชำระ", _fmt_money(t.grand_total)),
+        ],
+        "note": doc.note,
+        "bank": {k: v for k, v in bank.items() if v},
+    }
+
+
+# -------------------------
+# Text helpers
+# -------------------------
+def _wrap(text: str, font: str, size: float, max_width: float, max_lines: int = MAX_ROW_LINES) -> list:
+    """
+    ตัดบรรทัดตามความกว้าง
+    - ภาษาไทยมักไม่มีช่องว่าง -> คำที่ยาวเกินตัดทีละตัวอักษร (ไม่แยกสระ/วรรณยุกต์ออกจากพยัญชนะ)
+    """
+    width = pdfmetrics.stringWidth
+    lines: list = []
+
+    for para in (text or "").splitlines() or [""]:
+        cur = ""
+        for word in para.split(" "):
+            test = f"{cur} {word}" if cur else word
+            if width(test, font, size) <= max_width:
+                cur = test
+                continue
+            if cur:
+                lines.append(cur)
+                cur = ""
+            for ch in word:
+                if cur and unicodedata.category(ch) != "Mn" and width(cur + ch, font, size) > max_width:
+                    lines.append(cur)
+                    cur = ""
+                cur += ch
+        lines.append(cur)
+        if len(lines) >= max_lines:
+            break
+
+    return lines[:max_lines]
+
+
+def _item_widths() -> list:
+    fixed = sum(w for _t, w in ITEM_COLUMNS if w)
+    return [w if w else CONTENT_W - fixed for _t, w in ITEM_COLUMNS]
+
+
+# -------------------------
+# Layout
+# -------------------------
+def _paginate(row_heights: list, first_avail: float, next_avail: float) -> list:
+    """
+    แบ่งแถวรายการเป็นหน้า -> [[index, ...], ...]
+    - หน้าสุดท้ายต้องมีที่พอสำหรับยอดรวม/หมายเหตุ/ลายเซ็น ไม่งั้นขึ้นหน้าใหม่
+    """
+    pages: list = [[]]
+    avail = first_avail
+    for i, h in enumerate(row_heights):
+        # แถวแรกของหน้าแรกไม่พอ -> ยอมให้หน้าแรกมีแค่หัวเอกสาร
+        if h > avail and (pages[-1] or len(pages) == 1):
+            pages.append([])
+            avail = next_avail
+        pages[-1].append(i)
+        avail -= h
+    if avail < CLOSING_H:
+        pages.append([])
+    return pages
+
+
+def _draw_header(c: canvas.Canvas, font: str, snap: dict) -> float:
+    """หัวเอกสารหน้าแรก -> y ถัดไป"""
+    co = snap["company"]
+    top = PAGE_H - MARGIN
+    x = MARGIN
+
+    logo = _get_logo(co["logo"])
+    if logo is not None:
+        c.drawImage(logo, x, top - 46, width=46, height=46, preserveAspectRatio=True, mask="auto")
+        x += 56
+
+    c.setFont(font, 15)
+    c.drawString(x, top - 14, co["name"])
+    y = top - 28
+    c.setFont(font, SMALL)
+    info_w = PAGE_W - MARGIN - 210 - x
+    lines = _wrap(co["address"] or "", font, SMALL, info_w, 2) if co["address"] else []
+    line2 = " • ".join(
+        p for p in (f"เลขประจำตัวผู้เสียภาษี {co['tax_id']}" if co["tax_id"] else "", co["website"] or "") if p
+    )
+    line3 = " • ".join(
+        p for p in (f"โทร: {co['phone']}" if co["phone"] else "", f"E-mail: {co['email']}" if co["email"] else "") if p
+    )
+    for ln in lines + [line2, line3]:
+        if ln:
+            c.drawString(x, y, ln)
+            y -= LINE_H - 1
+
+    # กล่องเลขที่เอกสาร
+    box_w = 200
+    box_x = PAGE_W - MARGIN - box_w
+    rows = [("เลขที่", snap["doc_no"]), ("วันที่", snap["issue_date"])]
+    if snap["due_date"]:
+        rows.append(("ครบกำหนด", snap["due_date"]))
+    box_h = 44 + len(rows) * LINE_H
+    c.setLineWidth(0.6)
+    c.roundRect(box_x, top - box_h, box_w, box_h, 8)
+    c.setFont(font, 18)
+    c.drawString(box_x + 10, top - 20, snap["title"])
+    c.setFont(font, SMALL)
+    c.drawString(box_x + 10, top - 32, "ต้นฉบับ")
+    c.drawRightString(box_x + box_w - 10, top - 20, snap["doc_type"])
+    c.line(box_x + 8, top - 38, box_x + box_w - 8, top - 38)
+    yy = top - 38 - LINE_H
+    c.setFont(font, FONT_SIZE)
+    for k, v in rows:
+        c.drawString(box_x + 10, yy, k)
+        c.drawRightString(box_x + box_w - 10, yy, v)
+        yy -= LINE_H
+
+    y = min(y, top - box_h) - 12
+
+    # ลูกค้า / รายละเอียดงาน
+    cu = snap["customer"]
+    col_w = (CONTENT_W - 12) / 2
+    left = [cu["name"] or ""]
+    left += _wrap(cu["address"] or "", font, SMALL, col_w - 16, 2) if cu["address"] else []
+    contact = " • ".join(
+        p
+        for p in (
+            f"เลขผู้เสียภาษี {cu['tax_id']}" if cu["tax_id"] else "",
+            f"โทร: {cu['phone']}" if cu["phone"] else "",
+            cu["email"] or "",
+        )
+        if p
+    )
+    if contact:
+        left.append(contact)
+    right = [snap["subject"] or "-"]
+    right += _wrap(snap["description"] or "", font, SMALL, col_w - 16, 3) if snap["description"] else []
+
+    card_h = 24 + max(len(left), len(right)) * LINE_H
+    for i, (label, lines) in enumerate((("ข้อมูลลูกค้า", left), ("รายละเอียดงาน", right))):
+        cx = MARGIN + i * (col_w + 12)
+        c.roundRect(cx, y - card_h, col_w, card_h, 8)
+        c.setFont(font, FONT_SIZE)
+        c.drawString(cx + 8, y - 14, label)
+        yy = y - 14 - LINE_H
+        for j, ln in enumerate(lines):
+            c.setFont(font, FONT_SIZE if j == 0 else SMALL)
+            c.drawString(cx + 8, yy, ln)
+            yy -= LINE_H
+
+    return y - card_h - 12
+
+
+def _draw_continuation_header(c: canvas.Canvas, font: str, snap: dict) -> float:
+    top = PAGE_H - MARGIN
+    c.setFont(font, FONT_SIZE)
+    c.drawString(MARGIN, top - 12, snap["company"]["name"])
+    c.drawRightString(PAGE_W - MARGIN, top - 12, f"{snap['title']} {snap['doc_no']} (ต่อ)")
+    c.setLineWidth(0.6)
+    c.line(MARGIN, top - 18, PAGE_W - MARGIN, top - 18)
+    return top - 30
+
+
+def _draw_table_head(c: canvas.Canvas, font: str, y: float, widths: list) -> float:
+    c.setFillGray(0.94)
+    c.rect(MARGIN, y - TABLE_HEAD_H, CONTENT_W, TABLE_HEAD_H, stroke=1, fill=1)
+    c.setFillGray(0)
+    c.setFont(font, FONT_SIZE)
+    x = MARGIN
+    for (title, _w), w in zip(ITEM_COLUMNS, widths):
+        c.drawCentredString(x + w / 2, y - 14, title)
+        x += w
+    return y - TABLE_HEAD_H
+
+
+def _draw_item(c: canvas.Canvas, font: str, y: float, widths: list, no: int, item, lines: list, h: float) -> float:
+    _desc, qty, unit, total = item
+    c.setLineWidth(0.4)
+    c.rect(MARGIN, y - h, CONTENT_W, h)
+    x = MARGIN
+    for w in widths[:-1]:
+        x += w
+        c.line(x, y, x, y - h)
+
+    c.setFont(font, FONT_SIZE)
+    base = y - 4 - FONT_SIZE + 2
+    x = MARGIN
+    c.drawCentredString(x + widths[0] / 2, base, str(no))
+    x += widths[0]
+    yy = base
+    for ln in lines:
+        c.drawString(x + 4, yy, ln)
+        yy -= LINE_H
+    x += widths[1]
+    c.drawRightString(x + widths[2] - 4, base, qty)
+    x += widths[2]
+    c.drawRightString(x + widths[3] - 4, base, unit)
+    x += widths[3]
+    c.drawRightString(x + widths[4] - 4, base, total)
+    return y - h
+
+
+def _draw_closing(c: canvas.Canvas, font: str, y: float, snap: dict, widths: list) -> None:
+    # ยอดรวม (ชิดขวา ใต้คอลัมน์ราคา/ยอดรวม)
+    box_w = widths[3] + widths[4]
+    box_x = PAGE_W - MARGIN - box_w
+    y -= 4
+    for i, (label, value) in enumerate(snap["totals"]):
+        last = i == len(snap["totals"]) - 1
+        c.setFont(font, 13 if last else FONT_SIZE)
+        c.drawString(box_x - 60, y - 12, label)
+        c.drawRightString(PAGE_W - MARGIN - 4, y - 12, value)
+        c.setLineWidth(0.3)
+        c.line(box_x - 64, y - 16, PAGE_W - MARGIN, y - 16)
+        y -= 16
+    y -= 8
+
+    # หมายเหตุ / การชำระเงิน
+    col_w = (CONTENT_W - 12) / 2
+    box_h = NOTES_H - 10
+    c.setLineWidth(0.6)
+    c.roundRect(MARGIN, y - box_h, col_w, box_h, 8)
+    c.roundRect(MARGIN + col_w + 12, y - box_h, col_w, box_h, 8)
+    c.setFont(font, FONT_SIZE)
+    c.drawString(MARGIN + 8, y - 14, "หมายเหตุ")
+    c.drawString(MARGIN + col_w + 20, y - 14, "ข้อมูลการชำระเงิน")
+    c.setFont(font, SMALL)
+    yy = y - 14 - LINE_H
+    for ln in _wrap(snap["note"] or "-", font, SMALL, col_w - 16, 4):
+        c.drawString(MARGIN + 8, yy, ln)
+        yy -= LINE_H - 1
+    yy = y - 14 - LINE_H
+    for k, v in (snap["bank"].items() or [("", "-")]):
+        c.drawString(MARGIN + col_w + 20, yy, f"{k}  {v}" if k else v)
+        yy -= LINE_H - 1
+    y -= NOTES_H
+
+    # ลายเซ็น
+    for i, label in enumerate(("ผู้รับเงิน", "ผู้จ่ายเงิน")):
+        sx = PAGE_W - MARGIN - (2 - i) * 200 - (1 - i) * 24
+        c.line(sx + 20, y - 24, sx + 200, y - 24)
+        c.drawCentredString(sx + 110, y - 38, label)
+        c.drawCentredString(sx + 110, y - 52, "วันที่ ____/____/____")
+
+
+def draw_sales_doc(c: canvas.Canvas, snap: dict) -> int:
+    """วาดเอกสาร 1 ฉบับต่อท้าย canvas -> จำนวนหน้า"""
+    font = thai_font()
+    widths = _item_widths()
+
+    wrapped = [_wrap(it[0], font, FONT_SIZE, widths[1] - 8) for it in snap["items"]]
+    heights = [max(1, len(lines)) * LINE_H + ROW_PAD for lines in wrapped]
+
+    # วาดหัวหน้าแรกก่อน เพื่อรู้ว่าเหลือที่ให้ตารางเท่าไร
+    table_top = _draw_header(c, font, snap)
+    bottom = MARGIN + FOOTER_H
+    first_avail = table_top - TABLE_HEAD_H - bottom
+    next_avail = (PAGE_H - MARGIN - 30) - TABLE_HEAD_H - bottom
+    pages = _paginate(heights, first_avail, next_avail)
+
+    for page_no, idxs in enumerate(pages, start=1):
+        if page_no > 1:
+            table_top = _draw_continuation_header(c, font, snap)
+        y = table_top
+        if idxs or page_no == 1:
+            y = _draw_table_head(c, font, y, widths)
+        for i in idxs:
+            y = _draw_item(c, font, y, widths, i + 1, snap["items"][i], wrapped[i], heights[i])
+        if page_no == len(pages):
+            _draw_closing(c, font, y, snap, widths)
+
+        c.setFont(font, SMALL)
+        c.drawRightString(PAGE_W - MARGIN, MARGIN, f"{snap['doc_no']}  หน้า {page_no}/{len(pages)}")
+        c.showPage()
+
+    return len(pages)
+
+
+def render_sales_doc_pdf(snap: dict) -> bytes:
+    buf = BytesIO()
+    c = canvas.Canvas(buf, pagesize=A4)
+    c.setTitle(f"{snap['title']} {snap['doc_no']}")
+    draw_sales_doc(c, snap)
+    c.save()
+    return buf.getvalue()
+
+
+def render_sales_docs_batch(snapshots, out, progress=None, total: int | None = None) -> int:
+    """
+    หลายเอกสารเป็น PDF เดียว (เช่น ใบกำกับภาษีทั้งเดือน)
+    - snapshots: iterable -> สร้างทีละใบได้ ไม่ต้องโหลดทั้งหมดก่อน
+    return จำนวนเอกสาร
+    """
+    c = canvas.Canvas(out, pagesize=A4)
+    n = 0
+    for snap in snapshots:
+        draw_sales_doc(c, snap)
+        n += 1
+        if progress:
+            progress(n, total)
+    c.save()
+    return n
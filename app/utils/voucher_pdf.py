@@ -0,0 +1,475 @@
+from __future__ import annotations
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from io import BytesIO
+from multiprocessing import get_context
+
+from reportlab import rl_config
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfgen import canvas
+
+from pypdf import PdfReader, PdfWriter
+from pypdf.filters import ASCII85Decode
+from pypdf.generic import ArrayObject, NameObject, StreamObject
+
+from .pdf_fonts import thai_font
+from .sales_doc_pdf import _get_logo, _wrap
+from .withholding_pdf import _fmt_money, thai_baht_text
+
+# =========================================================
+# PDF ใบสำคัญจ่าย / ใบรับรองแทนใบเสร็จ แบบหลายโครงการ (1 ใบ / หน้า)
+# - หน้าตาเดียวกับ projects/vouchers/_pv_one.html และ print_receipt_cert.html
+# - PV / PV_WHT: หน้าขนาดครึ่ง A4 (A5 แนวนอน) -> พิมพ์ 2 ใบต่อแผ่นได้เหมือนเดิม
+# - RR: A4 แนวตั้ง ฟอร์มอยู่ครึ่งบน
+# - เยอะ -> แบ่งเป็นก้อน render ใน process pool (1 canvas ต่อก้อน) แล้วต่อกันตามลำดับ
+# =========================================================
+
+DOC_TYPES = ("PV", "RR", "PV_WHT")
+DOC_TITLES = {
+    "PV": ("ใบสำคัญจ่าย", "PAYMENT VOUCHER"),
+    "PV_WHT": ("ใบสำคัญจ่าย", "PAYMENT VOUCHER"),
+    "RR": ("ใบรับรองแทนใบเสร็จรับเงิน", "RECEIPT REPLACEMENT CERTIFICATE"),
+}
+
+# ข้อความคงที่ในฟอร์ม (ตรงกับ template HTML)
+COMPANY_NAME = "บริษัท ไจแอ้นท์ เดคคอเรชั่น จำกัด"
+RR_CERTIFIER = "นางสาวเดือนเพ็ญ บุญป้อง"
+PV_NOTE = "เอกสารนี้ใช้ประกอบการจ่ายเงิน/เบิกค่าใช้จ่ายของโครงการ"
+
+LOGO_REL = "static/brand/giant_logo.png"
+SIGN_PREPARED_REL = "static/brand/sign_prepared.png"
+SIGN_APPROVED_REL = "static/brand/sign_approved.png"
+
+# ช่องลายเซ็น (ชื่อช่อง, รูปลายเซ็น | None)
+_PV_SIGNS = [("ผู้รับเงิน", None), ("ผู้จัดทำ", SIGN_PREPARED_REL), ("ผู้อนุมัติ", SIGN_APPROVED_REL)]
+SIGN_BLOCKS = {
+    "PV": _PV_SIGNS,
+    "PV_WHT": _PV_SIGNS,
+    "RR": [("ผู้เบิกเงิน (พนักงาน)", None), ("ผู้รับเงิน (แทน)", SIGN_PREPARED_REL), ("ผู้อนุมัติ", SIGN_APPROVED_REL)],
+}
+
+PAGE_W = A4[0]
+HALF_H = A4[1] / 2
+MARGIN = 28
+CONTENT_W = PAGE_W - 2 * MARGIN
+
+FONT_SIZE = 11
+SMALL = 9
+TITLE_SIZE = 13
+
+# (หัวคอลัมน์, อังกฤษ, สัดส่วนความกว้าง, ชิด L/C/R) — None = ที่เหลือ (ช่องรายการ)
+PV_COLUMNS = [
+    ("รหัสบัญชี", "Account", 0.18, "C"),
+    ("เลขที่สินค้า", "No.", 0.15, "C"),
+    ("รายการ", "Particulars", None, "L"),
+    ("จำนวนเงิน Amount", "บาท Baht", 0.20, "R"),
+]
+RR_COLUMNS = [
+    ("ลำดับ", "", 0.08, "C"),
+    ("ชื่อ", "", None, "L"),
+    ("ราคา/หน่วย", "", 0.18, "R"),
+    ("จำนวน", "", 0.12, "C"),
+    ("รวม", "", 0.18, "R"),
+]
+HEAD_H = 24
+ROW_H = 26
+TOTAL_H = 18
+SIGN_IMG_H = 30
+
+BATCH_POOL_MIN_DOCS = 40
+
+
+def _app_dir() -> str:
+    return os.path.dirname(os.path.dirname(__file__))
+
+
+def _abs(rel: str) -> str:
+    return os.path.join(_app_dir(), rel)
+
+
+def _d(v) -> Decimal:
+    return Decimal(str(v if v is not None else 0))
+
+
+def _fit(text: str, font: str, size: float, max_width: float) -> str:
+    """ตัดท้ายด้วย … ถ้ายาวเกินช่อง"""
+    text = text or ""
+    width = pdfmetrics.stringWidth
+    if width(text, font, size) <= max_width:
+        return text
+    while text and width(text + "…", font, size) > max_width:
+        text = text[:-1]
+    return text + "…"
+
+
+def _widths(columns: list) -> list:
+    fixed = sum(CONTENT_W * r for _t, _e, r, _a in columns if r)
+    return [CONTENT_W * r if r else CONTENT_W - fixed for _t, _e, r, _a in columns]
+
+
+def voucher_total(snap: dict) -> Decimal:
+    if snap["doc_type"] == "PV_WHT":
+        return _d(snap.get("contract_amount")) - _d(snap.get("withholding_amount"))
+    return _d(snap.get("amount"))
+
+
+# -------------------------
+# Drawing (กล่องครึ่ง A4: top = ขอบบน)
+# -------------------------
+def _draw_image(c: canvas.Canvas, rel: str, x: float, y: float, max_w: float, max_h: float, center: bool = False) -> None:
+    img = _get_logo(_abs(rel))
+    if img is None:
+        return
+    iw, ih = img.getSize()
+    scale = min(max_w / iw, max_h / ih)
+    w, h = iw * scale, ih * scale
+    if center:
+        x -= w / 2
+    c.drawImage(img, x, y, width=w, height=h, mask="auto")
+
+
+def _draw_header(c: canvas.Canvas, font: str, top: float, snap: dict) -> float:
+    """โลโก้ + ชื่อบริษัท/ชื่อเอกสาร + กล่องเลขที่/วันที่ -> y ถัดไป"""
+    y0 = top - MARGIN
+    name_th, name_en = DOC_TITLES[snap["doc_type"]]
+    cx = PAGE_W / 2
+    c.setFont(font, TITLE_SIZE)
+    c.drawCentredString(cx, y0 - 12, f"{COMPANY_NAME}  (สำนักงานใหญ่)")
+    c.setFont(font, 12)
+    c.drawCentredString(cx, y0 - 28, name_th)
+    c.setFont(font, SMALL)
+    c.drawCentredString(cx, y0 - 40, name_en)
+
+    bw, bh, split = 140, 18, 62
+    bx = PAGE_W - MARGIN - bw
+    c.rect(bx, y0 - 2 * bh, bw, 2 * bh)
+    c.line(bx, y0 - bh, bx + bw, y0 - bh)
+    c.line(bx + split, y0 - 2 * bh, bx + split, y0)
+    c.setFont(font, SMALL)
+    c.drawString(bx + 4, y0 - bh + 5, "เลขที่ No.")
+    c.drawString(bx + 4, y0 - 2 * bh + 5, "วันที่ Date")
+    c.setFont(font, FONT_SIZE - 1)
+    c.drawString(bx + split + 4, y0 - bh + 5, snap.get("doc_no") or "")
+    c.drawString(bx + split + 4, y0 - 2 * bh + 5, snap.get("date") or "")
+
+    return y0 - 58
+
+
+def _draw_project(c: canvas.Canvas, font: str, y: float, snap: dict, left_w: float) -> None:
+    c.setFont(font, FONT_SIZE)
+    project = snap.get("project_code") or ""
+    if snap.get("project_name"):
+        project += f" — {snap['project_name']}"
+    label = "งาน/โครงการ " if snap["doc_type"] != "RR" else "โครงการ "
+    c.drawRightString(PAGE_W - MARGIN, y, _fit(label + project, font, FONT_SIZE, CONTENT_W - left_w - 10))
+
+
+def _blank(c: canvas.Canvas, x: float, y: float, w: float) -> float:
+    """เส้นเติมคำ -> x ท้ายเส้น"""
+    c.setDash(1, 2)
+    c.line(x, y - 2, x + w, y - 2)
+    c.setDash()
+    return x + w
+
+
+def _draw_table(c: canvas.Canvas, font: str, y: float, columns: list, rows: list, total: Decimal, total_label: str) -> float:
+    """
+    rows: [(cells, บรรทัดรองของช่องรายการ | None), ...]
+    -> y ใต้แถวรวม
+    """
+    widths = _widths(columns)
+    xs = [MARGIN]
+    for w in widths:
+        xs.append(xs[-1] + w)
+    height = HEAD_H + ROW_H * len(rows) + TOTAL_H
+
+    c.rect(MARGIN, y - height, CONTENT_W, height)
+    for x in xs[1:-1]:
+        c.line(x, y, x, y - height + TOTAL_H)
+    c.line(MARGIN, y - HEAD_H, PAGE_W - MARGIN, y - HEAD_H)
+    c.setLineWidth(1.5)
+    c.line(MARGIN, y - height + TOTAL_H, PAGE_W - MARGIN, y - height + TOTAL_H)
+    c.setLineWidth(1)
+    c.line(xs[-2], y - height + TOTAL_H, xs[-2], y - height)
+
+    for i, (th, en, _r, _a) in enumerate(columns):
+        cx = (xs[i] + xs[i + 1]) / 2
+        c.setFont(font, FONT_SIZE - 1)
+        c.drawCentredString(cx, y - (11 if en else 15), th)
+        if en:
+            c.setFont(font, SMALL - 1)
+            c.drawCentredString(cx, y - 21, en)
+
+    ry = y - HEAD_H
+    for cells, sub in rows:
+        for i, v in enumerate(cells):
+            align = columns[i][3]
+            c.setFont(font, FONT_SIZE)
+            if align == "L":
+                c.drawString(xs[i] + 4, ry - 12, _fit(v, font, FONT_SIZE, widths[i] - 8))
+                if sub:
+                    c.setFont(font, SMALL)
+                    c.drawString(xs[i] + 4, ry - 22, _fit(sub, font, SMALL, widths[i] - 8))
+            elif align == "C":
+                c.drawCentredString((xs[i] + xs[i + 1]) / 2, ry - 15, v)
+            else:
+                c.drawRightString(xs[i + 1] - 4, ry - 15, v)
+        ry -= ROW_H
+
+    c.setFont(font, FONT_SIZE)
+    c.drawRightString(xs[-2] - 4, ry - 13, total_label)
+    c.drawRightString(xs[-1] - 4, ry - 13, _fmt_money(total))
+    return ry - TOTAL_H
+
+
+def _sign_slots(top: float, blocks: list):
+    """(cx, ความกว้างช่อง, y เส้นเซ็น, (label, รูป)) ของช่องลายเซ็นที่ชิดล่างกล่อง"""
+    w = CONTENT_W / len(blocks)
+    line_y = top - HALF_H + MARGIN + 8
+    for i, block in enumerate(blocks):
+        yield MARGIN + w * i + w / 2, w, line_y, block
+
+
+def _draw_images(c: canvas.Canvas, top: float, doc_type: str) -> None:
+    """
+    โลโก้ + รูปลายเซ็น: วาดครั้งเดียวต่อ canvas เป็น form XObject แล้ววางซ้ำทุกหน้า
+    (drawImage ทุกหน้า = hash รูปใหม่ทุกครั้ง ช้ากว่าตัวหนังสือทั้งใบ)
+    """
+    name = f"voucher_images_{doc_type}"
+    if not c.hasForm(name):
+        c.beginForm(name)
+        _draw_image(c, LOGO_REL, MARGIN, top - MARGIN - 44, 90, 44)
+        for cx, w, line_y, (_label, rel) in _sign_slots(top, SIGN_BLOCKS[doc_type]):
+            if rel:
+                _draw_image(c, rel, cx, line_y + 1, w - 40, SIGN_IMG_H, center=True)
+        c.endForm()
+    c.doForm(name)
+
+
+def _draw_signatures(c: canvas.Canvas, font: str, top: float, doc_type: str) -> None:
+    """ชื่อช่อง + เส้นเซ็น + วันที่ (รูปลายเซ็นอยู่ใน _draw_images)"""
+    for cx, w, line_y, (label, _rel) in _sign_slots(top, SIGN_BLOCKS[doc_type]):
+        c.setFont(font, FONT_SIZE - 1)
+        c.drawCentredString(cx, line_y + SIGN_IMG_H + 8, label)
+        c.line(cx - w / 2 + 20, line_y, cx + w / 2 - 20, line_y)
+        c.setFont(font, SMALL)
+        c.drawCentredString(cx, line_y - 14, "วันที่ ____/____/____")
+
+
+def _draw_pv(c: canvas.Canvas, font: str, top: float, snap: dict) -> None:
+    is_wht = snap["doc_type"] == "PV_WHT"
+    y = _draw_header(c, font, top, snap)
+
+    # จ่ายให้ + โครงการ
+    c.setFont(font, FONT_SIZE)
+    c.drawString(MARGIN, y, "จ่ายให้")
+    x0 = MARGIN + pdfmetrics.stringWidth("จ่ายให้ ", font, FONT_SIZE)
+    _blank(c, x0, y, 210)
+    if is_wht:
+        c.drawString(x0 + 4, y, _fit(snap.get("vendor_name") or "", font, FONT_SIZE, 204))
+    _draw_project(c, font, y, snap, x0 - MARGIN + 210)
+
+    # ช่องทางจ่าย
+    y -= 18
+    x = MARGIN
+    for label, w, tick in (("เงินสด", 60, False), ("โอน", 80, is_wht), ("เช็คธนาคาร", 90, False), ("เลขที่เช็ค", 90, False)):
+        c.drawString(x, y, label)
+        x += pdfmetrics.stringWidth(label + " ", font, FONT_SIZE)
+        if label == "โอน":
+            c.rect(x, y - 1, 9, 9)
+            if tick:
+                c.lines([(x + 2, y + 3.5, x + 4, y + 1), (x + 4, y + 1, x + 8, y + 8)])
+            x += 13
+        x = _blank(c, x, y, w) + 12
+
+    y -= 16
+    c.setFont(font, SMALL + 0.5)
+    c.drawString(MARGIN, y, "เรียกคืนที่")
+    x = _blank(c, MARGIN + pdfmetrics.stringWidth("เรียกคืนที่ ", font, SMALL + 0.5), y, 200) + 8
+    c.drawString(x, y, "งาน")
+    _blank(c, x + pdfmetrics.stringWidth("งาน ", font, SMALL + 0.5), y, 120)
+
+    # ตาราง
+    total = voucher_total(snap)
+    if is_wht:
+        rows = [
+            (["", "", "จ้างทำของ", _fmt_money(snap.get("contract_amount"))], None),
+            (["", "", f"ภาษีหัก ณ ที่จ่าย {_d(snap.get('withholding_rate')):.2f}%", _fmt_money(snap.get("withholding_amount"))], None),
+        ]
+    else:
+        rows = [
+            (["", snap.get("ref_no") or "", snap.get("title") or "", _fmt_money(snap.get("amount"))], snap.get("particular")),
+            (["", "", "", ""], None),
+        ]
+    y = _draw_table(c, font, y - 10, PV_COLUMNS, rows, total, "รวม")
+
+    # จำนวนเงินตัวอักษร
+    y -= 15
+    c.setFont(font, SMALL)
+    c.drawString(MARGIN, y, "จำนวนเงิน (ตัวอักษร)")
+    c.setFont(font, FONT_SIZE)
+    c.drawString(MARGIN + 100, y, thai_baht_text(total))
+    y -= 12
+    c.setFont(font, SMALL - 1)
+    c.drawString(MARGIN, y, PV_NOTE)
+
+    _draw_signatures(c, font, top, snap["doc_type"])
+
+
+def _draw_rr(c: canvas.Canvas, font: str, top: float, snap: dict) -> None:
+    y = _draw_header(c, font, top, snap)
+
+    c.setFont(font, FONT_SIZE)
+    c.drawString(MARGIN, y, f"ข้าพเจ้า {RR_CERTIFIER}")
+    x = _blank(c, MARGIN + pdfmetrics.stringWidth(f"ข้าพเจ้า {RR_CERTIFIER} ", font, FONT_SIZE), y, 30) + 10
+    c.drawString(x, y, "พนักงานฝ่าย")
+    x = _blank(c, x + pdfmetrics.stringWidth("พนักงานฝ่าย ", font, FONT_SIZE), y, 70)
+    _draw_project(c, font, y, snap, x - MARGIN)
+
+    paragraph = (
+        "ขอรับรองว่าได้จ่ายค่าใช้จ่ายต่างๆดังต่อไปนี้ ไม่สามารถเรียกเก็บใบเสร็จรับเงินจากผู้รับเงินได้ "
+        f"และข้าพเจ้าได้จ่ายค่าใช้จ่ายดังกล่าว อันเกี่ยวข้องกับกิจการของ {COMPANY_NAME} (สนญ) โดยแท้จริง"
+    )
+    c.setFont(font, SMALL + 0.5)
+    for line in _wrap(paragraph, font, SMALL + 0.5, CONTENT_W, max_lines=3):
+        y -= 13
+        c.drawString(MARGIN, y, line)
+
+    amount = voucher_total(snap)
+    rows = [(["1", snap.get("title") or "", _fmt_money(amount), "1", _fmt_money(amount)], snap.get("particular"))]
+    y = _draw_table(c, font, y - 8, RR_COLUMNS, rows, amount, "รวมเงิน")
+
+    y -= 15
+    c.setFont(font, SMALL)
+    c.drawString(MARGIN, y, "จำนวนเงินตัวอักษร (บาท)")
+    c.setFont(font, FONT_SIZE)
+    c.drawString(MARGIN + 110, y, thai_baht_text(amount))
+
+    _draw_signatures(c, font, top, snap["doc_type"])
+
+
+def page_size(doc_type: str) -> tuple:
+    return A4 if doc_type == "RR" else (PAGE_W, HALF_H)
+
+
+def draw_voucher(c: canvas.Canvas, snap: dict) -> None:
+    """วาด 1 ใบ = 1 หน้า ต่อท้าย canvas"""
+    font = thai_font()
+    w, h = page_size(snap["doc_type"])
+    c.setPageSize((w, h))
+    _draw_images(c, h, snap["doc_type"])
+    if snap["doc_type"] == "RR":
+        _draw_rr(c, font, h, snap)
+    else:
+        _draw_pv(c, font, h, snap)
+    c.showPage()
+
+
+# -------------------------
+# Batch (process pool)
+# -------------------------
+def render_vouchers_chunk(snapshots: list) -> bytes:
+    buf = BytesIO()
+    c = canvas.Canvas(buf, pagesize=page_size(snapshots[0]["doc_type"]) if snapshots else A4)
+    for snap in snapshots:
+        draw_voucher(c, snap)
+    c.save()
+    return buf.getvalue()
+
+
+def _warm_worker() -> None:
+    # ✅ โหลด font + รูปโลโก้/ลายเซ็นครั้งเดียวต่อ process
+    thai_font()
+    for rel in (LOGO_REL, SIGN_PREPARED_REL, SIGN_APPROVED_REL):
+        _get_logo(_abs(rel))
+
+
+def _init_pool_worker() -> None:
+    # ✅ stream แบบ binary (ไม่ห่อ ASCII85): ไฟล์เล็กลง และไม่ต้อง encode ด้วย python ทุกหน้า
+    # rl_config เป็นค่า global ของ process -> ตั้งเฉพาะใน worker ของ pool เท่านั้น
+    # (ห้ามตั้งใน web process: จะเปลี่ยน encoding ของ PDF อื่นทุกตัวที่ render หลังจากนั้น)
+    rl_config.useA85 = 0
+    _warm_worker()
+
+
+def _strip_a85(writer: PdfWriter) -> None:
+    """
+    เอาชั้น ASCII85 ออกจาก stream ที่ render ใน web process (rl_config.useA85 เปลี่ยนไม่ได้)
+    -> ได้ไฟล์ binary ขนาดเท่ากับที่ worker ของ pool ทำ (4 ใบ 600KB -> 483KB)
+    """
+    for obj in writer._objects:
+        if not isinstance(obj, StreamObject):
+            continue
+        filters = obj.get("/Filter")
+        if not isinstance(filters, ArrayObject) or not filters or filters[0] != "/ASCII85Decode":
+            continue
+        obj._data = ASCII85Decode.decode(obj._data)
+        rest = filters[1:]
+        if rest:
+            obj[NameObject("/Filter")] = rest[0] if len(rest) == 1 else ArrayObject(rest)
+        else:
+            del obj["/Filter"]
+        parms = obj.get("/DecodeParms")
+        if isinstance(parms, ArrayObject):
+            obj[NameObject("/DecodeParms")] = ArrayObject(parms[1:])
+
+
+def _chunks(snapshots: list, workers: int) -> list:
+    # หลายก้อนต่อ worker -> งานกระจายทั่ว, แต่ละก้อนฝัง font ครั้งเดียว
+    size = max(1, -(-len(snapshots) // (workers * 4)))
+    return [snapshots[i:i + size] for i in range(0, len(snapshots), size)]
+
+
+def _render_all(snapshots: list, workers: int):
+    if workers <= 1:
+        _warm_worker()
+        yield len(snapshots), render_vouchers_chunk(snapshots)
+        return
+
+    chunks = _chunks(snapshots, workers)
+    # spawn: ไม่ fork web process ที่มี thread / DB connection ค้างอยู่
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=get_context("spawn"),
+        initializer=_init_pool_worker,
+    ) as pool:
+        for chunk, pdf in zip(chunks, pool.map(render_vouchers_chunk, chunks)):
+            yield len(chunk), pdf
+
+
+def render_vouchers_batch(snapshots: list, out, workers: int | None = None, progress=None) -> int:
+    """
+    หลายใบเป็น PDF เดียว (เรียงตาม snapshots, 1 ใบ / หน้า)
+    - workers: จำนวน process (None = จำนวน CPU, ไม่เกินจำนวน CPU)
+    - progress(done, total)
+    return จำนวนใบ
+    """
+    total = len(snapshots)
+    cpus = os.cpu_count() or 1
+    workers = max(1, min(int(workers or cpus), cpus))
+    if total < BATCH_POOL_MIN_DOCS:
+        workers = 1  # ไม่คุ้มค่าเปิด process ใหม่
+
+    writer = PdfWriter()
+    done = 0
+    for n, pdf in _render_all(snapshots, workers):
+        writer.append(PdfReader(BytesIO(pdf)))
+        done += n
+        if progress:
+            progress(done, total)
+
+    # ✅ แต่ละก้อนจาก pool ฝังโลโก้/ลายเซ็นชุดเดียวกันมาเอง -> รวม object ที่เหมือนกันเหลือชุดเดียว
+    # รอบแรกรวม SMask, รอบสองรวมรูปที่ชี้ SMask ตัวเดียวกันแล้ว (4 ก้อน 2.4MB -> 0.6MB)
+    for _ in range(2):
+        writer.compress_identical_objects()
+    _strip_a85(writer)
+
+    if isinstance(out, (str, os.PathLike)):
+        with open(out, "wb") as f:
+            writer.write(f)
+    else:
+        writer.write(out)
+    return total
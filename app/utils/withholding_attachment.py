@@ -0,0 +1,360 @@
+from __future__ import annotations
+
+from datetime import date
+from decimal import Decimal
+
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfgen import canvas
+
+from .pdf_fonts import thai_font
+from .withholding_pdf import _digits_only, _fmt_money
+
+# =========================================================
+# ใบแนบ ภ.ง.ด.3 / ภ.ง.ด.53 (รายเดือน)
+# - 1 แผ่น = ROWS_PER_PAGE รายการ + รวมยอดต่อแผ่น, แผ่นสุดท้ายมีรวมทั้งสิ้น
+# - ส่วนที่เหมือนกันทุกแผ่น (หัวกระดาษ / ตาราง) วาดครั้งเดียวเป็น form XObject แล้ววางซ้ำ
+# - อ่านรายการแบบ stream (rows = ผลของ withholding_filing_rows + yield_per)
+# =========================================================
+
+ROWS_PER_PAGE = 6
+
+FORM_TITLES = {"PND3": "ภ.ง.ด.3", "PND53": "ภ.ง.ด.53"}
+
+TH_MONTHS = [
+    "มกราคม", "กุมภาพันธ์", "มีนาคม", "เมษายน", "พฤษภาคม", "มิถุนายน",
+    "กรกฎาคม", "สิงหาคม", "กันยายน", "ตุลาคม", "พฤศจิกายน", "ธันวาคม",
+]
+
+# เงื่อนไขการหักภาษี: 1 = หัก ณ ที่จ่าย (ระบบออกเฉพาะแบบนี้)
+CONDITION_WITHHELD = "1"
+
+# (หัวคอลัมน์, ความกว้าง pt)
+COLUMNS = [
+    ("ลำดับที่", 30),
+    ("เลขประจำตัวผู้เสียภาษีอากร", 95),
+    ("ชื่อและที่อยู่ของผู้มีเงินได้", 250),
+    ("วัน เดือน ปี ที่จ่าย", 60),
+    ("ประเภทเงินได้", 120),
+    ("อัตราภาษีร้อยละ", 45),
+    ("จำนวนเงินที่จ่าย", 85),
+    ("ภาษีที่หักและนำส่ง", 85),
+    ("เงื่อนไข", 32),
+]
+
+PAGE_W, PAGE_H = landscape(A4)
+MARGIN_X = 20
+TABLE_TOP = PAGE_H - 110
+HEADER_ROW_H = 26
+ROW_H = 52
+TOTAL_ROW_H = 20
+FONT_SIZE = 11
+
+
+def period_label(period: date) -> str:
+    return f"{TH_MONTHS[period.month - 1]} พ.ศ. {period.year + 543}"
+
+
+def page_count(total_rows: int) -> int:
+    return max(1, -(-int(total_rows) // ROWS_PER_PAGE))
+
+
+def _pages(rows):
+    """แบ่ง rows (iterable) เป็นชุดละ ROWS_PER_PAGE โดยไม่โหลดทั้งหมดเข้า memory"""
+    page = []
+    for r in rows:
+        page.append(r)
+        if len(page) == ROWS_PER_PAGE:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+def _payee_address(r) -> str:
+    return " ".join((r.payee_address or "").split())
+
+
+def _income_text(r) -> str:
+    parts = [p for p in (r.income_type, r.description) if p]
+    return " ".join(parts)
+
+
+def _col_x() -> list:
+    xs = [MARGIN_X]
+    for _title, w in COLUMNS:
+        xs.append(xs[-1] + w)
+    return xs
+
+
+def _wrap(text: str, font: str, size: int, max_width: float, max_lines: int) -> list:
+    words = (text or "").split()
+    lines, cur = [], ""
+    for w in words:
+        test = (cur + " " + w).strip()
+        if pdfmetrics.stringWidth(test, font, size) <= max_width:
+            cur = test
+            continue
+        if cur:
+            lines.append(cur)
+        cur = w
+        if len(lines) >= max_lines:
+            break
+    if cur and len(lines) < max_lines:
+        lines.append(cur)
+    return lines[:max_lines]
+
+
+# -------------------------
+# PDF
+# -------------------------
+def _draw_page_form(c: canvas.Canvas, font: str, form_type: str, period: date, payer: dict) -> None:
+    """ส่วนคงที่ของทุกแผ่น -> form XObject 'attachment_page'"""
+    xs = _col_x()
+    table_bottom = TABLE_TOP - HEADER_ROW_H - ROWS_PER_PAGE * ROW_H - 2 * TOTAL_ROW_H
+
+    c.beginForm("attachment_page")
+    c.setFont(font, 18)
+    c.drawCentredString(PAGE_W / 2, PAGE_H - 40, f"ใบแนบ {FORM_TITLES.get(form_type, form_type)}")
+
+    c.setFont(font, 13)
+    tax_id = _digits_only(payer.get("tax_id") or "")
+    c.drawString(
+        MARGIN_X,
+        PAGE_H - 65,
+        f"เลขประจำตัวผู้เสียภาษีอากร (ของผู้มีหน้าที่หักภาษี ณ ที่จ่าย) {tax_id or '-'}"
+        f"    สาขาที่ {payer.get('branch_no') or '00000'}",
+    )
+    c.drawString(MARGIN_X, PAGE_H - 85, f"ชื่อผู้มีหน้าที่หักภาษี ณ ที่จ่าย {payer.get('name') or '-'}")
+    c.drawRightString(PAGE_W - MARGIN_X, PAGE_H - 85, f"เดือนที่จ่ายเงินได้ {period_label(period)}")
+
+    c.setLineWidth(0.6)
+    c.rect(xs[0], table_bottom, xs[-1] - xs[0], TABLE_TOP - table_bottom)
+
+    # หัวตาราง
+    c.setFont(font, FONT_SIZE)
+    header_bottom = TABLE_TOP - HEADER_ROW_H
+    c.line(xs[0], header_bottom, xs[-1], header_bottom)
+    for i, (title, w) in enumerate(COLUMNS):
+        lines = _wrap(title, font, FONT_SIZE, w - 4, 2)
+        yy = TABLE_TOP - 11 if len(lines) > 1 else TABLE_TOP - 16
+        for ln in lines:
+            c.drawCentredString(xs[i] + w / 2, yy, ln)
+            yy -= FONT_SIZE
+
+    # เส้นแบ่งแถว / คอลัมน์
+    c.setLineWidth(0.3)
+    rows_bottom = header_bottom - ROWS_PER_PAGE * ROW_H
+    for n in range(1, ROWS_PER_PAGE + 1):
+        y = header_bottom - n * ROW_H
+        c.line(xs[0], y, xs[-1], y)
+    for x in xs[1:-1]:
+        c.line(x, TABLE_TOP, x, rows_bottom)
+
+    # แถวรวม (ต่อแผ่น / ทั้งสิ้น) ใช้คอลัมน์เงินได้ + ภาษี
+    c.line(xs[0], rows_bottom - TOTAL_ROW_H, xs[-1], rows_bottom - TOTAL_ROW_H)
+    for x in (xs[6], xs[7], xs[8]):
+        c.line(x, rows_bottom, x, table_bottom)
+    c.drawRightString(
+        xs[6] - 4,
+        rows_bottom - 14,
+        f"รวมยอดเงินได้และภาษีที่นำส่ง (นำไปรวมกับใบแนบ {FORM_TITLES.get(form_type, form_type)} แผ่นอื่น (ถ้ามี))",
+    )
+
+    c.drawString(xs[5], table_bottom - 40, "ลงชื่อ ........................................................ ผู้จ่ายเงิน")
+    c.endForm()
+
+
+def _draw_row(c: canvas.Canvas, font: str, xs: list, top: float, seq: int, r) -> None:
+    c.setFont(font, FONT_SIZE)
+    base = top - 14
+
+    c.drawCentredString((xs[0] + xs[1]) / 2, base, str(seq))
+    c.drawString(xs[1] + 3, base, _digits_only(r.payee_tax_id or ""))
+
+    name_w = xs[3] - xs[2] - 6
+    c.drawString(xs[2] + 3, base, (r.payee_name or "-")[:120])
+    yy = base - FONT_SIZE - 1
+    for ln in _wrap(_payee_address(r), font, FONT_SIZE - 1, name_w, 2):
+        c.setFont(font, FONT_SIZE - 1)
+        c.drawString(xs[2] + 3, yy, ln)
+        yy -= FONT_SIZE
+    c.setFont(font, FONT_SIZE)
+
+    if r.payment_date:
+        c.drawCentredString((xs[3] + xs[4]) / 2, base, r.payment_date.strftime("%d/%m/%Y"))
+
+    yy = base
+    for ln in _wrap(_income_text(r), font, FONT_SIZE, xs[5] - xs[4] - 6, 3):
+        c.drawString(xs[4] + 3, yy, ln)
+        yy -= FONT_SIZE
+
+    c.drawRightString(xs[6] - 3, base, _fmt_money(r.wht_rate))
+    c.drawRightString(xs[7] - 3, base, _fmt_money(r.base_amount))
+    c.drawRightString(xs[8] - 3, base, _fmt_money(r.wht_amount))
+    c.drawCentredString((xs[8] + xs[9]) / 2, base, CONDITION_WITHHELD)
+
+
+def render_attachment_pdf(
+    rows,
+    out,
+    form_type: str,
+    period: date,
+    payer: dict,
+    total_rows: int,
+    progress=None,
+) -> dict:
+    """
+    เขียนใบแนบลง out (path หรือ file object)
+    - total_rows: จำนวนรายการ (จาก SQL) -> ใช้พิมพ์ "แผ่นที่ x ในจำนวน y แผ่น"
+    return {"pages", "count", "base_total", "wht_total"}
+    """
+    font = thai_font()
+    xs = _col_x()
+    pages = page_count(total_rows)
+
+    c = canvas.Canvas(out, pagesize=(PAGE_W, PAGE_H))
+    c.setTitle(f"ใบแนบ {FORM_TITLES.get(form_type, form_type)} {period_label(period)}")
+    _draw_page_form(c, font, form_type, period, payer)
+
+    header_bottom = TABLE_TOP - HEADER_ROW_H
+    rows_bottom = header_bottom - ROWS_PER_PAGE * ROW_H
+    seq = 0
+    page_no = 0
+    base_total = Decimal("0")
+    wht_total = Decimal("0")
+
+    def _page_header(n: int) -> None:
+        c.doForm("attachment_page")
+        c.setFont(font, 13)
+        c.drawRightString(PAGE_W - MARGIN_X, PAGE_H - 40, f"แผ่นที่ {n} ในจำนวน {pages} แผ่น")
+
+    for page_rows in _pages(rows):
+        page_no += 1
+        _page_header(page_no)
+
+        page_base = Decimal("0")
+        page_wht = Decimal("0")
+        for i, r in enumerate(page_rows):
+            seq += 1
+            _draw_row(c, font, xs, header_bottom - i * ROW_H, seq, r)
+            page_base += Decimal(str(r.base_amount or 0))
+            page_wht += Decimal(str(r.wht_amount or 0))
+
+        base_total += page_base
+        wht_total += page_wht
+
+        c.setFont(font, FONT_SIZE)
+        c.drawRightString(xs[7] - 3, rows_bottom - 14, _fmt_money(page_base))
+        c.drawRightString(xs[8] - 3, rows_bottom - 14, _fmt_money(page_wht))
+        if page_no >= pages:
+            c.drawRightString(xs[6] - 4, rows_bottom - TOTAL_ROW_H - 14, "รวมทั้งสิ้น")
+            c.drawRightString(xs[7] - 3, rows_bottom - TOTAL_ROW_H - 14, _fmt_money(base_total))
+            c.drawRightString(xs[8] - 3, rows_bottom - TOTAL_ROW_H - 14, _fmt_money(wht_total))
+
+        c.showPage()
+        if progress:
+            progress(seq, total_rows)
+
+    if page_no == 0:
+        # ไม่มีรายการ -> ใบแนบเปล่า 1 แผ่น
+        _page_header(1)
+        c.showPage()
+        page_no = 1
+
+    c.save()
+    return {"pages": page_no, "count": seq, "base_total": base_total, "wht_total": wht_total}
+
+
+# -------------------------
+# Excel
+# -------------------------
+def write_attachment_sheet(wb, rows, form_type: str, period: date, payer: dict, progress=None, total_rows=None) -> dict:
+    """
+    เพิ่ม sheet ใบแนบลง write_only workbook (ต้องเรียก xlsx_stream.add_named_styles ก่อน)
+    - แถวรวมต่อแผ่นทุก ROWS_PER_PAGE รายการ + ตัดหน้าพิมพ์ตรงนั้น
+    """
+    from openpyxl.worksheet.pagebreak import Break
+
+    from . import xlsx_stream
+
+    title = FORM_TITLES.get(form_type, form_type)
+    ws = wb.create_sheet(title=f"{form_type} {period:%Y-%m}")
+    ws.page_setup.orientation = "landscape"
+    ws.page_setup.paperSize = "9"  # A4
+    for letter, width in zip("ABCDEFGHI", (8, 18, 45, 12, 28, 10, 16, 16, 9)):
+        ws.column_dimensions[letter].width = width
+
+    ws.append([f"ใบแนบ {title}", "", "", "", "", "", "", "", f"เดือนที่จ่ายเงินได้ {period_label(period)}"])
+    ws.append(
+        [
+            "เลขประจำตัวผู้เสียภาษีอากร",
+            _digits_only(payer.get("tax_id") or ""),
+            payer.get("name") or "",
+            "สาขาที่",
+            payer.get("branch_no") or "00000",
+        ]
+    )
+    ws.append([])
+    ws.append(xlsx_stream.row(ws, [t for t, _w in COLUMNS], style="xl_header"))
+    ws.print_title_rows = "4:4"
+    row_no = 4
+
+    seq = 0
+    page_no = 0
+    base_total = Decimal("0")
+    wht_total = Decimal("0")
+
+    for page_rows in _pages(rows):
+        page_no += 1
+        page_base = Decimal("0")
+        page_wht = Decimal("0")
+        for r in page_rows:
+            seq += 1
+            base = Decimal(str(r.base_amount or 0))
+            wht = Decimal(str(r.wht_amount or 0))
+            page_base += base
+            page_wht += wht
+            name = r.payee_name or ""
+            address = _payee_address(r)
+            ws.append(
+                xlsx_stream.row(
+                    ws,
+                    [
+                        seq,
+                        _digits_only(r.payee_tax_id or ""),
+                        f"{name}\n{address}" if address else name,
+                        r.payment_date.strftime("%d/%m/%Y") if r.payment_date else "",
+                        _income_text(r),
+                        float(r.wht_rate or 0),
+                        float(base),
+                        float(wht),
+                        CONDITION_WITHHELD,
+                    ],
+                )
+            )
+            row_no += 1
+
+        base_total += page_base
+        wht_total += page_wht
+        ws.append(
+            xlsx_stream.row(
+                ws,
+                ["", "", f"รวมแผ่นที่ {page_no}", "", "", "", float(page_base), float(page_wht), ""],
+                style="xl_total",
+            )
+        )
+        row_no += 1
+        ws.row_breaks.append(Break(id=row_no))
+
+        if progress:
+            progress(seq, total_rows)
+
+    ws.append(
+        xlsx_stream.row(
+            ws,
+            ["", "", "รวมทั้งสิ้น", "", "", "", float(base_total), float(wht_total), ""],
+            style="xl_total",
+        )
+    )
+    return {"pages": max(1, page_no), "count": seq, "base_total": base_total, "wht_total": wht_total}
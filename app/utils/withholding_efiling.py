@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+from decimal import Decimal
+
+# =========================================================
+# RD e-Filing: ไฟล์ข้อความคั่นด้วย | สำหรับนำเข้า ภ.ง.ด.3 / ภ.ง.ด.53
+# - 1 บรรทัด = 1 รายการ (ไม่มีบรรทัดหัว)
+# - วันที่ dd/mm/yyyy (พ.ศ.), จำนวนเงินทศนิยม 2 ตำแหน่งไม่มี comma
+# - ตรวจเลขประจำตัวผู้เสียภาษี 13 หลัก (check digit) ระหว่างเขียน
+#
+# PND3 : ลำดับ|เลขผู้เสียภาษี|สาขา|คำนำหน้า|ชื่อ|นามสกุล|ที่อยู่|วันที่จ่าย|ประเภทเงินได้|อัตรา|เงินได้|ภาษี|เงื่อนไข
+# PND53: ลำดับ|เลขผู้เสียภาษี|สาขา|คำนำหน้า|ชื่อนิติบุคคล|ที่อยู่|วันที่จ่าย|ประเภทเงินได้|อัตรา|เงินได้|ภาษี|เงื่อนไข
+# =========================================================
+
+EFILING_ENCODINGS = ("cp874", "utf-8")
+
+HEAD_OFFICE_BRANCH = "00000"
+CONDITION_WITHHELD = "1"
+
+PERSON_TITLES = ("นางสาว", "นาย", "นาง", "น.ส.")
+ENTITY_TITLES = ("บริษัท", "ห้างหุ้นส่วนจำกัด", "ห้างหุ้นส่วนสามัญ", "หจก.", "บจก.")
+
+
+def valid_tax_id(tax_id: str) -> bool:
+    """เลขประจำตัวผู้เสียภาษี / บัตรประชาชน 13 หลัก + check digit (mod 11)"""
+    if len(tax_id) != 13 or not tax_id.isdigit():
+        return False
+    total = sum(int(tax_id[i]) * (13 - i) for i in range(12))
+    return (11 - total % 11) % 10 == int(tax_id[12])
+
+
+def _digits(s) -> str:
+    return "".join(ch for ch in (s or "") if ch.isdigit())
+
+
+def _text(s) -> str:
+    # ห้ามมี | หรือขึ้นบรรทัดใหม่ในฟิลด์
+    return " ".join(str(s or "").replace("|", " ").split())
+
+
+def _money(v) -> str:
+    return f"{Decimal(str(v or 0)):.2f}"
+
+
+def _rate(v) -> str:
+    d = Decimal(str(v or 0))
+    return f"{d:.2f}".rstrip("0").rstrip(".") if d else "0"
+
+
+def _be_date(d) -> str:
+    return f"{d.day:02d}/{d.month:02d}/{d.year + 543}" if d else ""
+
+
+def _split_title(name: str, titles) -> tuple:
+    for t in titles:
+        if name.startswith(t):
+            return t, name[len(t):].strip()
+    return "", name
+
+
+def _income(r) -> str:
+    return _text(" ".join(p for p in (r.income_type, r.description) if p))
+
+
+def efiling_line(seq: int, r) -> str:
+    """r = แถวจาก withholding_filing_rows"""
+    tax_id = _digits(r.payee_tax_id)
+    name = _text(r.payee_name)
+    tail = [
+        _text(r.payee_address),
+        _be_date(r.payment_date),
+        _income(r),
+        _rate(r.wht_rate),
+        _money(r.base_amount),
+        _money(r.wht_amount),
+        CONDITION_WITHHELD,
+    ]
+
+    if r.form_type == "PND3":
+        title, rest = _split_title(name, PERSON_TITLES)
+        first, _, last = rest.partition(" ")
+        head = [str(seq), tax_id, HEAD_OFFICE_BRANCH, title, first, last.strip()]
+    else:
+        title, rest = _split_title(name, ENTITY_TITLES)
+        head = [str(seq), tax_id, HEAD_OFFICE_BRANCH, title, rest]
+
+    return "|".join(head + tail)
+
+
+def write_efiling(rows, fh, encoding: str = "cp874", progress=None, total=None, max_errors: int = 100) -> dict:
+    """
+    เขียนไฟล์ e-Filing ลง fh (binary) ทีละบรรทัด
+    - rows: iterable (เช่น result ที่อ่านด้วย yield_per) -> ไม่โหลดทั้งปีเข้า memory
+    - รายการที่เลขผู้เสียภาษีไม่ถูกต้อง / encode ไม่ได้ -> ไม่เขียน แต่เก็บไว้ใน errors
+    return {"count": จำนวนที่เขียน, "errors": [{"doc_no", "tax_id", "error"}], "error_count"}
+    """
+    count = 0
+    seen = 0
+    errors = []
+    error_count = 0
+
+    for r in rows:
+        seen += 1
+        tax_id = _digits(r.payee_tax_id)
+        err = None
+        line = None
+        if not valid_tax_id(tax_id):
+            err = "เลขประจำตัวผู้เสียภาษีต้องเป็นตัวเลข 13 หลักที่ถูกต้อง"
+        else:
+            try:
+                line = (efiling_line(count + 1, r) + "\r\n").encode(encoding)
+            except UnicodeEncodeError:
+                err = f"มีตัวอักษรที่ {encoding} ไม่รองรับ"
+
+        if err:
+            error_count += 1
+            if len(errors) < max_errors:
+                errors.append({"doc_no": r.doc_no, "tax_id": r.payee_tax_id or "", "error": err})
+        else:
+            fh.write(line)
+            count += 1
+
+        if progress and seen % 500 == 0:
+            progress(seen, total)
+
+    return {"count": count, "errors": errors, "error_count": error_count}
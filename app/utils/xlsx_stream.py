@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import os
+import tempfile
+
+from flask import Response
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, NamedStyle, PatternFill, Side
+
+# =========================================================
+# Streaming XLSX (openpyxl write_only)
+# - แถวถูกเขียนลงไฟล์ทันที ไม่ค้างใน memory
+# - ส่งออกเป็น chunked stream จากไฟล์ชั่วคราว
+# =========================================================
+
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+XLSX_STREAM_CHUNK = 64 * 1024
+XLSX_YIELD_PER = 1000
+
+
+def add_named_styles(wb) -> None:
+    """
+    ✅ named styles สำหรับ write_only workbook (สไตล์เดียวกับ _excel_styles ใน pages)
+    - สร้างครั้งเดียวต่อไฟล์ แล้วอ้างชื่อ แทนการสร้าง style ใหม่ทุก cell
+    - xl_header / xl_body / xl_total
+    """
+    thin = Side(style="thin", color="3A3A3A")
+    border = Border(left=thin, right=thin, top=thin, bottom=thin)
+
+    wb.add_named_style(
+        NamedStyle(
+            name="xl_header",
+            fill=PatternFill("solid", fgColor="1F4E79"),
+            font=Font(color="FFFFFF", bold=True),
+            alignment=Alignment(vertical="center"),
+            border=border,
+        )
+    )
+    wb.add_named_style(
+        NamedStyle(name="xl_body", alignment=Alignment(vertical="center"), border=border)
+    )
+    wb.add_named_style(
+        NamedStyle(
+            name="xl_total",
+            fill=PatternFill("solid", fgColor="DDEBF7"),
+            font=Font(bold=True),
+            alignment=Alignment(vertical="center"),
+            border=border,
+        )
+    )
+
+
+def row(ws, values, style: str = "xl_body") -> list:
+    cells = []
+    for v in values:
+        cell = WriteOnlyCell(ws, value=v)
+        cell.style = style
+        cells.append(cell)
+    return cells
+
+
+def stream_temp_file(path: str, mimetype: str, download_name: str) -> Response:
+    """
+    ส่งไฟล์ชั่วคราวเป็น chunked stream แล้วลบทิ้งเมื่อส่งเสร็จ (หรือ client ตัดการเชื่อมต่อ)
+    - ใช้ generator แทน send_file: ไฟล์แบบ passthrough ไม่เรียก call_on_close
+    """
+
+    def generate():
+        try:
+            with open(path, "rb") as f:
+                while True:
+                    chunk = f.read(XLSX_STREAM_CHUNK)
+                    if not chunk:
+                        break
+                    yield chunk
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    resp = Response(generate(), mimetype=mimetype)
+    resp.headers["Content-Disposition"] = f'attachment; filename="{download_name}"'
+    return resp
+
+
+def stream_response(wb, download_name: str) -> Response:
+    """
+    save write_only workbook ลงไฟล์ชั่วคราว แล้วส่งเป็น chunked stream
+    - openpyxl ต้องปิด zip ก่อนถึงจะได้ไฟล์ที่สมบูรณ์ -> stream จากไฟล์ ไม่ใช่จาก memory
+    """
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        wb.save(path)
+    except Exception:
+        os.remove(path)
+        raise
+
+    return stream_temp_file(path, XLSX_MIMETYPE, download_name)
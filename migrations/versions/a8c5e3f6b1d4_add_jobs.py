@@ -0,0 +1,48 @@
+"""add jobs
+
+Revision ID: a8c5e3f6b1d4
+Revises: f7b4d2e5a0c3
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "a8c5e3f6b1d4"
+down_revision = "f7b4d2e5a0c3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "jobs",
+        sa.Column("id", sa.String(length=32), nullable=False),
+        sa.Column("kind", sa.String(length=40), nullable=False),
+        sa.Column("status", sa.String(length=20), nullable=False),
+        sa.Column("params", sa.JSON(), nullable=True),
+        sa.Column("progress", sa.Integer(), nullable=False),
+        sa.Column("message", sa.String(length=200), nullable=True),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("result_path", sa.String(length=500), nullable=True),
+        sa.Column("result_name", sa.String(length=200), nullable=True),
+        sa.Column("result_mimetype", sa.String(length=100), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.Column("expires_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    with op.batch_alter_table("jobs", schema=None) as batch_op:
+        batch_op.create_index("ix_jobs_status_created_at", ["status", "created_at"], unique=False)
+        batch_op.create_index("ix_jobs_expires_at", ["expires_at"], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table("jobs", schema=None) as batch_op:
+        batch_op.drop_index("ix_jobs_expires_at")
+        batch_op.drop_index("ix_jobs_status_created_at")
+
+    op.drop_table("jobs")
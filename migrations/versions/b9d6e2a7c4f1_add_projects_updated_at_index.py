@@ -0,0 +1,25 @@
+"""add projects updated_at index
+
+Revision ID: b9d6e2a7c4f1
+Revises: a8c5e3f6b1d4
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b9d6e2a7c4f1"
+down_revision = "a8c5e3f6b1d4"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # index สำหรับ GET /api/projects (keyset pagination เรียง updated_at, id)
+    op.create_index("ix_projects_updated_at_id", "projects", ["updated_at", "id"], unique=False)
+
+
+def downgrade():
+    op.drop_index("ix_projects_updated_at_id", table_name="projects")
@@ -0,0 +1,80 @@
+"""add project cost rollups
+
+Revision ID: c4e1a9d2b7f0
+Revises: 3027f74a75f7
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "c4e1a9d2b7f0"
+down_revision = "3027f74a75f7"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "project_cost_rollups",
+        sa.Column("project_id", sa.Integer(), nullable=False),
+        sa.Column("materials_total", sa.Numeric(precision=14, scale=2), nullable=False),
+        sa.Column("subs_payable_total", sa.Numeric(precision=14, scale=2), nullable=False),
+        sa.Column("other_total", sa.Numeric(precision=14, scale=2), nullable=False),
+        sa.Column("advances_total", sa.Numeric(precision=14, scale=2), nullable=False),
+        sa.Column("grand_total", sa.Numeric(precision=14, scale=2), nullable=False),
+        sa.Column("materials_count", sa.Integer(), nullable=False),
+        sa.Column("subs_count", sa.Integer(), nullable=False),
+        sa.Column("other_count", sa.Integer(), nullable=False),
+        sa.Column("advances_count", sa.Integer(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["project_id"], ["projects.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("project_id"),
+    )
+
+    # backfill ยอดรวมของโครงการที่มีอยู่แล้ว
+    op.execute(
+        """
+        INSERT INTO project_cost_rollups (
+            project_id,
+            materials_total, subs_payable_total, other_total, advances_total, grand_total,
+            materials_count, subs_count, other_count, advances_count,
+            updated_at
+        )
+        SELECT
+            p.id,
+            COALESCE(m.total, 0),
+            COALESCE(s.total, 0),
+            COALESCE(o.total, 0),
+            COALESCE(a.total, 0),
+            COALESCE(m.total, 0) + COALESCE(s.total, 0) + COALESCE(o.total, 0) + COALESCE(a.total, 0),
+            COALESCE(m.n, 0),
+            COALESCE(s.n, 0),
+            COALESCE(o.n, 0),
+            COALESCE(a.n, 0),
+            CURRENT_TIMESTAMP
+        FROM projects p
+        LEFT JOIN (
+            SELECT project_id, SUM(unit_price * qty) AS total, COUNT(id) AS n
+            FROM material_items GROUP BY project_id
+        ) m ON m.project_id = p.id
+        LEFT JOIN (
+            SELECT project_id, SUM(contract_amount - withholding_amount) AS total, COUNT(id) AS n
+            FROM subcontractor_payments GROUP BY project_id
+        ) s ON s.project_id = p.id
+        LEFT JOIN (
+            SELECT project_id, SUM(amount) AS total, COUNT(id) AS n
+            FROM other_expenses GROUP BY project_id
+        ) o ON o.project_id = p.id
+        LEFT JOIN (
+            SELECT project_id, SUM(amount) AS total, COUNT(id) AS n
+            FROM advance_expenses GROUP BY project_id
+        ) a ON a.project_id = p.id
+        """
+    )
+
+
+def downgrade():
+    op.drop_table("project_cost_rollups")
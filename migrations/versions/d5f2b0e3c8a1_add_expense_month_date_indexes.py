@@ -0,0 +1,46 @@
+"""add expense month date indexes
+
+Revision ID: d5f2b0e3c8a1
+Revises: c4e1a9d2b7f0
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "d5f2b0e3c8a1"
+down_revision = "c4e1a9d2b7f0"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # index สำหรับ dashboard รายจ่าย (กรองปีด้วยช่วงวันที่ของ COALESCE(วันที่จริง, created_at))
+    op.create_index("ix_material_items_created_at", "material_items", ["created_at"], unique=False)
+    op.create_index(
+        "ix_subcontractor_payments_month_date",
+        "subcontractor_payments",
+        [sa.text("COALESCE(pay_date, created_at)")],
+        unique=False,
+    )
+    op.create_index(
+        "ix_other_expenses_month_date",
+        "other_expenses",
+        [sa.text("COALESCE(expense_date, created_at)")],
+        unique=False,
+    )
+    op.create_index(
+        "ix_advance_expenses_month_date",
+        "advance_expenses",
+        [sa.text("COALESCE(advance_date, created_at)")],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index("ix_advance_expenses_month_date", table_name="advance_expenses")
+    op.drop_index("ix_other_expenses_month_date", table_name="other_expenses")
+    op.drop_index("ix_subcontractor_payments_month_date", table_name="subcontractor_payments")
+    op.drop_index("ix_material_items_created_at", table_name="material_items")
@@ -0,0 +1,98 @@
+"""add stored totals to sales_docs
+
+Revision ID: e6a3c1f4d9b2
+Revises: d5f2b0e3c8a1
+Create Date: 2026-10-17
+
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "e6a3c1f4d9b2"
+down_revision = "d5f2b0e3c8a1"
+branch_labels = None
+depends_on = None
+
+
+TOTAL_COLUMNS = ("subtotal", "vat_amount", "wht_amount", "gross_total", "grand_total")
+
+
+def _q2(v: Decimal) -> Decimal:
+    return v.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+def _nonneg(v: Decimal) -> Decimal:
+    return v if v > 0 else Decimal("0")
+
+
+def _d(v) -> Decimal:
+    if v is None:
+        return Decimal("0")
+    return Decimal(str(v))
+
+
+def _compute(subtotal, discount_amount, vat_rate, wht_rate) -> dict:
+    # ต้องตรงกับ SalesDoc.subtotal -> grand_total ใน app/models.py
+    subtotal = _q2(_nonneg(_d(subtotal)))
+    discount = _q2(_nonneg(_d(discount_amount)))
+    net_before_tax = _q2(_nonneg(subtotal - discount))
+    wht = _q2(_nonneg(net_before_tax * _d(wht_rate) / Decimal("100")))
+    net_after_wht = _q2(_nonneg(net_before_tax - wht))
+    vat = _q2(_nonneg(net_after_wht * _d(vat_rate) / Decimal("100")))
+    gross = _q2(_nonneg(net_after_wht + vat))
+    return {
+        "subtotal": subtotal,
+        "vat_amount": vat,
+        "wht_amount": wht,
+        "gross_total": gross,
+        "grand_total": gross,
+    }
+
+
+def upgrade():
+    with op.batch_alter_table("sales_docs", schema=None) as batch_op:
+        for name in TOTAL_COLUMNS:
+            batch_op.add_column(
+                sa.Column(name, sa.Numeric(precision=14, scale=2), nullable=False, server_default="0")
+            )
+        batch_op.create_index(
+            "ix_sales_docs_type_status_issue_date", ["doc_type", "status", "issue_date"], unique=False
+        )
+
+    # backfill จาก sales_items
+    conn = op.get_bind()
+    subtotals = dict(
+        conn.execute(
+            sa.text(
+                "SELECT doc_id, SUM(qty * unit_price - COALESCE(discount_amount, 0)) "
+                "FROM sales_items GROUP BY doc_id"
+            )
+        ).fetchall()
+    )
+    docs = conn.execute(
+        sa.text("SELECT id, discount_amount, vat_rate, wht_rate FROM sales_docs")
+    ).fetchall()
+
+    update = sa.text(
+        "UPDATE sales_docs SET subtotal = :subtotal, vat_amount = :vat_amount, "
+        "wht_amount = :wht_amount, gross_total = :gross_total, grand_total = :grand_total "
+        "WHERE id = :id"
+    )
+    for doc_id, discount_amount, vat_rate, wht_rate in docs:
+        values = _compute(subtotals.get(doc_id), discount_amount, vat_rate, wht_rate)
+        conn.execute(update, {"id": doc_id, **values})
+
+    with op.batch_alter_table("sales_docs", schema=None) as batch_op:
+        for name in TOTAL_COLUMNS:
+            batch_op.alter_column(name, server_default=None)
+
+
+def downgrade():
+    with op.batch_alter_table("sales_docs", schema=None) as batch_op:
+        batch_op.drop_index("ix_sales_docs_type_status_issue_date")
+        for name in reversed(TOTAL_COLUMNS):
+            batch_op.drop_column(name)
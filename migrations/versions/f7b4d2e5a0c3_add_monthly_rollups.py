@@ -0,0 +1,114 @@
+"""add monthly rollups
+
+Revision ID: f7b4d2e5a0c3
+Revises: e6a3c1f4d9b2
+Create Date: 2026-10-17
+
+"""
+from datetime import date, datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "f7b4d2e5a0c3"
+down_revision = "e6a3c1f4d9b2"
+branch_labels = None
+depends_on = None
+
+
+# metric -> (table, วันที่ที่ใช้นับเดือน, ยอดเงินต่อแถว, เงื่อนไขเพิ่มเติม)
+# ต้องตรงกับ _monthly_rollup_sources() ใน app/models.py
+SOURCES = {
+    "materials": (
+        "material_items",
+        "created_at",
+        "unit_price * qty",
+        None,
+    ),
+    "subs": (
+        "subcontractor_payments",
+        "COALESCE(pay_date, created_at)",
+        "CASE WHEN contract_amount - withholding_amount > 0 "
+        "THEN contract_amount - withholding_amount ELSE 0 END",
+        None,
+    ),
+    "other": (
+        "other_expenses",
+        "COALESCE(expense_date, created_at)",
+        "amount",
+        None,
+    ),
+    "advances": (
+        "advance_expenses",
+        "COALESCE(advance_date, created_at)",
+        "amount",
+        None,
+    ),
+    "income": (
+        "sales_docs",
+        "issue_date",
+        "gross_total",
+        "doc_type = 'IV' AND status = 'APPROVED'",
+    ),
+}
+
+
+def upgrade():
+    op.create_table(
+        "monthly_rollups",
+        sa.Column("metric", sa.String(length=20), nullable=False),
+        sa.Column("period", sa.Date(), nullable=False),
+        sa.Column("total", sa.Numeric(precision=16, scale=2), nullable=False),
+        sa.Column("row_count", sa.Integer(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("metric", "period"),
+    )
+
+    # backfill: GROUP BY ปี/เดือน ของแต่ละ metric
+    conn = op.get_bind()
+    rollups = sa.table(
+        "monthly_rollups",
+        sa.column("metric", sa.String),
+        sa.column("period", sa.Date),
+        sa.column("total", sa.Numeric),
+        sa.column("row_count", sa.Integer),
+        sa.column("updated_at", sa.DateTime),
+    )
+    now = datetime.utcnow()
+
+    for metric, (table, month_date, amount, where) in SOURCES.items():
+        y = sa.func.extract("year", sa.literal_column(month_date))
+        m = sa.func.extract("month", sa.literal_column(month_date))
+        q = (
+            sa.select(
+                y.label("y"),
+                m.label("m"),
+                sa.func.coalesce(sa.func.sum(sa.literal_column(amount)), 0).label("total"),
+                sa.func.count().label("n"),
+            )
+            .select_from(sa.table(table))
+            .where(sa.literal_column(month_date).isnot(None))
+        )
+        if where:
+            q = q.where(sa.text(where))
+        rows = conn.execute(q.group_by(y, m)).fetchall()
+
+        values = [
+            {
+                "metric": metric,
+                "period": date(int(r.y), int(r.m), 1),
+                "total": r.total or 0,
+                "row_count": int(r.n or 0),
+                "updated_at": now,
+            }
+            for r in rows
+            if r.n
+        ]
+        if values:
+            conn.execute(rollups.insert(), values)
+
+
+def downgrade():
+    op.drop_table("monthly_rollups")
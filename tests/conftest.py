@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+import pytest
+
+from app import create_app, db
+
+
+@pytest.fixture()
+def app(monkeypatch, tmp_path):
+    monkeypatch.setenv("DATABASE_URL", "sqlite://")
+    monkeypatch.setenv("JOBS_RESULT_DIR", str(tmp_path / "jobs"))
+    monkeypatch.setenv("PDF_CACHE_DIR", str(tmp_path / "pdf"))
+    app = create_app()
+    app.config["TESTING"] = True
+    with app.app_context():
+        # index ชื่อซ้ำ (ประกาศทั้งใน column และ __table_args__) -> create_all บน SQLite พัง
+        for table in db.metadata.tables.values():
+            seen = set()
+            for ix in list(table.indexes):
+                if ix.name in seen:
+                    table.indexes.discard(ix)
+                seen.add(ix.name)
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture()
+def client(app):
+    return app.test_client()
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+from datetime import date
+
+from app import db
+from app.models import Project, SalesDoc, SalesItem, dashboard_aggregates
+
+YEAR = date.today().year
+
+
+def _create_project(client, code: str, start_date: str | None, materials=(), subs=(), expenses=(), advances=()) -> int:
+    r = client.post("/api/projects", json={
+        "code": code,
+        "name": "โครงการ " + code,
+        "start_date": start_date,
+        "materials": [{"item_name": n, "unit_price": p, "qty": q} for n, p, q in materials],
+        "subcontractors": [{"vendor_name": n, "contract_amount": a, "withholding_rate": w} for n, a, w in subs],
+        "expenses": [{"title": t, "amount": a, "category": c} for t, a, c in expenses],
+        "advances": [{"title": t, "amount": a} for t, a in advances],
+    })
+    assert r.status_code == 200, r.data
+    return r.json["id"]
+
+
+def _attach_qt(pid: int, doc_no: str, status: str, price: float) -> SalesDoc:
+    doc = SalesDoc(doc_no=doc_no, customer_name="ลูกค้า", status=status, vat_rate=7, wht_rate=3)
+    doc.items.append(SalesItem(description="งานตกแต่ง", qty=2, unit_price=price, discount_amount=10))
+    db.session.add(doc)
+    db.session.flush()
+    db.session.get(Project, pid).sales_doc_id = doc.id
+    db.session.commit()
+    return doc
+
+
+def _seed(client) -> dict:
+    ids = {
+        "a": _create_project(
+            client, "A", f"{YEAR}-03-01",
+            materials=[("ปูน", 150, 4), ("ทราย", 35.5, 2)],
+            subs=[("ช่างเอ", 1000, 3)],
+            expenses=[("น้ำมัน", 50, "fuel"), ("ค่าแรง", 300, "labor")],
+            advances=[("เบิก", 20)],
+        ),
+        "b": _create_project(
+            client, "B", f"{YEAR}-07-15",
+            materials=[("เหล็ก", 99.99, 3)],
+            subs=[("ช่างบี", 2500, 5)],
+            expenses=[("น้ำมัน", 75.25, "fuel")],
+        ),
+        # ไม่มี start_date -> นับปีจาก created_at
+        "c": _create_project(client, "C", None, materials=[("สี", 420, 1)], advances=[("เบิก", 60)]),
+        # ปีอื่น -> ไม่นับ
+        "d": _create_project(client, "D", f"{YEAR - 1}-12-31", materials=[("ไม้", 1000, 10)], subs=[("ช่างดี", 5000, 3)]),
+    }
+    _attach_qt(ids["a"], "QT-A", "APPROVED", 1500)
+    _attach_qt(ids["b"], "QT-B", "DRAFT", 9000)
+    _attach_qt(ids["d"], "QT-D", "APPROVED", 7000)
+    return ids
+
+
+def _baseline(year: int) -> dict:
+    """สูตรเดิมของ dashboard(): รวมจากรายการย่อยทีละโครงการใน Python"""
+    out = {"materials": 0.0, "subs": 0.0, "expenses": 0.0, "advances": 0.0, "income": 0.0}
+    for p in Project.query.all():
+        d = p.start_date or p.created_at.date()
+        if d.year != year:
+            continue
+        out["materials"] += sum(float(m.unit_price) * float(m.qty) for m in p.materials)
+        out["subs"] += sum(float(s.contract_amount) - float(s.withholding_amount) for s in p.subcontractors)
+        out["expenses"] += sum(float(e.amount) for e in p.expenses)
+        out["advances"] += sum(float(a.amount) for a in p.advances)
+        doc = db.session.get(SalesDoc, p.sales_doc_id) if p.sales_doc_id else None
+        if doc is not None and doc.status == "APPROVED":
+            out["income"] += float(doc.grand_total)
+    out["grand"] = out["materials"] + out["subs"] + out["expenses"] + out["advances"]
+    return out
+
+
+def test_aggregates_match_per_project_sums(client):
+    _seed(client)
+    expected = _baseline(YEAR)
+    agg = dashboard_aggregates(YEAR)
+
+    for key, value in expected.items():
+        assert round(agg[key], 2) == round(value, 2), key
+    assert round(agg["profit_loss"], 2) == round(expected["income"] - expected["grand"], 2)
+    assert agg["projects_by_status"] == {"IN_PROGRESS": 3}
+    assert {row["category"]: row["total"] for row in agg["other_by_category"]} == {"labor": 300, "fuel": 125.25}
+
+
+def test_month_filter_uses_start_date_then_created_at(client):
+    _seed(client)
+    this_month = date.today().month
+    # C ไม่มี start_date -> อยู่เดือนที่สร้าง (เดือนนี้)
+    assert dashboard_aggregates(YEAR, 3)["materials"] == 671 + (420 if this_month == 3 else 0)
+    assert dashboard_aggregates(YEAR, 7)["materials"] == 299.97 + (420 if this_month == 7 else 0)
+    assert dashboard_aggregates(YEAR, this_month)["advances"] == 60 + (20 if this_month == 3 else 0)
+    assert dashboard_aggregates(YEAR - 1)["income"] == float(SalesDoc.query.filter_by(doc_no="QT-D").one().grand_total)
+
+
+def test_dashboard_page_renders_aggregates(client):
+    _seed(client)
+    expected = _baseline(YEAR)
+    r = client.get(f"/dashboard?year={YEAR}")
+    assert r.status_code == 200
+    html = r.get_data(as_text=True)
+    assert "%.2f" % expected["grand"] in html
+    assert "%.2f" % expected["income"] in html
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+from datetime import date
+
+from app.blueprints.api import BULK_INSERT_MIN_ROWS
+from app.utils import dashboard_cache
+
+
+def test_bulk_project_save_clears_dashboard_cache(client):
+    year = date.today().year
+    key = f"{year}-all"
+    backend = dashboard_cache.get_backend()
+
+    assert client.get(f"/dashboard/expense?year={year}").status_code == 200
+    assert backend.get("expense", key, backend.version("expense")) is not None
+
+    # แถวใหม่ถึง BULK_INSERT_MIN_ROWS -> INSERT ด้วย Core (ไม่ผ่าน flush events)
+    materials = [{"item_name": f"m{i}", "unit_price": 10, "qty": 1} for i in range(BULK_INSERT_MIN_ROWS + 50)]
+    r = client.post("/api/projects", json={"code": "B1", "name": "bulk", "materials": materials})
+    assert r.status_code == 200, r.data
+
+    assert backend.get("expense", key, backend.version("expense")) is None
+
+
+def test_invalidation_during_compute_is_not_overwritten(app):
+    backend = dashboard_cache.get_backend()
+
+    def slow_compute():
+        # commit ระหว่าง compute -> ค่าที่กำลังคำนวณอาจเก่าแล้ว
+        dashboard_cache.invalidate(["expense"])
+        return {"total": "stale"}
+
+    assert dashboard_cache.get_or_compute("expense", 2026, None, slow_compute) == {"total": "stale"}
+    assert backend.get("expense", "2026-all", backend.version("expense")) is None
+
+    assert dashboard_cache.get_or_compute("expense", 2026, None, lambda: {"total": "fresh"}) == {"total": "fresh"}
+    assert dashboard_cache.get_or_compute("expense", 2026, None, lambda: {"total": "other"}) == {"total": "fresh"}
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+from app import db
+from app.models import Customer, OtherExpense
+
+
+def _payload(code: str, expenses: list) -> dict:
+    return {"code": code, "name": "โครงการ " + code, "expenses": expenses}
+
+
+def _create_project(client, code: str = "E1") -> int:
+    r = client.post("/api/projects", json=_payload(code, [{"title": "น้ำมัน", "amount": 50}, {"title": "ค่ารถ", "amount": 80}]))
+    assert r.status_code == 200, r.data
+    return r.json["id"]
+
+
+def _expenses(pid: int) -> list:
+    return [{"id": e.id, "title": e.title, "amount": float(e.amount)} for e in OtherExpense.query.filter_by(project_id=pid).order_by(OtherExpense.id)]
+
+
+def _get(client, url: str, etag: str | None = None):
+    headers = {"If-None-Match": etag} if etag else {}
+    return client.get(url, headers=headers)
+
+
+def test_project_etag_revalidates_with_304(client):
+    pid = _create_project(client)
+    r = _get(client, f"/api/projects/{pid}")
+    assert r.status_code == 200
+    etag = r.headers["ETag"]
+    assert not etag.startswith("W/")
+    assert r.headers["Last-Modified"]
+
+    r = _get(client, f"/api/projects/{pid}", etag)
+    assert r.status_code == 304
+    assert r.data == b""
+
+
+def test_unrelated_child_edit_keeps_etag(client):
+    pid = _create_project(client, "E1")
+    other = _create_project(client, "E2")
+    etag = _get(client, f"/api/projects/{pid}").headers["ETag"]
+
+    rows = _expenses(other)
+    rows[0]["amount"] = 999
+    assert client.put(f"/api/projects/{other}", json=_payload("E2", rows)).status_code == 200
+
+    assert _get(client, f"/api/projects/{pid}", etag).status_code == 304
+
+
+def test_own_child_edit_or_delete_changes_etag(client):
+    pid = _create_project(client, "E1")
+    etag = _get(client, f"/api/projects/{pid}").headers["ETag"]
+
+    rows = _expenses(pid)
+    rows[1]["amount"] = 81
+    assert client.put(f"/api/projects/{pid}", json=_payload("E1", rows)).status_code == 200
+    r = _get(client, f"/api/projects/{pid}", etag)
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag
+    etag = r.headers["ETag"]
+
+    # ลบรายการย่อย (ไม่มี updated_at ใหม่) -> ETag ต้องเปลี่ยน
+    assert client.put(f"/api/projects/{pid}", json=_payload("E1", rows[:1])).status_code == 200
+    r = _get(client, f"/api/projects/{pid}", etag)
+    assert r.status_code == 200
+    assert [e["title"] for e in r.json["expenses"]] == ["น้ำมัน"]
+
+
+def test_missing_project_is_404(client):
+    assert client.get("/api/projects/999").status_code == 404
+
+
+def test_customer_etag(client):
+    c = Customer(name="ลูกค้า ก")
+    db.session.add(c)
+    db.session.commit()
+
+    r = _get(client, f"/api/customers/{c.id}")
+    assert r.status_code == 200
+    etag = r.headers["ETag"]
+    assert _get(client, f"/api/customers/{c.id}", etag).status_code == 304
+
+    c.phone = "0812345678"
+    db.session.commit()
+    r = _get(client, f"/api/customers/{c.id}", etag)
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag
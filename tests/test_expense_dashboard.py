@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+from datetime import date
+
+from app.blueprints.pages import _expense_summary
+from app.models import AdvanceExpense, MaterialItem, OtherExpense, SubcontractorPayment
+
+YEAR = date.today().year
+
+
+def _seed(client) -> None:
+    r = client.post("/api/projects", json={
+        "code": "E1",
+        "name": "รายจ่าย",
+        "materials": [{"item_name": "ปูน", "unit_price": 150, "qty": 4}, {"item_name": "ทราย", "unit_price": 35.5, "qty": 2}],
+        "subcontractors": [
+            {"vendor_name": "ช่างเอ", "contract_amount": 1000, "withholding_rate": 3, "pay_date": f"{YEAR}-01-01"},
+            {"vendor_name": "ช่างบี", "contract_amount": 2000, "withholding_amount": 60, "pay_date": f"{YEAR}-12-31"},
+            # จ่ายจริงติดลบ -> นับ 0 แต่ยังนับจำนวนรายการ
+            {"vendor_name": "ช่างซี", "contract_amount": 100, "withholding_amount": 150, "pay_date": f"{YEAR}-06-15"},
+            {"vendor_name": "ปีก่อน", "contract_amount": 9999, "pay_date": f"{YEAR - 1}-12-31"},
+        ],
+        "expenses": [
+            {"title": "น้ำมัน", "amount": 50, "expense_date": f"{YEAR}-06-30"},
+            {"title": "ปีหน้า", "amount": 777, "expense_date": f"{YEAR + 1}-01-01"},
+            # ไม่มีวันที่ -> นับจาก created_at
+            {"title": "ไม่มีวันที่", "amount": 12.25},
+        ],
+        "advances": [{"title": "เบิก", "amount": 20, "advance_date": f"{YEAR}-02-28"}],
+    })
+    assert r.status_code == 200, r.data
+
+
+def _baseline(year: int) -> dict:
+    """สูตรเดิมของ dashboard_expense(): โหลดทุกแถวแล้วกรองปีใน Python"""
+    series = [0.0] * 12
+    counts = [0] * 12
+    totals = {"materials": 0.0, "subs": 0.0, "other": 0.0, "advances": 0.0}
+
+    def acc(key, dt, amount):
+        if dt.year != year:
+            return
+        series[dt.month - 1] += amount
+        counts[dt.month - 1] += 1
+        totals[key] += amount
+
+    for m in MaterialItem.query.all():
+        acc("materials", m.created_at, float(m.unit_price) * float(m.qty))
+    for s in SubcontractorPayment.query.all():
+        acc("subs", s.pay_date or s.created_at, max(0.0, float(s.contract_amount) - float(s.withholding_amount)))
+    for e in OtherExpense.query.all():
+        acc("other", e.expense_date or e.created_at, float(e.amount))
+    for a in AdvanceExpense.query.all():
+        acc("advances", a.advance_date or a.created_at, float(a.amount))
+
+    return {
+        "series": [round(v, 2) for v in series],
+        "counts": counts,
+        "total_expense": round(sum(totals.values()), 2),
+        "total_materials": round(totals["materials"], 2),
+        "total_subs": round(totals["subs"], 2),
+        "total_other": round(totals["other"], 2),
+        "total_advances": round(totals["advances"], 2),
+    }
+
+
+def test_expense_summary_matches_per_row_totals(client):
+    _seed(client)
+    expected = _baseline(YEAR)
+    assert _expense_summary(YEAR) == expected
+
+    # ขอบปี: 1 ม.ค. / 31 ธ.ค. อยู่ในปี, ปีก่อน/ปีหน้าไม่นับ
+    assert expected["counts"][0] >= 1 and expected["counts"][11] >= 1
+    assert expected["total_subs"] == 970 + 1940
+    assert _expense_summary(YEAR - 1)["total_subs"] == 9999
+    assert _expense_summary(YEAR + 1)["total_other"] == 777
+
+
+def test_expense_page_renders(client):
+    _seed(client)
+    r = client.get(f"/dashboard/expense?year={YEAR}")
+    assert r.status_code == 200
+    assert "{:,.2f}".format(_baseline(YEAR)["total_expense"]) in r.get_data(as_text=True)
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import os
+from io import BytesIO
+
+from pypdf import PdfReader
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from app.utils import pdf_fonts
+
+THAI_TEXT = "หนังสือรับรองการหักภาษี ณ ที่จ่าย ๑๒๓ 0123456789"
+FONT_PATH = os.path.join(os.path.dirname(pdf_fonts.__file__), "..", pdf_fonts.THAI_FONT_REL)
+
+
+def test_lean_font_keeps_metrics():
+    with open(FONT_PATH, "rb") as f:
+        raw = f.read()
+    lean = pdf_fonts.lean_ttf(raw)
+    assert len(lean) < len(raw)
+
+    original = TTFont("LeanTestOriginal", FONT_PATH).face
+    stripped = TTFont("LeanTestStripped", BytesIO(lean)).face
+    assert stripped.charWidths == original.charWidths
+    assert (stripped.ascent, stripped.descent, stripped.bbox) == (original.ascent, original.descent, original.bbox)
+
+
+def test_thai_text_renders_into_a_parseable_pdf():
+    font = pdf_fonts.thai_font()
+    assert font == pdf_fonts.THAI_FONT_NAME
+
+    buf = BytesIO()
+    c = canvas.Canvas(buf)
+    c.setFont(font, 16)
+    c.drawString(72, 720, THAI_TEXT)
+    c.showPage()
+    c.save()
+
+    page = PdfReader(BytesIO(buf.getvalue())).pages[0]
+    fonts = [f.get_object() for f in page["/Resources"]["/Font"].values()]
+    embedded = [
+        f["/DescendantFonts"][0].get_object()["/FontDescriptor"]["/FontFile2"].get_object().get_data()
+        if "/DescendantFonts" in f
+        else f["/FontDescriptor"]["/FontFile2"].get_object().get_data()
+        for f in fonts
+        if pdf_fonts.THAI_FONT_NAME in str(f["/BaseFont"])
+    ]
+    assert embedded and all(data[:4] in (b"\x00\x01\x00\x00", b"true") for data in embedded)
+    assert page.extract_text().split() == THAI_TEXT.split()
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+from app.models import OtherExpense, SubcontractorPayment
+
+
+def _create_project(client) -> int:
+    r = client.post("/api/projects", json={
+        "code": "P1",
+        "name": "โครงการทดสอบ",
+        "subcontractors": [{"vendor_name": "ช่างเอ", "contract_amount": 1000, "withholding_rate": 3}],
+        "expenses": [{"title": "ค่าน้ำมัน", "amount": 50, "category": "fuel"}],
+    })
+    assert r.status_code == 200, r.data
+    return r.json["id"]
+
+
+def _put(client, pid: int, **collections) -> None:
+    payload = {"code": "P1", "name": "โครงการทดสอบ", **collections}
+    r = client.put(f"/api/projects/{pid}", json=payload)
+    assert r.status_code == 200, r.data
+
+
+def test_partial_row_keeps_existing_values(client):
+    pid = _create_project(client)
+    expense = OtherExpense.query.filter_by(project_id=pid).one()
+
+    # ส่งมาแค่ id + note -> แถวเดิมต้องไม่ถูกมองเป็นแถวว่างแล้วโดนลบ
+    _put(client, pid, expenses=[{"id": expense.id, "note": "changed"}])
+
+    expense = OtherExpense.query.filter_by(project_id=pid).one()
+    assert expense.note == "changed"
+    assert expense.title == "ค่าน้ำมัน"
+    assert float(expense.amount) == 50
+
+
+def test_withholding_amount_recomputed_when_contract_changes(client):
+    pid = _create_project(client)
+    sub = SubcontractorPayment.query.filter_by(project_id=pid).one()
+    assert float(sub.withholding_amount) == 30
+
+    _put(client, pid, subcontractors=[{"id": sub.id, "contract_amount": 2000, "withholding_rate": 3}])
+
+    sub = SubcontractorPayment.query.filter_by(project_id=pid).one()
+    assert float(sub.contract_amount) == 2000
+    assert float(sub.withholding_amount) == 60
+
+    # ส่งแค่ note -> ยอดหักที่มีอยู่ไม่เปลี่ยน
+    _put(client, pid, subcontractors=[{"id": sub.id, "note": "จ่ายแล้ว"}])
+    sub = SubcontractorPayment.query.filter_by(project_id=pid).one()
+    assert float(sub.withholding_amount) == 60
+    assert sub.note == "จ่ายแล้ว"
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from app import db
+from app.models import Project
+
+
+def _create_project(client, code: str, status: str = "IN_PROGRESS", **children) -> int:
+    r = client.post("/api/projects", json={"code": code, "name": "โครงการ " + code, "status": status, **children})
+    assert r.status_code == 200, r.data
+    return r.json["id"]
+
+
+def _walk(client, query: str = "", limit: int = 2) -> list:
+    pages = []
+    cursor = None
+    while True:
+        url = f"/api/projects?limit={limit}{query}" + (f"&cursor={cursor}" if cursor else "")
+        r = client.get(url)
+        assert r.status_code == 200, r.data
+        pages.append([item["id"] for item in r.json["items"]])
+        cursor = r.json["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+def test_pages_do_not_skip_or_repeat_rows_with_equal_updated_at(client):
+    ids = [_create_project(client, f"L{i}") for i in range(7)]
+
+    # 5 โครงการ updated_at เท่ากันเป๊ะ (import ชุดเดียวกัน) -> ตัดหน้ากลางกลุ่มต้องใช้ id ต่อ
+    same = datetime(2026, 5, 1, 12, 0, 0)
+    t = Project.__table__
+    db.session.execute(t.update().where(t.c.id.in_(ids[:5])).values(updated_at=same))
+    db.session.execute(t.update().where(t.c.id == ids[5]).values(updated_at=datetime(2026, 6, 1)))
+    db.session.execute(t.update().where(t.c.id == ids[6]).values(updated_at=datetime(2026, 4, 1)))
+    db.session.commit()
+
+    pages = _walk(client, limit=2)
+    assert [len(p) for p in pages] == [2, 2, 2, 1]
+    assert sum(pages, []) == [ids[5], ids[4], ids[3], ids[2], ids[1], ids[0], ids[6]]
+
+    assert sum(_walk(client, limit=5), []) == sum(pages, [])
+    assert _walk(client, limit=7) == [sum(pages, [])]
+
+
+def test_fields_projection_and_totals(client):
+    pid = _create_project(
+        client, "F1",
+        materials=[{"item_name": "ปูน", "unit_price": 150, "qty": 4}],
+        subcontractors=[{"vendor_name": "ช่างเอ", "contract_amount": 1000, "withholding_rate": 3}],
+    )
+    r = client.get("/api/projects?fields=code,totals")
+    assert r.status_code == 200
+    assert r.json["items"] == [{
+        "id": pid,
+        "code": "F1",
+        "totals": {"materials": 600, "subcontractors": 970, "other": 0, "advances": 0, "grand": 1570},
+    }]
+
+    item = client.get("/api/projects").json["items"][0]
+    assert set(item) == {"id", "code", "name", "status", "totals"}
+
+
+def test_status_and_search_filters(client):
+    a = _create_project(client, "S-A", "DONE")
+    b = _create_project(client, "S-B", "IN_PROGRESS")
+    c = _create_project(client, "X-C", "DEFECT")
+
+    assert sum(_walk(client, "&status=done,defect"), []) == [c, a]
+    assert sum(_walk(client, "&q=S-"), []) == [b, a]
+    assert sum(_walk(client, "&q=X-&status=DEFECT"), []) == [c]
+
+
+def test_invalid_cursor_and_fields(client):
+    assert client.get("/api/projects?cursor=not-a-cursor").status_code == 400
+    r = client.get("/api/projects?fields=code,secret")
+    assert r.status_code == 400
+    assert "secret" in r.json["error"]
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.blueprints.api import _is_duplicate_project_code
+from app.models import ProjectCostRollup, refresh_project_cost_rollups
+
+
+def _create_project(client, code: str = "P1") -> int:
+    r = client.post("/api/projects", json={
+        "code": code,
+        "name": "โครงการ " + code,
+        "materials": [{"item_name": "ปูน", "unit_price": 150, "qty": 4}, {"item_name": "ทราย", "unit_price": 35.5, "qty": 2}],
+        "subcontractors": [{"vendor_name": "ช่างเอ", "contract_amount": 1000, "withholding_rate": 3}],
+        "expenses": [{"title": "ค่าน้ำมัน", "amount": 50}],
+        "advances": [{"title": "เบิก", "amount": 20}],
+    })
+    assert r.status_code == 200, r.data
+    return r.json["id"]
+
+
+def test_project_rollup_refresh_is_an_upsert(client):
+    pid = _create_project(client)
+
+    # แถวมีอยู่แล้ว -> refresh ซ้ำ (ทั้งรายโครงการและทั้งหมด) ต้องไม่ชน primary key
+    refresh_project_cost_rollups(db.session.connection(), [pid])
+    refresh_project_cost_rollups(db.session.connection())
+    db.session.commit()
+
+    r = db.session.get(ProjectCostRollup, pid)
+    assert float(r.materials_total) == 671
+    assert float(r.subs_payable_total) == 970
+    assert float(r.grand_total) == 671 + 970 + 50 + 20
+    assert r.materials_count == 2
+    assert ProjectCostRollup.query.count() == 1
+
+
+def test_duplicate_code_is_reported_as_duplicate(client):
+    _create_project(client, "DUP")
+    r = client.post("/api/projects", json={"code": "DUP", "name": "ซ้ำ"})
+    assert r.status_code == 400
+    assert "ซ้ำ" in r.json["error"]
+
+
+def test_other_integrity_errors_are_not_duplicate_code():
+    rollup_race = IntegrityError("INSERT", {}, Exception("UNIQUE constraint failed: project_cost_rollups.project_id"))
+    code = IntegrityError("INSERT", {}, Exception("UNIQUE constraint failed: projects.code"))
+    assert not _is_duplicate_project_code(rollup_race)
+    assert _is_duplicate_project_code(code)
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+from decimal import ROUND_HALF_UP, Decimal
+
+import pytest
+
+from app import db
+from app.models import SalesDoc, SalesItem
+
+
+def _d(v) -> Decimal:
+    return Decimal(str(v or 0))
+
+
+def _q2(v: Decimal) -> Decimal:
+    return v.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+def _baseline(doc: SalesDoc) -> dict:
+    """สูตรเดิม (property ต่อกันเป็นทอด ๆ) คำนวณตรงจาก items"""
+    zero = Decimal("0")
+    lines = sum((_d(i.qty) * _d(i.unit_price) - _d(i.discount_amount) for i in doc.items), zero)
+    subtotal = _q2(max(lines, zero))
+    discount = _q2(max(_d(doc.discount_amount), zero))
+    net_before_tax = _q2(max(subtotal - discount, zero))
+    wht = _q2(max(net_before_tax * _d(doc.wht_rate) / 100, zero))
+    net_after_wht = _q2(max(net_before_tax - wht, zero))
+    vat = _q2(max(net_after_wht * _d(doc.vat_rate) / 100, zero))
+    gross = _q2(max(net_after_wht + vat, zero))
+    return {
+        "subtotal": subtotal,
+        "discount_total": discount,
+        "net_before_tax": net_before_tax,
+        "wht_amount": wht,
+        "net_after_wht": net_after_wht,
+        "vat_amount": vat,
+        "gross_total": gross,
+        "grand_total": gross,
+    }
+
+
+def _doc(doc_no: str, items, discount=0, vat=7, wht=3) -> SalesDoc:
+    doc = SalesDoc(doc_no=doc_no, customer_name="ลูกค้า", discount_amount=discount, vat_rate=vat, wht_rate=wht)
+    for qty, price, disc in items:
+        doc.items.append(SalesItem(description="รายการ", qty=qty, unit_price=price, discount_amount=disc))
+    return doc
+
+
+def _assert_totals(doc: SalesDoc) -> None:
+    for name, value in _baseline(doc).items():
+        assert getattr(doc, name) == value, name
+
+
+@pytest.mark.parametrize("items, discount, vat, wht", [
+    ([(1, "100.00", 0)], 0, 7, 0),
+    ([(3, "33.33", "0.01"), (2, "1250.55", "15.00")], "20.00", 7, 3),
+    ([("1.5", "0.33", 0), ("2.25", "19.99", 0)], 0, "7.5", "1.5"),
+    # ส่วนลดเกินยอด -> 0 ไม่ติดลบ
+    ([(1, "50.00", "10.00")], "100.00", 7, 3),
+    ([], 0, 7, 3),
+])
+def test_totals_match_the_property_chain(app, items, discount, vat, wht):
+    doc = _doc("QT-T", items, discount, vat, wht)
+    _assert_totals(doc)
+
+    db.session.add(doc)
+    db.session.commit()
+    assert doc.stored_grand_total == doc.grand_total
+    assert doc.stored_vat_amount == doc.vat_amount
+    assert doc.stored_wht_amount == doc.wht_amount
+
+
+def test_cached_totals_follow_item_and_rate_changes(app):
+    doc = _doc("QT-C", [(2, "100.00", 0)])
+    db.session.add(doc)
+    db.session.commit()
+    _assert_totals(doc)
+
+    doc.items[0].qty = 5
+    _assert_totals(doc)
+
+    doc.items.append(SalesItem(description="เพิ่ม", qty=1, unit_price="999.99", discount_amount=0))
+    _assert_totals(doc)
+
+    doc.vat_rate = 10
+    doc.wht_rate = 0
+    doc.discount_amount = "50.00"
+    _assert_totals(doc)
+
+    doc.items.remove(doc.items[0])
+    _assert_totals(doc)
+
+    db.session.commit()
+    assert doc.stored_grand_total == _baseline(doc)["grand_total"]
+
+
+def test_item_added_by_doc_id_counts_in_stored_totals(app):
+    doc = _doc("QT-I", [(1, "100.00", 0)])
+    db.session.add(doc)
+    db.session.commit()
+
+    db.session.add(SalesItem(doc_id=doc.id, description="ผูกด้วย id", qty=1, unit_price="400.00", discount_amount=0))
+    db.session.commit()
+
+    db.session.expire_all()
+    doc = db.session.get(SalesDoc, doc.id)
+    assert doc.subtotal == Decimal("500.00")
+    assert doc.stored_grand_total == doc.grand_total == _baseline(doc)["grand_total"]
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+from app import db
+from app.blueprints.api import BULK_INSERT_MIN_ROWS
+from app.models import Project, current_change_token
+
+
+def _create_project(client, code: str = "S1", **extra) -> int:
+    r = client.post("/api/projects", json={"code": code, "name": "โครงการทดสอบ", **extra})
+    assert r.status_code == 200, r.data
+    return r.json["id"]
+
+
+def _sync(client, since: int) -> dict:
+    r = client.get(f"/api/sync?since={since}")
+    assert r.status_code == 200, r.data
+    return r.json
+
+
+def test_change_committed_after_a_newer_cursor_is_still_synced(client):
+    pid = _create_project(client)
+    before = client.get("/api/sync").json["token"]
+
+    # transaction ที่ flush แล้วแต่ยังค้างอยู่: ยังไม่ได้ token
+    # (client อื่น sync ระหว่างนี้แล้วได้ cursor = token ปัจจุบัน)
+    project = db.session.get(Project, pid)
+    project.name = "แก้ทีหลัง"
+    db.session.flush()
+    cursor = current_change_token()
+    assert cursor == before
+
+    db.session.commit()
+
+    data = _sync(client, cursor)
+    assert data["token"] > cursor
+    assert [row["name"] for row in data["changes"]["projects"]["upserted"]] == ["แก้ทีหลัง"]
+
+
+def test_rolled_back_changes_are_not_logged(client):
+    pid = _create_project(client)
+    token = client.get("/api/sync").json["token"]
+
+    project = db.session.get(Project, pid)
+    project.name = "ไม่ได้บันทึก"
+    db.session.flush()
+    db.session.rollback()
+
+    other = _create_project(client, "S2")
+    data = _sync(client, token)
+    assert [row["id"] for row in data["changes"]["projects"]["upserted"]] == [other]
+
+
+def test_bulk_insert_is_logged_on_commit(client):
+    materials = [{"item_name": f"m{i}", "unit_price": 10, "qty": 1} for i in range(BULK_INSERT_MIN_ROWS + 5)]
+    pid = _create_project(client, "S3", materials=materials)
+
+    changes = _sync(client, 0)["changes"]
+    assert [row["id"] for row in changes["projects"]["upserted"]] == [pid]
+    assert len(changes["materials"]["upserted"]) == len(materials)
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+from datetime import date
+
+from app import db
+from app.models import MonthlyRollup, OtherExpense
+
+
+def _create_project(client, expenses: list) -> int:
+    r = client.post("/api/projects", json={"code": "P1", "name": "โครงการทดสอบ", "expenses": expenses})
+    assert r.status_code == 200, r.data
+    return r.json["id"]
+
+
+def _other_by_month(client) -> dict:
+    r = client.get("/api/reports/timeseries?metric=other&from=2026-01&to=2026-03")
+    assert r.status_code == 200
+    return {pt["period"]: (pt["total"], pt["count"]) for pt in r.json["points"]}
+
+
+def test_same_month_writes_update_the_rollup_row(client):
+    pid = _create_project(client, [{"title": "a", "amount": 100, "expense_date": "2026-01-10"}])
+    db.session.add(OtherExpense(project_id=pid, title="b", amount=50, expense_date=date(2026, 1, 20)))
+    db.session.commit()
+
+    assert _other_by_month(client)["2026-01"] == (150.0, 2)
+    assert MonthlyRollup.query.filter_by(metric="other").count() == 1
+
+
+def test_moving_expense_to_another_month_moves_the_total(client):
+    _create_project(client, [{"title": "a", "amount": 100, "expense_date": "2026-01-10"}])
+    expense = OtherExpense.query.one()
+
+    # หลัง commit object ถูก expire -> _keep_old_month (active_history) ต้องยังรู้เดือนเดิม
+    db.session.commit()
+    expense.expense_date = expense.expense_date.replace(month=2)
+    db.session.commit()
+
+    months = _other_by_month(client)
+    assert months["2026-01"] == (0.0, 0)
+    assert months["2026-02"] == (100.0, 1)
+    # เดือนที่ไม่เหลือรายการ -> ไม่เหลือแถวใน monthly_rollups
+    assert [r.period.month for r in MonthlyRollup.query.filter_by(metric="other")] == [2]
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+from datetime import date
+
+import pytest
+
+from app import db
+from app.models import Project, SalesDoc, SalesItem, ranked_projects
+
+YEAR = date.today().year
+
+
+def _create_project(client, code: str, material: float, sub: float, start_date: str) -> int:
+    r = client.post("/api/projects", json={
+        "code": code,
+        "name": "โครงการ " + code,
+        "start_date": start_date,
+        "materials": [{"item_name": "วัสดุ", "unit_price": material, "qty": 1}] if material else [],
+        "subcontractors": [{"vendor_name": "ช่าง", "contract_amount": sub, "withholding_rate": 3}] if sub else [],
+    })
+    assert r.status_code == 200, r.data
+    return r.json["id"]
+
+
+def _seed(client) -> None:
+    specs = [
+        # code, วัสดุ, ผู้รับเหมา, QT (None = ไม่มี), สถานะ QT
+        ("R1", 500, 0, 2000, "APPROVED"),
+        ("R2", 0, 3000, 2500, "APPROVED"),
+        ("R3", 1200, 800, None, None),
+        ("R4", 500, 0, 9000, "DRAFT"),  # QT ยังไม่อนุมัติ -> รายรับ 0
+        ("R5", 2500, 100, 8000, "APPROVED"),
+        ("R6", 0, 0, None, None),
+        ("R7", 500, 0, 2000, "APPROVED"),  # เท่ากับ R1 ทุกค่า -> เรียงตาม id
+    ]
+    for n, (code, material, sub, qt, status) in enumerate(specs):
+        pid = _create_project(client, code, material, sub, f"{YEAR}-{n % 12 + 1:02d}-10")
+        if qt is not None:
+            doc = SalesDoc(doc_no=f"QT-{code}", customer_name="ลูกค้า", status=status, vat_rate=7, wht_rate=0)
+            doc.items.append(SalesItem(description="งาน", qty=1, unit_price=qt, discount_amount=0))
+            db.session.add(doc)
+            db.session.flush()
+            db.session.get(Project, pid).sales_doc_id = doc.id
+    db.session.commit()
+    # ปีอื่น -> ไม่อยู่ในอันดับของปีนี้
+    _create_project(client, "OLD", 99999, 0, f"{YEAR - 1}-05-05")
+
+
+def _baseline(year: int) -> list:
+    """สูตรเดิม: คำนวณทุกโครงการใน Python แล้ว sort"""
+    rows = []
+    for p in Project.query.order_by(Project.id).all():
+        if (p.start_date or p.created_at.date()).year != year:
+            continue
+        materials = sum(float(m.unit_price) * float(m.qty) for m in p.materials)
+        subs = sum(float(s.contract_amount) - float(s.withholding_amount) for s in p.subcontractors)
+        total = materials + subs
+        doc = db.session.get(SalesDoc, p.sales_doc_id) if p.sales_doc_id else None
+        income = float(doc.grand_total) if doc is not None and doc.status == "APPROVED" else 0.0
+        rows.append({"code": p.code, "total": total, "materials": materials, "subs": subs, "margin": income - total})
+    return rows
+
+
+@pytest.mark.parametrize("by", ["total", "materials", "subs", "margin"])
+@pytest.mark.parametrize("ascending", [False, True])
+def test_ranking_matches_sorting_every_project(client, by, ascending):
+    _seed(client)
+    rows = _baseline(YEAR)
+    # sort เสถียร: ค่าเท่ากันคงลำดับ id
+    expected = sorted(rows, key=lambda r: r[by] if ascending else -r[by])[:5]
+
+    got = ranked_projects(by, YEAR, limit=5, ascending=ascending)
+    assert [r["code"] for r in got] == [r["code"] for r in expected]
+    assert [round(r[by], 2) for r in got] == [round(r[by], 2) for r in expected]
+
+
+def test_top_projects_api(client):
+    _seed(client)
+    r = client.get(f"/api/reports/top-projects?by=margin&year={YEAR}&limit=2")
+    assert r.status_code == 200
+    assert [row["code"] for row in r.json["items"]] == ["R5", "R1"]
+    assert r.json["items"][0]["income"] == 8560
+
+    r = client.get(f"/api/reports/top-projects?by=total&year={YEAR}&month=3")
+    assert [row["code"] for row in r.json["items"]] == ["R3"]
+
+    assert client.get("/api/reports/top-projects?by=profit").status_code == 400
+    assert client.get("/api/reports/top-projects?order=up").status_code == 400
+    assert client.get("/api/reports/top-projects?month=13").status_code == 400
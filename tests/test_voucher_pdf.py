@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+from io import BytesIO
+
+from pypdf import PdfReader
+from reportlab import rl_config
+
+from app.utils import voucher_pdf
+
+
+def _snapshots(n: int) -> list:
+    return [
+        {"doc_type": "PV", "doc_no": f"PV-{i:03d}", "date": "2026-01-15", "title": f"ค่าวัสดุ {i}", "amount": "1000.00"}
+        for i in range(n)
+    ]
+
+
+def _image_count(data: bytes) -> int:
+    # PdfWriter เขียน object แยกทีละตัว (ไม่ใช้ object stream) -> นับจาก dict ได้ตรง ๆ
+    return data.count(b"/Subtype /Image")
+
+
+def test_in_process_batch_keeps_global_stream_encoding():
+    before = rl_config.useA85
+    buf = BytesIO()
+    assert voucher_pdf.render_vouchers_batch(_snapshots(4), buf, workers=1) == 4
+    assert rl_config.useA85 == before
+    assert len(PdfReader(BytesIO(buf.getvalue())).pages) == 4
+
+
+def test_merged_chunks_share_logo_and_signature_images(monkeypatch):
+    snapshots = _snapshots(4)
+    buf = BytesIO()
+    voucher_pdf.render_vouchers_batch(snapshots, buf, workers=1)
+    single = buf.getvalue()
+
+    # เหมือน pool: ใบละก้อน แต่ละก้อนฝังรูปชุดของตัวเอง
+    def per_voucher(snaps, workers):
+        for snap in snaps:
+            yield 1, voucher_pdf.render_vouchers_chunk([snap])
+
+    monkeypatch.setattr(voucher_pdf, "_render_all", per_voucher)
+    buf = BytesIO()
+    voucher_pdf.render_vouchers_batch(snapshots, buf, workers=1)
+    merged = buf.getvalue()
+
+    assert len(PdfReader(BytesIO(merged)).pages) == 4
+    assert _image_count(merged) == _image_count(single)
+    assert len(merged) < len(single) * 1.2
+
+
+def test_in_process_batch_writes_binary_streams():
+    buf = BytesIO()
+    voucher_pdf.render_vouchers_batch(_snapshots(4), buf, workers=1)
+    data = buf.getvalue()
+    assert b"/ASCII85Decode" not in data
+
+    page = PdfReader(BytesIO(data)).pages[0]
+    assert "PV-000" in page.extract_text()
+    assert all(image.data for image in page.images)
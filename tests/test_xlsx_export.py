@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+from datetime import date
+from io import BytesIO
+
+from openpyxl import load_workbook
+
+from app.models import Project
+
+YEAR = date.today().year
+
+
+def _create_project(client, code: str, start_date: str | None, **children) -> int:
+    r = client.post("/api/projects", json={"code": code, "name": "โครงการ " + code, "start_date": start_date, **children})
+    assert r.status_code == 200, r.data
+    return r.json["id"]
+
+
+def _seed(client) -> None:
+    _create_project(
+        client, "X1", f"{YEAR}-02-01",
+        materials=[{"item_name": "ปูน", "unit_price": 150, "qty": 4, "tax_invoice_no": "INV-1", "tax_invoice_date": f"{YEAR}-02-03"}],
+        subcontractors=[{"vendor_name": "ช่างเอ", "contract_amount": 1000, "withholding_rate": 3, "pay_date": f"{YEAR}-02-20"}],
+        expenses=[{"title": "น้ำมัน", "amount": 50, "category": "fuel", "expense_date": f"{YEAR}-02-05"}],
+        advances=[{"title": "เบิก", "amount": 20, "advance_date": f"{YEAR}-02-06"}],
+    )
+    _create_project(
+        client, "X2", f"{YEAR}-05-01",
+        materials=[{"item_name": "ทราย", "unit_price": 35.5, "qty": 2}],
+        expenses=[{"title": "ค่ารถ", "amount": 75.25, "expense_date": f"{YEAR}-05-09"}],
+    )
+    _create_project(client, "X3", None, advances=[{"title": "เบิก", "amount": 60, "advance_date": f"{YEAR - 1}-12-30"}])
+    _create_project(client, "OLD", f"{YEAR - 1}-01-01", materials=[{"item_name": "ไม้", "unit_price": 1000, "qty": 1}])
+
+
+def _sheet_rows(data: bytes, title: str) -> list:
+    ws = load_workbook(BytesIO(data))[title]
+    return [list(row) for row in ws.iter_rows(values_only=True)]
+
+
+def _dashboard_baseline(year: int, month: int | None = None) -> list:
+    """export เดิม: ทุกโครงการในช่วง + ยอดจากรายการย่อย"""
+    rows = []
+    for p in Project.query.order_by(Project.id).all():
+        d = p.start_date or p.created_at.date()
+        if d.year != year or (month and d.month != month):
+            continue
+        m = sum(float(i.unit_price) * float(i.qty) for i in p.materials)
+        s = sum(float(i.contract_amount) - float(i.withholding_amount) for i in p.subcontractors)
+        e = sum(float(i.amount) for i in p.expenses)
+        a = sum(float(i.amount) for i in p.advances)
+        rows.append([p.code, p.name, m, s, e, a, m + s + e + a])
+    return rows
+
+
+def test_dashboard_export_matches_per_project_totals(client):
+    _seed(client)
+    r = client.get(f"/dashboard/export.xlsx?year={YEAR}")
+    assert r.status_code == 200
+    assert r.is_streamed
+    assert f"dashboard_{YEAR}_all.xlsx" in r.headers["Content-Disposition"]
+
+    rows = _sheet_rows(r.get_data(), "Dashboard")
+    assert rows[0] == ["รหัส", "ชื่อโครงการ", "ค่าวัสดุ", "ผู้รับเหมาช่วง", "อื่นๆ", "เงินเบิกล่วงหน้า", "รวม"]
+    assert rows[1:] == _dashboard_baseline(YEAR)
+    assert [row[0] for row in rows[1:]] == ["X1", "X2", "X3"]
+
+    rows = _sheet_rows(client.get(f"/dashboard/export.xlsx?year={YEAR}&month=2").get_data(), "Dashboard")
+    assert rows[1:] == _dashboard_baseline(YEAR, 2)
+
+
+def test_dashboard_export_header_uses_named_style(client):
+    _seed(client)
+    ws = load_workbook(BytesIO(client.get(f"/dashboard/export.xlsx?year={YEAR}").get_data()))["Dashboard"]
+    assert ws["A1"].style == "xl_header"
+    assert ws["A1"].font.bold
+    assert ws["C2"].style == "xl_body"
+
+
+def test_ledger_export_has_one_sheet_per_ledger(client):
+    _seed(client)
+    r = client.get("/projects/export-all.xlsx")
+    assert r.status_code == 200
+    assert r.is_streamed
+    wb = load_workbook(BytesIO(r.get_data()))
+    assert wb.sheetnames == ["Projects", "Materials", "Subcontractors", "Other expenses", "Advances"]
+
+    projects = [list(row) for row in wb["Projects"].iter_rows(min_row=2, values_only=True)]
+    assert [row[0] for row in projects] == ["X1", "X2", "X3", "OLD"]
+    x1 = projects[0]
+    assert x1[8:] == [600, 970, 50, 20, 1640]
+
+    materials = [list(row) for row in wb["Materials"].iter_rows(min_row=2, values_only=True)]
+    assert materials[0][:10] == ["X1", None, None, "ปูน", None, "INV-1", f"{YEAR}-02-03", 150, 4, 600]
+    assert len(materials) == 3
+
+    subs = [list(row) for row in wb["Subcontractors"].iter_rows(min_row=2, values_only=True)]
+    assert subs == [["X1", "ช่างเอ", f"{YEAR}-02-20", 1000, 3, 30, 970, None]]
+
+
+def test_ledger_export_filters_by_date_range(client):
+    _seed(client)
+    data = client.get(f"/projects/export-all.xlsx?from={YEAR}-02-01&to={YEAR}-02-28").get_data()
+
+    codes = [row[0] for row in _sheet_rows(data, "Projects")[1:]]
+    assert codes[0] == "X1" and "X2" not in codes and "OLD" not in codes
+    assert [row[2] for row in _sheet_rows(data, "Other expenses")[1:]] == ["น้ำมัน"]
+    assert [row[1] for row in _sheet_rows(data, "Advances")[1:]] == ["เบิก"]
+
+    # วันที่จริงของรายการ (ไม่ใช่ created_at) ใช้กรอง: เบิกของ X3 อยู่ปีก่อน
+    data = client.get(f"/projects/export-all.xlsx?from={YEAR - 1}-12-01&to={YEAR - 1}-12-31").get_data()
+    assert [row[0] for row in _sheet_rows(data, "Advances")[1:]] == ["X3"]
+    assert _sheet_rows(data, "Materials")[1:] == []
+
+    # วัสดุไม่มีวันที่ของรายการ -> กรองด้วย created_at (เหมือน dashboard รายจ่าย)
+    today = date.today().isoformat()
+    data = client.get(f"/projects/export-all.xlsx?from={today}&to={today}").get_data()
+    assert [row[3] for row in _sheet_rows(data, "Materials")[1:]] == ["ปูน", "ทราย", "ไม้"]